@@ -7,37 +7,76 @@ Tests the agent without requiring other agents to be running
 import sys
 import os
 import math
+from array import array
+from collections import Counter
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from operation_registry import OperationRegistry
 
 class StandaloneStatisticsAgent:
     """Standalone version of statistics agent for testing"""
     
     def __init__(self):
         self.agent_id = "statistics_agent"
+        self.operations = self._register_operations()
+        self.fallback_operations = self._register_fallback_operations()
         print(f"📊 Standalone Statistics Agent initialized")
     
+    def _register_operations(self):
+        """Statistics operations exposed by this agent"""
+        numbers = (("numbers", "list", []),)
+        ops = OperationRegistry()
+        ops.register("mean", self.mean, numbers, "linear", description="Arithmetic mean",
+                     aggregate=StreamingStatistics.factory("mean"))
+        ops.register("median", self.median, numbers, "nlogn", description="Middle value",
+                     aggregate=StreamingStatistics.factory("median"), cacheable=True)
+        ops.register("mode", self.mode, numbers, "linear", description="Most frequent value",
+                     aggregate=StreamingStatistics.factory("mode"))
+        ops.register("standard_deviation", self.standard_deviation, numbers, "linear", description="Population standard deviation",
+                     aggregate=StreamingStatistics.factory("standard_deviation"))
+        ops.register("range", self.range_calc, numbers, "linear", description="Maximum minus minimum",
+                     aggregate=StreamingStatistics.factory("range"))
+        ops.register("summary", self.summary_stats, numbers, "nlogn", description="All basic statistics",
+                     aggregate=StreamingStatistics.factory("summary"), cacheable=True)
+        return ops
+    
+    def _register_fallback_operations(self):
+        """Calculator operations available locally; handlers return None when the input is unsupported"""
+        numbers = (("numbers", "list", []),)
+        ops = OperationRegistry()
+        ops.register("add", self._local_add, numbers, "linear")
+        ops.register("subtract", self._local_subtract, numbers, "constant")
+        ops.register("divide", self._local_divide, numbers, "constant")
+        ops.register("power", self._local_power, (("base", "number", 0), ("exponent", "number", 0)), "bigint")
+        ops.register("square_root", self._local_sqrt, (("number", "number", 0),), "constant")
+        return ops
+    
+    def _local_add(self, numbers):
+        return {"success": True, "result": sum(numbers), "operation": "local_add"}
+    
+    def _local_subtract(self, numbers):
+        if len(numbers) == 2:
+            return {"success": True, "result": numbers[0] - numbers[1], "operation": "local_subtract"}
+    
+    def _local_divide(self, numbers):
+        if len(numbers) == 2 and numbers[1] != 0:
+            return {"success": True, "result": numbers[0] / numbers[1], "operation": "local_divide"}
+    
+    def _local_power(self, base, exp):
+        return {"success": True, "result": base ** exp, "operation": "local_power"}
+    
+    def _local_sqrt(self, num):
+        if num >= 0:
+            return {"success": True, "result": math.sqrt(num), "operation": "local_sqrt"}
+    
     def local_calculator_fallback(self, operation, data):
         """Local fallback calculations when other agents are not available"""
-        if operation == "add":
-            numbers = data.get("numbers", [])
-            return {"success": True, "result": sum(numbers), "operation": "local_add"}
-        elif operation == "divide" and len(data.get("numbers", [])) == 2:
-            nums = data["numbers"]
-            if nums[1] != 0:
-                return {"success": True, "result": nums[0] / nums[1], "operation": "local_divide"}
-        elif operation == "power":
-            base = data.get("base", 0)
-            exp = data.get("exponent", 0)
-            return {"success": True, "result": base ** exp, "operation": "local_power"}
-        elif operation == "square_root":
-            num = data.get("number", 0)
-            if num >= 0:
-                return {"success": True, "result": math.sqrt(num), "operation": "local_sqrt"}
-        elif operation == "subtract" and len(data.get("numbers", [])) == 2:
-            nums = data["numbers"]
-            return {"success": True, "result": nums[0] - nums[1], "operation": "local_subtract"}
-        
-        return {"success": False, "error": f"Operation {operation} not supported in fallback"}
+        entry = self.fallback_operations.get(operation)
+        result = entry.call(data) if entry is not None else None
+        if result is None:
+            return {"success": False, "error": f"Operation {operation} not supported in fallback"}
+        return result
     
     def mean(self, numbers):
         """Calculate arithmetic mean (average)"""
@@ -234,24 +273,109 @@ class StandaloneStatisticsAgent:
         except Exception as e:
             return {"success": False, "error": f"Summary statistics calculation failed: {str(e)}"}
     
-    def process_request(self, operation, data):
+    def process_request(self, operation, data, coalescer=None):
         """Process statistics requests"""
-        numbers = data.get("numbers", [])
-        
-        if operation == "mean":
-            return self.mean(numbers)
-        elif operation == "median":
-            return self.median(numbers)
-        elif operation == "mode":
-            return self.mode(numbers)
-        elif operation == "standard_deviation":
-            return self.standard_deviation(numbers)
-        elif operation == "range":
-            return self.range_calc(numbers)
-        elif operation == "summary":
-            return self.summary_stats(numbers)
-        else:
-            return {"success": False, "error": f"Unknown operation: {operation}"}
+        return self.operations.dispatch(operation, data, coalescer)
+
+class StreamingStatistics:
+    """Statistics over a stream of chunks, answering with the same fields and errors as the list
+    handlers. Count, mean, standard deviation and range take constant memory (chunk moments merged
+    with Chan's formula); median keeps the values as packed doubles and mode keeps a frequency
+    table, and summary needs both"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.values = array('d') if operation in ("median", "summary") else None
+        self.frequency = Counter() if operation in ("mode", "summary") else None
+        # Only what the operation reports is tracked; the second moment and extremes each cost a pass
+        self.spread = operation in ("standard_deviation", "summary")
+        self.extremes = operation in ("range", "summary")
+
+    @classmethod
+    def factory(cls, operation):
+        return lambda data: cls(operation)
+
+    def update(self, values):
+        n = len(values)
+        if not n:
+            return
+        chunk_total = math.fsum(values)
+        chunk_mean = chunk_total / n
+        combined = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / combined
+        if self.spread:
+            chunk_m2 = math.fsum((v - chunk_mean) ** 2 for v in values)
+            self.m2 += chunk_m2 + delta * delta * self.count * n / combined
+        self.count = combined
+        self.total += chunk_total
+        if self.extremes:
+            low, high = min(values), max(values)
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        if self.values is not None:
+            if isinstance(values, memoryview) and values.format == 'd':
+                with values.cast('B') as raw:
+                    self.values.frombytes(raw)
+            else:
+                self.values.extend(float(v) for v in values)
+        if self.frequency is not None:
+            self.frequency.update(values)
+
+    def _median(self, ordered):
+        mid = self.count // 2
+        return ordered[mid] if self.count % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+    def _modes(self):
+        top = max(self.frequency.values())
+        return [v for v, n in self.frequency.items() if n == top], top
+
+    def result(self):
+        op = self.operation
+        if op == "standard_deviation" and self.count < 2:
+            return {"success": False, "error": "Need at least 2 numbers for standard deviation"}
+        if not self.count:
+            return {"success": False, "error": "No numbers provided"}
+        std_dev = math.sqrt(self.m2 / self.count)
+        if op == "mean":
+            return {"success": True, "result": self.total / self.count, "operation": "mean", "count": self.count,
+                    "sum": self.total}
+        if op == "median":
+            ordered = sorted(self.values)
+            return {"success": True, "result": self._median(ordered), "operation": "median", "count": self.count,
+                    "sorted_values": ordered}
+        if op == "mode":
+            modes, top = self._modes()
+            return {"success": True, "result": modes[0] if len(modes) == 1 else modes, "operation": "mode",
+                    "frequency": top, "all_modes": modes, "frequency_table": dict(self.frequency)}
+        if op == "standard_deviation":
+            return {"success": True, "result": std_dev, "operation": "standard_deviation",
+                    "variance": self.m2 / self.count, "mean": self.total / self.count, "count": self.count}
+        if op == "range":
+            return {"success": True, "result": self.maximum - self.minimum, "operation": "range",
+                    "maximum": self.maximum, "minimum": self.minimum}
+        modes, _ = self._modes()
+        return {
+            "success": True,
+            "operation": "summary_statistics",
+            "data": {
+                "count": self.count,
+                "mean": self.total / self.count,
+                "median": self._median(sorted(self.values)),
+                "mode": modes[0] if len(modes) == 1 else modes,
+                "standard_deviation": std_dev if self.count >= 2 else "N/A",
+                "range": self.maximum - self.minimum,
+                "minimum": self.minimum,
+                "maximum": self.maximum
+            },
+            "input_data": self.values.tolist()
+        }
 
 def test_statistics_agent():
     """Test the statistics agent locally without network dependencies"""
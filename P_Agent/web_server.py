@@ -10,10 +10,28 @@ import sys
 import socket
 from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 from flask_cors import CORS
 from statistics_agent import StandaloneStatisticsAgent
+from single_flight import SingleFlight
+import hop_timing
+import deadline
+import operation_registry
+import wire
+import local_transport
+import shared_array
+import stream_chain
+from stream_chain import StreamHop
+import rate_limit
+from rate_limit import RateLimiter
+import admission
+from admission import AdmissionController
+from agent_metrics import AgentMetrics
+import agent_logging
+from agent_logging import StructuredLogger
+from agent_store import AgentStore, ResultCache
 from dotenv import load_dotenv
 import requests
 import json
@@ -24,6 +42,7 @@ load_dotenv()
 # Create Flask app
 app = Flask(__name__, template_folder='templates')
 CORS(app)
+wire.install(app)
 
 # Initialize the statistics agent with network configuration
 class NetworkStatisticsAgent(StandaloneStatisticsAgent):
@@ -55,6 +74,25 @@ class NetworkStatisticsAgent(StandaloneStatisticsAgent):
 
 # Initialize the network-ready statistics agent
 stats_agent = NetworkStatisticsAgent()
+coalescer = SingleFlight()
+hop_timing.install(app, f"{stats_agent.agent_id}@{stats_agent.my_ip}:{stats_agent.port}")
+deadline.install(app)
+metrics = AgentMetrics(stats_agent.agent_id)
+metrics.instrument(app, stats_agent.operations)
+operation_registry.install(app, stats_agent.operations)
+rate_limiter = rate_limit.install(app, RateLimiter.from_env(metrics))
+admission_control = admission.install(app, AdmissionController.from_env(metrics))
+metrics.register_collector("a2a_coalesced_requests_total", "counter", "Requests that shared another request's in-flight result",
+                           lambda: coalescer.stats()["coalesced"])
+log = agent_logging.install(app, StructuredLogger.from_env(stats_agent.agent_id))
+metrics.register_collector("a2a_log_records_total", "counter", "Structured log records by outcome",
+                           lambda: {(("state", k),): v for k, v in log.stats().items() if k != "queued"})
+store = AgentStore.from_env(stats_agent.agent_id)
+stats_agent.operations.cache = result_cache = ResultCache.from_env(store)
+# Statistics operations reduce a stream, so this agent is always its last hop and needs no client
+stream_hop = stream_chain.install(app, StreamHop.from_env(stats_agent.agent_id, stats_agent.operations))
+metrics.register_collector("a2a_result_cache_total", "counter", "Result cache lookups by outcome",
+                           lambda: {(("outcome", "hit"),): result_cache.hits, (("outcome", "miss"),): result_cache.misses})
 
 @app.route('/')
 def index():
@@ -73,9 +111,30 @@ def health():
         "connected_agents": {
             "calculator": stats_agent.calculator_url,
             "unit_converter": stats_agent.unit_converter_url
-        }
+        },
+        "coalescing": coalescer.stats(),
+        "admission": admission_control.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "result_cache": result_cache.stats(),
+        "store": store.stats(),
+        "streams": stream_hop.stats(),
+        "shared_memory": shared_array.stats()
     })
 
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    """Operations supported by this agent, generated from its registry"""
+    return jsonify({
+        "agent": "statistics_agent",
+        "operations": stats_agent.operations.capabilities(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition for this agent (all worker processes)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/stats', methods=['POST'])
 def calculate_stats():
     """Calculate statistics via API"""
@@ -84,9 +143,8 @@ def calculate_stats():
         operation = data.get('operation')
         request_data = data.get('data', {})
         
-        print(f"📊 Web request: {operation} with {request_data}")
-        
-        result = stats_agent.process_request(operation, request_data)
+        result = stats_agent.process_request(operation, request_data, coalescer)
+        log.info("stats.success" if result.get('success') else "stats.failure", operation=operation)
         
         return jsonify({
             "agent": "statistics_agent",
@@ -100,21 +158,74 @@ def calculate_stats():
             "error": f"Request processing failed: {str(e)}"
         }), 400
 
+MESSAGE_BATCH_MAX = int(os.getenv('MESSAGE_BATCH_MAX', 1000))
+
+def _message_batch(incoming, timer, client_ip):
+    """Answer a batched /message: {"batch": [envelopes]} -> {"batch": [results]}, in order"""
+    items = incoming['batch']
+    if len(items) > MESSAGE_BATCH_MAX:
+        return jsonify({"agent": "statistics_agent", "error": f"Batch too large: {len(items)} > {MESSAGE_BATCH_MAX}"}), 413
+    if deadline.expired():
+        return jsonify({
+            "agent": "statistics_agent",
+            "error": "Deadline exceeded",
+            "steps": [deadline.aborted_step(stats_agent.agent_id, "batch", "compute")],
+            "timing": hop_timing.timing_tree(timer),
+            "timestamp": datetime.now().isoformat()
+        }), 504
+    results = []
+    with timer.phase("compute_ms"):
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            message = item.get('message') or {}
+            result = stats_agent.process_request(message.get('operation'), message.get('data', {}), coalescer)
+            results.append({"correlation_id": item.get('correlation_id'), "response": result})
+    log.info("message.batch", sender=incoming.get('sender', 'unknown'), client_ip=client_ip, count=len(results),
+             failed=sum(1 for r in results if not r["response"].get('success')))
+    return jsonify({
+        "agent": "statistics_agent",
+        "server_ip": stats_agent.my_ip,
+        "sender": incoming.get('sender', 'unknown'),
+        "batch": results,
+        "count": len(results),
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/message', methods=['POST'])
 def receive_message():
     """Inter-agent communication endpoint (A2A protocol)"""
     try:
-        incoming = request.get_json()
+        timer = hop_timing.current()
+        with timer.phase("serialize_ms"):
+            incoming = request.get_json()
         sender = incoming.get('sender', 'unknown')
         message = incoming.get('message', {})
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
         
-        print(f"🤖 Message from {sender} ({client_ip})")
+        agent_logging.bind_correlation_id(incoming.get('correlation_id'))
+        deadline.bind(incoming)
+        if isinstance(incoming.get('batch'), list):
+            return _message_batch(incoming, timer, client_ip)
         
         operation = message.get('operation')
         request_data = message.get('data', {})
         
-        result = stats_agent.process_request(operation, request_data)
+        if deadline.expired():
+            log.info("message.deadline_exceeded", sender=sender, operation=operation)
+            return jsonify({
+                "agent": "statistics_agent",
+                "error": "Deadline exceeded",
+                "correlation_id": incoming.get('correlation_id'),
+                "steps": [deadline.aborted_step(stats_agent.agent_id, operation, "compute")],
+                "timing": hop_timing.timing_tree(timer),
+                "timestamp": datetime.now().isoformat()
+            }), 504
+        
+        with timer.phase("compute_ms"):
+            result = stats_agent.process_request(operation, request_data, coalescer)
+        log.info("message.success" if result.get('success') else "message.failure",
+                 sender=sender, client_ip=client_ip, operation=operation)
         
         return jsonify({
             "agent": "statistics_agent",
@@ -123,6 +234,7 @@ def receive_message():
             "response": result,
             "correlation_id": incoming.get('correlation_id'),
             "trace": incoming.get('trace', []) + [f"{stats_agent.agent_id}@{stats_agent.my_ip}:{stats_agent.port}"],
+            "timing": hop_timing.timing_tree(timer),
             "timestamp": datetime.now().isoformat()
         })
     
@@ -144,7 +256,7 @@ def api_calculate():
         if not numbers:
             return jsonify({"error": "No numbers provided"}), 400
         
-        result = stats_agent.process_request(operation, {"numbers": numbers})
+        result = stats_agent.process_request(operation, {"numbers": numbers}, coalescer)
         
         return jsonify(result)
     
@@ -216,4 +328,5 @@ if __name__ == '__main__':
     print("🤖 Inter-Agent: http://localhost:5003/message")
     
     # Run Flask app
+    local_transport.serve(app, stats_agent.port, reloader=True)
     app.run(host=stats_agent.host, port=stats_agent.port, debug=True)
\ No newline at end of file
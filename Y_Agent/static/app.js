@@ -76,7 +76,7 @@ async function convertUnits() {
     
     const res = await fetch('/convert', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: { 'Content-Type': 'application/json', 'X-Priority': 'interactive' },
       body: JSON.stringify({ 
         value: value, 
         from_unit: fromUnit, 
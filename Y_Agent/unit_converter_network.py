@@ -6,16 +6,42 @@ Port: 5002
 
 import json
 import socket
+import sys
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_cors import CORS
 import requests
 import os
 from dotenv import load_dotenv
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from single_flight import SingleFlight
+from operation_registry import OperationRegistry
+import hop_timing
+import deadline
+import operation_registry
+import wire
+import local_transport
+import shared_array
+import stream_chain
+from stream_chain import StreamHop
+import rate_limit
+from rate_limit import RateLimiter
+import admission
+from admission import AdmissionController
+from agent_metrics import AgentMetrics
+from agent_client import AgentClient
+from circuit_breaker import CircuitOpenError
+import agent_logging
+from agent_logging import StructuredLogger
+from agent_store import AgentStore
 
 # Load environment variables
 load_dotenv()
 
+# Calculator answers that mean "busy, try later" rather than "broken": admission control and rate limits
+# answer 429, a full job queue 503
+SHED_STATUSES = (429, 503)
+
 class NetworkUnitConverterAgent:
     def __init__(self, agent_id="unit_converter_agent"):
         self.agent_id = agent_id
@@ -65,6 +91,15 @@ class NetworkUnitConverterAgent:
                 'pint': 0.473176
             }
         }
+        
+        # Conversions call the calculator agent, so they are worth coalescing ("linear" rather than "constant")
+        # but never cached: the calculator's answer may change
+        self.operations = OperationRegistry()
+        self.operations.register(
+            "convert", self.convert_units,
+            (("value", "number", None), ("from_unit", "string", None), ("to_unit", "string", None)),
+            "linear", self.convert_vector, "Convert a value between units of the same category"
+        )
     
     def get_local_ip(self):
         """Get the local IP address of this machine"""
@@ -162,45 +197,71 @@ class NetworkUnitConverterAgent:
     def call_calculator(self, operation, data):
         """Call the calculator agent for math operations"""
         try:
-            print(f"📞 Calling Calculator: {operation} with {data}")
+            log.debug("calculator.call", operation=operation, data=data)
             
-            response = requests.post(
-                f"{self.calculator_url}/message",
-                json={
-                    "sender": self.agent_id,
-                    "message": {
-                        "operation": operation,
-                        "data": data
-                    }
-                },
-                timeout=10  # Longer timeout for network calls
-            )
+            with hop_timing.current().call("calculator_agent", operation) as call:
+                response = client.post(
+                    f"{self.calculator_url}/message",
+                    destination="calculator",
+                    operation=operation,
+                    envelope={
+                        "sender": self.agent_id,
+                        "message": {
+                            "operation": operation,
+                            "data": data
+                        }
+                    },
+                    timeout=10  # Longer timeout for network calls
+                )
             
             if response.status_code == 200:
-                result = response.json()
+                result = wire.decode_response(response)
+                call["timing"] = hop_timing.remote_tree(result)
                 calc_response = result.get("response", {})
-                print(f"✅ Calculator responded: {calc_response.get('result')}")
+                log.debug("calculator.response", operation=operation, result=calc_response.get('result'))
                 return calc_response
-            else:
-                print(f"❌ Calculator error: {response.status_code}")
-                return {"success": False, "error": "Calculator agent not responding"}
+            if response.status_code in SHED_STATUSES:
+                # The calculator is shedding load (admission, rate limit or breaker); don't add to it
+                log.debug("calculator.shed", operation=operation, status=response.status_code)
+                return self.local_fallback(operation, data, f"Calculator shed the request (HTTP {response.status_code})")
+            log.warning("calculator.error", operation=operation, status=response.status_code)
+            return {"success": False, "error": "Calculator agent not responding"}
                 
         except Exception as e:
-            print(f"❌ Calculator communication failed: {str(e)}")
-            # Fallback to local calculation if calculator is down
-            if operation == "multiply" and len(data.get("numbers", [])) == 2:
-                nums = data["numbers"]
-                result = nums[0] * nums[1]
-                print(f"🔄 Using local fallback: {nums[0]} × {nums[1]} = {result}")
-                return {"success": True, "result": result, "operation": "local_multiply"}
-            elif operation == "divide" and len(data.get("numbers", [])) == 2:
-                nums = data["numbers"]
-                if nums[1] != 0:
-                    result = nums[0] / nums[1]
-                    print(f"🔄 Using local fallback: {nums[0]} ÷ {nums[1]} = {result}")
-                    return {"success": True, "result": result, "operation": "local_divide"}
-            
-            return {"success": False, "error": f"Calculator communication failed: {str(e)}"}
+            if isinstance(e, CircuitOpenError):
+                # Breaker is open: no network call was made, go straight to the local fallback
+                log.debug("calculator.circuit_open", operation=operation)
+            elif isinstance(e, deadline.DeadlineExceeded):
+                # No budget left to wait for the calculator; the local fallback costs next to nothing
+                log.debug("calculator.deadline_exceeded", operation=operation)
+            else:
+                log.warning("calculator.unreachable", operation=operation, error=str(e))
+            return self.local_fallback(operation, data, f"Calculator communication failed: {str(e)}")
+    
+    def local_fallback(self, operation, data, error):
+        """Two-number multiply/divide done here when the calculator cannot take the call"""
+        nums = data.get("numbers", [])
+        if operation == "multiply" and len(nums) == 2:
+            result = nums[0] * nums[1]
+            log.info("calculator.fallback", operation=operation, numbers=nums, result=result)
+            return {"success": True, "result": result, "operation": "local_multiply"}
+        if operation == "divide" and len(nums) == 2 and nums[1] != 0:
+            result = nums[0] / nums[1]
+            log.info("calculator.fallback", operation=operation, numbers=nums, result=result)
+            return {"success": True, "result": result, "operation": "local_divide"}
+        return {"success": False, "error": error}
+    
+    def convert_vector(self, values, data):
+        """Convert many values locally with one factor lookup (no calculator round-trips)"""
+        from_unit = (data.get("from_unit") or "").lower()
+        to_unit = (data.get("to_unit") or "").lower()
+        category = self.find_unit_category(from_unit)
+        if not category or category != self.find_unit_category(to_unit):
+            raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+        if category == 'temperature':
+            return [self.convert_temperature(v, from_unit, to_unit)["result"] for v in values]
+        factor = self.conversions[category][from_unit] / self.conversions[category][to_unit]
+        return [v * factor for v in values]
     
     def get_available_units(self):
         """Return list of all supported units"""
@@ -212,7 +273,24 @@ class NetworkUnitConverterAgent:
 # Flask server setup with CORS for cross-system communication
 app = Flask(__name__)
 CORS(app)  # Enable Cross-Origin Resource Sharing
+wire.install(app)
 converter = NetworkUnitConverterAgent()
+coalescer = SingleFlight()
+hop_timing.install(app, f"{converter.agent_id}@{converter.my_ip}:{converter.port}")
+deadline.install(app)
+metrics = AgentMetrics(converter.agent_id)
+metrics.instrument(app, converter.operations)
+operation_registry.install(app, converter.operations)
+rate_limiter = rate_limit.install(app, RateLimiter.from_env(metrics))
+admission_control = admission.install(app, AdmissionController.from_env(metrics))
+metrics.register_collector("a2a_coalesced_requests_total", "counter", "Requests that shared another request's in-flight result",
+                           lambda: coalescer.stats()["coalesced"])
+client = AgentClient(converter.agent_id, metrics)
+log = agent_logging.install(app, StructuredLogger.from_env(converter.agent_id))
+metrics.register_collector("a2a_log_records_total", "counter", "Structured log records by outcome",
+                           lambda: {(("state", k),): v for k, v in log.stats().items() if k != "queued"})
+store = AgentStore.from_env(converter.agent_id)
+stream_hop = stream_chain.install(app, StreamHop.from_env(converter.agent_id, converter.operations, client))
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -225,9 +303,24 @@ def health_check():
         "connected_agents": {
             "calculator": converter.calculator_url,
             "statistics": converter.statistics_url
-        }
+        },
+        "coalescing": coalescer.stats(),
+        "admission": admission_control.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "store": store.stats(),
+        "streams": stream_hop.stats(),
+        "wire": client.wire.stats(),
+        "transport": client.transport.stats(),
+        "shared_memory": shared_array.stats(),
+        "circuit_breakers": client.breakers.stats(),
+        "peer_latency": client.latency_stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition for this agent (all worker processes)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/network-info', methods=['GET'])
 def network_info():
     """Return network information for debugging"""
@@ -247,26 +340,81 @@ def network_info():
         }
     })
 
+def _deadline_response(incoming, timer):
+    """504 for a request whose budget ran out before conversion started"""
+    return jsonify({
+        "agent": "unit_converter_agent",
+        "error": "Deadline exceeded",
+        "correlation_id": (incoming or {}).get('correlation_id'),
+        "steps": [deadline.aborted_step(converter.agent_id, "convert", "compute")],
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    }), 504
+
+MESSAGE_BATCH_MAX = int(os.getenv('MESSAGE_BATCH_MAX', 1000))
+
+def _convert_batch(incoming, timer, client_ip):
+    """Answer a batched /convert or /message request: {"batch": [items]} -> {"batch": [results]}, in order.
+    /convert items are {value, from_unit, to_unit}; /message items are envelopes"""
+    items = incoming['batch']
+    if len(items) > MESSAGE_BATCH_MAX:
+        return jsonify({"agent": "unit_converter_agent", "error": f"Batch too large: {len(items)} > {MESSAGE_BATCH_MAX}"}), 413
+    deadline.bind(incoming)
+    if deadline.expired():
+        return _deadline_response(incoming, timer)
+    results = []
+    with timer.phase("compute_ms"):
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            fields = item.get('message') if isinstance(item.get('message'), dict) else item
+            result = converter.operations.dispatch("convert", {
+                "value": fields.get('value'),
+                "from_unit": fields.get('from_unit') or fields.get('from') or fields.get('fromUnit'),
+                "to_unit": fields.get('to_unit') or fields.get('to') or fields.get('toUnit')
+            }, coalescer)
+            results.append({"correlation_id": item.get('correlation_id'), "response": result})
+    log.info("convert.batch", sender=incoming.get('sender', 'unknown'), client_ip=client_ip, count=len(results),
+             failed=sum(1 for r in results if not r["response"].get('success')))
+    return jsonify({
+        "agent": "unit_converter_agent",
+        "server_ip": converter.my_ip,
+        "sender": incoming.get('sender', 'unknown'),
+        "batch": results,
+        "count": len(results),
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/convert', methods=['POST'])
 def convert_units():
     """Direct conversion endpoint"""
     try:
-        data = request.get_json()
+        timer = hop_timing.current()
+        with timer.phase("serialize_ms"):
+            data = request.get_json()
+        if isinstance(data.get('batch'), list):
+            return _convert_batch(data, timer, request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr))
         value = data.get('value')
         from_unit = data.get('from_unit')
         to_unit = data.get('to_unit')
         
-        # Log the request with source IP
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        print(f"📨 Conversion request from {client_ip}: {value} {from_unit} → {to_unit}")
         
-        result = converter.convert_units(value, from_unit, to_unit)
+        if deadline.expired():
+            return _deadline_response(None, timer)
+        with timer.phase("compute_ms"):
+            result = converter.operations.dispatch("convert", {"value": value, "from_unit": from_unit, "to_unit": to_unit}, coalescer)
+        
+        # Log the request with source IP
+        log.info("convert.success" if result.get('success') else "convert.failure",
+                 client_ip=client_ip, value=value, from_unit=from_unit, to_unit=to_unit)
         
         return jsonify({
             "agent": "unit_converter_agent",
             "server_ip": converter.my_ip,
             "request": data,
             "response": result,
+            "timing": hop_timing.timing_tree(timer),
             "timestamp": datetime.now().isoformat()
         })
     
@@ -277,6 +425,16 @@ def convert_units():
             "timestamp": datetime.now().isoformat()
         }), 400
 
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    """Operations supported by this agent, generated from its registry"""
+    return jsonify({
+        "agent": "unit_converter_agent",
+        "operations": converter.operations.capabilities(),
+        "units": converter.get_available_units(),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/units', methods=['GET'])
 def get_units():
     """Get available units"""
@@ -291,6 +449,13 @@ def index():
     """Serve the Unit Converter UI template"""
     return render_template('index.html')
 
+UI_CALCULATOR_OPERATIONS = {
+    'add': lambda a, b: a + b,
+    'subtract': lambda a, b: a - b,
+    'multiply': lambda a, b: a * b,
+    'divide': lambda a, b: a / b,
+}
+
 @app.route('/calculator', methods=['POST'])
 def calculator_api():
     """Basic calculator API used by the UI (add, subtract, multiply, divide)"""
@@ -300,18 +465,12 @@ def calculator_api():
         b = float(data.get('b', 0))
         operation = (data.get('operation') or '').lower()
 
-        if operation == 'add':
-            result = a + b
-        elif operation == 'subtract':
-            result = a - b
-        elif operation == 'multiply':
-            result = a * b
-        elif operation == 'divide':
-            if b == 0:
-                return jsonify({"success": False, "error": "Division by zero"}), 400
-            result = a / b
-        else:
+        handler = UI_CALCULATOR_OPERATIONS.get(operation)
+        if handler is None:
             return jsonify({"success": False, "error": "Unsupported operation"}), 400
+        if operation == 'divide' and b == 0:
+            return jsonify({"success": False, "error": "Division by zero"}), 400
+        result = handler(a, b)
 
         return jsonify({
             "success": True,
@@ -325,20 +484,31 @@ def calculator_api():
 def receive_message():
     """Inter-agent communication endpoint (A2A protocol)"""
     try:
-        incoming = request.get_json()
+        timer = hop_timing.current()
+        with timer.phase("serialize_ms"):
+            incoming = request.get_json()
         sender = incoming.get('sender', 'unknown')
         message = incoming.get('message', {})
         
         # Log the inter-agent communication
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        print(f"🤖 Message from {sender} ({client_ip})")
+        if isinstance(incoming.get('batch'), list):
+            return _convert_batch(incoming, timer, client_ip)
+        agent_logging.bind_correlation_id(incoming.get('correlation_id'))
+        deadline.bind(incoming)
+        if deadline.expired():
+            log.info("message.deadline_exceeded", sender=sender, operation="convert")
+            return _deadline_response(incoming, timer)
         
         # Handle different message formats for unit conversion
         value = message.get('value')
         from_unit = message.get('from_unit') or message.get('from') or message.get('fromUnit')
         to_unit = message.get('to_unit') or message.get('to') or message.get('toUnit')
         
-        result = converter.convert_units(value, from_unit, to_unit)
+        with timer.phase("compute_ms"):
+            result = converter.operations.dispatch("convert", {"value": value, "from_unit": from_unit, "to_unit": to_unit}, coalescer)
+        log.info("message.success" if result.get('success') else "message.failure",
+                 sender=sender, client_ip=client_ip, operation="convert")
         
         return jsonify({
             "agent": "unit_converter_agent",
@@ -347,6 +517,7 @@ def receive_message():
             "response": result,
             "correlation_id": incoming.get('correlation_id'),
             "trace": incoming.get('trace', []) + [f"{converter.agent_id}@{converter.my_ip}:{converter.port}"],
+            "timing": hop_timing.timing_tree(timer),
             "timestamp": datetime.now().isoformat()
         })
     
@@ -406,4 +577,5 @@ if __name__ == '__main__':
     print(f"📍 Access from other systems: http://{converter.my_ip}:{converter.port}")
     
     # Run Flask app
+    local_transport.serve(app, converter.port, reloader=True)
     app.run(host=converter.host, port=converter.port, debug=True)
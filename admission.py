@@ -0,0 +1,364 @@
+"""
+Admission control for agent routes
+Each POST route gets a concurrency limit and a bounded wait queue per priority class; an estimate of
+the memory a request will hold is reserved against a per-process budget. Requests that would overflow
+the queue or the budget, or wait longer than allowed, are turned away at once with 429 and Retry-After.
+Freed slots go to the waiting classes by smooth weighted round-robin, interactive requests that have
+waited past their latency target go first, and the last slots of each route are kept for interactive work.
+Calls an agent makes while holding a slot carry NESTED_HEADER; such nested hops skip the slots (their
+memory is still reserved, and each route caps how many run at once), so a chain that calls back into an
+agent it came through cannot wait on itself. The header is only believed from the agent socket, loopback or
+a trusted peer, or when it carries this process's own token, which the chain passed along from an earlier hop
+"""
+
+import math
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+import deadline
+import local_transport
+import priority
+import stream_chain
+import wire
+
+# Rough cost of one parsed JSON number: the float/int object plus its list slot
+NUMBER_BYTES = 32
+BASE_REQUEST_BYTES = 16 * 1024
+
+NESTED_HEADER = "X-A2A-Nested"
+# Random per process: a nested claim that carries it was forwarded along a chain this process started
+PROCESS_TOKEN = secrets.token_hex(16)
+MAX_NESTED_TOKENS = 8
+
+_holding = ContextVar("admission_holding", default=None)
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_route_limits(spec):
+    """Parse "/message=4:16:8,/stats=2:8" into {route: (concurrency, queue, nested)}"""
+    limits = {}
+    for part in (spec or "").split(','):
+        if '=' not in part:
+            continue
+        route, value = part.split('=', 1)
+        concurrency, _, rest = value.partition(':')
+        queue, _, nested = rest.partition(':')
+        try:
+            limits[route.strip()] = (int(concurrency), int(queue) if queue else None, int(nested) if nested else None)
+        except ValueError:
+            continue
+    return limits
+
+
+def nested_tokens(value):
+    """Process tokens in a NESTED_HEADER value, oldest hop first"""
+    return [token.strip() for token in (value or "").split(',') if token.strip()][-MAX_NESTED_TOKENS:]
+
+
+def estimate_bytes(content_length, body=None, content_type=wire.JSON):
+    """Memory a request holds while handled: raw body, parsed JSON, and one object per array element"""
+    if not content_length:
+        return BASE_REQUEST_BYTES
+    if body is None:
+        return BASE_REQUEST_BYTES + content_length * 2
+    elements = wire.element_count(body, content_type)
+    return BASE_REQUEST_BYTES + content_length * 2 + elements * NUMBER_BYTES
+
+
+def outbound(headers=None):
+    """Headers for an outbound call, marking it nested when made on behalf of an admitted request"""
+    chain = _holding.get()
+    if chain is None:
+        return headers
+    headers = dict(headers or {})
+    headers[NESTED_HEADER] = chain
+    return headers
+
+
+class RouteGate:
+    """Concurrency slots for one route with a FIFO queue of waiters per priority class"""
+
+    def __init__(self, route, concurrency, queue_size, weights=None, reserved=1, interactive_target=0.1, nested_limit=16):
+        self.route = route
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.nested_limit = nested_limit
+        self.weights = weights or priority.parse_weights("")
+        # Slots only interactive requests may take, so one can always start without waiting behind batch work
+        self.reserved = min(reserved, max(concurrency - 1, 0))
+        self.interactive_target = interactive_target
+        self.active = 0
+        self.admitted = dict.fromkeys(priority.CLASSES, 0)
+        self.rejected = 0
+        self.nested = 0
+        self.nested_active = 0
+        self.service_ewma = 0.0
+        self._waiters = {cls: deque() for cls in priority.CLASSES}  # [event, enqueued_at]
+        self._credit = dict.fromkeys(priority.CLASSES, 0)
+        self._lock = threading.Lock()
+
+    def _limit(self, cls):
+        return self.concurrency if cls == priority.INTERACTIVE else self.concurrency - self.reserved
+
+    def queued(self):
+        return sum(len(q) for q in self._waiters.values())
+
+    def acquire(self, max_wait, cls=priority.DEFAULT):
+        """Take a slot, waiting up to max_wait seconds in line; returns seconds waited or raises Rejected"""
+        with self._lock:
+            if self.active < self._limit(cls) and not self.queued():
+                self.active += 1
+                self.admitted[cls] += 1
+                return 0.0
+            if len(self._waiters[cls]) >= self.queue_size or max_wait <= 0:
+                self.rejected += 1
+                raise Rejected("queue_full", self.retry_after())
+            waiter = [threading.Event(), time.monotonic()]
+            self._waiters[cls].append(waiter)
+            self._dispatch()
+        if waiter[0].wait(max_wait):
+            with self._lock:
+                self.admitted[cls] += 1
+            return time.monotonic() - waiter[1]
+        with self._lock:
+            if waiter[0].is_set():
+                # Handed a slot just as the wait timed out
+                self.admitted[cls] += 1
+                return time.monotonic() - waiter[1]
+            self._waiters[cls].remove(waiter)
+            self.rejected += 1
+            raise Rejected("wait_timeout", self.retry_after())
+
+    def enter_nested(self):
+        """Count a nested hop in, or raise Rejected when the route already runs nested_limit of them"""
+        with self._lock:
+            if self.nested_active >= self.nested_limit:
+                self.rejected += 1
+                raise Rejected("nested_full", self.retry_after())
+            self.nested_active += 1
+            self.nested += 1
+
+    def leave_nested(self):
+        with self._lock:
+            self.nested_active -= 1
+
+    def release(self, held):
+        with self._lock:
+            self.service_ewma = held if self.service_ewma == 0 else 0.8 * self.service_ewma + 0.2 * held
+            self.active -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Called with the lock held: hand free slots to waiters until none fit
+        while True:
+            eligible = [cls for cls in priority.CLASSES if self._waiters[cls] and self.active < self._limit(cls)]
+            if not eligible:
+                return
+            cls = self._pick(eligible)
+            self.active += 1
+            self._waiters[cls].popleft()[0].set()
+
+    def _pick(self, eligible):
+        interactive = self._waiters[priority.INTERACTIVE]
+        if interactive and priority.INTERACTIVE in eligible and time.monotonic() - interactive[0][1] >= self.interactive_target:
+            return priority.INTERACTIVE
+        # Smooth weighted round-robin: every class gains its weight, the richest is served and pays the total
+        total = 0
+        for cls in eligible:
+            self._credit[cls] += self.weights[cls]
+            total += self.weights[cls]
+        chosen = max(eligible, key=lambda cls: self._credit[cls])
+        self._credit[chosen] -= total
+        return chosen
+
+    def retry_after(self):
+        """Seconds until a new request would likely get a slot"""
+        backlog = self.queued() + 1
+        return max(1, math.ceil(self.service_ewma * backlog / max(self.concurrency, 1)))
+
+    def stats(self):
+        return {"active": self.active, "queued": {cls: len(q) for cls, q in self._waiters.items()},
+                "concurrency": self.concurrency, "reserved_interactive": self.reserved, "queue_size": self.queue_size,
+                "admitted": dict(self.admitted), "nested": self.nested, "nested_active": self.nested_active,
+                "nested_limit": self.nested_limit, "rejected": self.rejected}
+
+
+class AdmissionController:
+    def __init__(self, concurrency=8, queue_size=32, max_wait_ms=5000, memory_mb=256, routes=None, metrics=None,
+                 weights=None, reserved=1, interactive_target_ms=100, nested_limit=16, trusted_peers=()):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.nested_limit = nested_limit
+        self.trusted_peers = set(trusted_peers)
+        self.weights = weights or priority.parse_weights("")
+        self.reserved = reserved
+        self.interactive_target = interactive_target_ms / 1000.0
+        self.max_wait = max_wait_ms / 1000.0
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+        self.route_limits = routes or {}
+        self.metrics = metrics
+        self.memory_in_use = 0
+        self.rejected_memory = 0
+        self._gates = {}
+        self._lock = threading.Lock()
+        if metrics is not None:
+            metrics.describe("a2a_admission_wait_seconds", "histogram", "Time requests waited for a concurrency slot, by route and priority class")
+            metrics.describe("a2a_admission_rejected_total", "counter", "Requests rejected by admission control, by route and reason")
+            metrics.register_collector("a2a_admission_queue_depth", "gauge", "Requests waiting for a concurrency slot, by route and priority class",
+                                       lambda: {(("route", g.route), ("class", cls)): len(q)
+                                                for g in list(self._gates.values()) for cls, q in g._waiters.items()})
+            metrics.register_collector("a2a_admission_active", "gauge", "Requests holding a concurrency slot, by route",
+                                       lambda: {(("route", g.route),): g.active for g in list(self._gates.values())})
+            metrics.register_collector("a2a_admission_memory_bytes", "gauge", "Estimated memory reserved by admitted and queued requests",
+                                       lambda: self.memory_in_use)
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        return cls(
+            concurrency=int(os.getenv('ADMISSION_CONCURRENCY', 8)),
+            queue_size=int(os.getenv('ADMISSION_QUEUE', 32)),
+            max_wait_ms=float(os.getenv('ADMISSION_MAX_WAIT_MS', 5000)),
+            memory_mb=float(os.getenv('ADMISSION_MEMORY_MB', 256)),
+            routes=parse_route_limits(os.getenv('ADMISSION_ROUTES', '')),
+            metrics=metrics,
+            weights=priority.weights_from_env(),
+            reserved=int(os.getenv('PRIORITY_RESERVED_SLOTS', 1)),
+            interactive_target_ms=float(os.getenv('INTERACTIVE_TARGET_MS', 100)),
+            nested_limit=int(os.getenv('ADMISSION_NESTED', 16)),
+            trusted_peers=[p.strip() for p in os.getenv('ADMISSION_TRUSTED_PEERS', '').split(',') if p.strip()],
+        )
+
+    def gate(self, route):
+        gate = self._gates.get(route)
+        if gate is None:
+            concurrency, queue_size, nested_limit = self.route_limits.get(route, (self.concurrency, None, None))
+            with self._lock:
+                gate = self._gates.setdefault(route, RouteGate(
+                    route, concurrency, self.queue_size if queue_size is None else queue_size,
+                    self.weights, self.reserved, self.interactive_target,
+                    self.nested_limit if nested_limit is None else nested_limit))
+        return gate
+
+    def trusts_nested(self, environ, claimed):
+        """Whether a request's NESTED_HEADER value can be believed: it came from the agent socket,
+        loopback or a trusted peer, or it carries this process's token"""
+        return (PROCESS_TOKEN in nested_tokens(claimed) or local_transport.is_local_request(environ)
+                or environ.get('REMOTE_ADDR') in self.trusted_peers)
+
+    def reserve(self, nbytes):
+        with self._lock:
+            if self.memory_in_use + nbytes > self.memory_budget:
+                self.rejected_memory += 1
+                return False
+            self.memory_in_use += nbytes
+            return True
+
+    def free(self, nbytes):
+        with self._lock:
+            self.memory_in_use -= nbytes
+
+    def admit(self, route, nbytes, max_wait=None, cls=priority.DEFAULT, nested=False):
+        """Reserve memory and, unless nested, a slot for one request; returns seconds waited or raises Rejected"""
+        gate = self.gate(route)
+        if not self.reserve(nbytes):
+            self._rejected(route, "memory")
+            raise Rejected("memory", gate.retry_after())
+        if nested:
+            try:
+                gate.enter_nested()
+            except Rejected as e:
+                self.free(nbytes)
+                self._rejected(route, e.reason)
+                raise
+            return 0.0
+        try:
+            waited = gate.acquire(self.max_wait if max_wait is None else min(self.max_wait, max_wait), cls)
+        except Rejected as e:
+            self.free(nbytes)
+            self._rejected(route, e.reason)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe("a2a_admission_wait_seconds", (("route", route), ("class", cls)), waited)
+        return waited
+
+    def done(self, route, nbytes, held, nested=False):
+        if nested:
+            self.gate(route).leave_nested()
+        else:
+            self.gate(route).release(held)
+        self.free(nbytes)
+
+    def _rejected(self, route, reason):
+        if self.metrics is not None:
+            self.metrics.inc("a2a_admission_rejected_total", (("route", route), ("reason", reason)))
+
+    def stats(self):
+        return {
+            "memory_in_use": self.memory_in_use,
+            "memory_budget": self.memory_budget,
+            "rejected_memory": self.rejected_memory,
+            "routes": {route: gate.stats() for route, gate in list(self._gates.items())},
+        }
+
+
+def install(app, controller):
+    """Gate every POST route; register after hop_timing and deadline so waiting counts as queue time
+    and never outlasts the request's deadline. Also sets the request's priority class"""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _admit():
+        if request.method != 'POST' or request.url_rule is None:
+            return None
+        cls = priority.of_request(request)
+        g.priority_token = priority.set_current(cls)
+        route = request.url_rule.rule
+        length = request.content_length or 0
+        if request.mimetype == stream_chain.CONTENT_TYPE:
+            # A stream is handled chunk by chunk from request.stream, holding only a bounded buffer;
+            # reading it here would leave the handler nothing to read
+            nbytes = BASE_REQUEST_BYTES
+        elif length > controller.memory_budget:
+            nbytes = estimate_bytes(length)
+        else:
+            nbytes = estimate_bytes(length, request.get_data(cache=True) if length else None, request.mimetype)
+        budget = deadline.current()
+        claimed = request.headers.get(NESTED_HEADER)
+        nested = claimed is not None and controller.trusts_nested(request.environ, claimed)
+        try:
+            controller.admit(route, nbytes, budget.remaining() if budget is not None else None, cls, nested)
+        except Rejected as e:
+            response = jsonify({"error": f"Too many requests: {e.reason}", "route": route, "retry_after": e.retry_after})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        g.admission = (route, nbytes, time.monotonic(), nested)
+        # Pass the chain's tokens on with this process's own, so a hop that comes back here is recognised
+        chain = [t for t in nested_tokens(claimed) if t != PROCESS_TOKEN] if nested else []
+        g.holding_token = _holding.set(",".join((chain + [PROCESS_TOKEN])[-MAX_NESTED_TOKENS:]))
+        return None
+
+    @app.teardown_request
+    def _release(exc=None):
+        token = g.pop('priority_token', None)
+        if token is not None:
+            priority.reset(token)
+        holding = g.pop('holding_token', None)
+        if holding is not None:
+            _holding.reset(holding)
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            route, nbytes, started, nested = admitted
+            controller.done(route, nbytes, time.monotonic() - started, nested)
+
+    return controller
@@ -0,0 +1,204 @@
+"""
+Shared HTTP client for agent-to-agent calls
+Reuses pooled connections, records outbound latency per destination agent and fails fast
+through a per-destination circuit breaker when a peer is down or too slow. Timeouts adapt to the
+observed latency of each peer, and calls to peers with replicas are hedged after the p95 delay.
+Inside a request with a deadline, timeouts shrink to the remaining budget, which is forwarded downstream
+along with the request's priority class. Streaming calls (one-shot generator bodies) are never hedged.
+Envelopes go out in the most compact format each peer has answered in (see wire), and calls to agents
+on this host go through their Unix sockets (see local_transport)
+"""
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+
+import admission
+import deadline
+import priority
+import wire
+from circuit_breaker import STATE_CODES, BreakerBoard
+from local_transport import LocalAdapter
+from peer_latency import HedgeBudget, LatencyTracker, replicas_from_env
+
+
+class AgentClient:
+    def __init__(self, agent_id, metrics=None, breakers=None, tracker=None, replicas=None,
+                 hedge_budget=None, hedge_workers=None):
+        self.agent_id = agent_id
+        self.metrics = metrics
+        self.breakers = breakers if breakers is not None else BreakerBoard.from_env()
+        self.tracker = tracker if tracker is not None else LatencyTracker.from_env()
+        self.replicas = replicas if replicas is not None else replicas_from_env()
+        self.hedge_budget = hedge_budget if hedge_budget is not None else HedgeBudget(
+            ratio=float(os.getenv('HEDGE_RATIO', 0.05)), burst=int(os.getenv('HEDGE_BURST', 10)))
+        hedge_workers = hedge_workers or int(os.getenv('HEDGE_WORKERS', 4))
+        # Each hedged call occupies at most two pool threads; beyond that, calls go out unhedged
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+        self._hedge_pool = None
+        self._lock = threading.Lock()
+        self._hedge_pool_size = hedge_workers * 2
+        self._replica_cycle = {d: itertools.cycle(urls) for d, urls in self.replicas.items()}
+        self.hedges = {"sent": 0, "won": 0}
+        self.session = requests.Session()
+        self.mount()
+        self.wire = wire.Negotiator.from_env()
+        if metrics is not None:
+            metrics.register_collector("a2a_circuit_state", "gauge", "Circuit breaker state by destination (0 closed, 1 half-open, 2 open)",
+                                       lambda: {(("destination", b.destination),): STATE_CODES[b.state] for b in self.breakers})
+            metrics.register_collector("a2a_circuit_rejected_total", "counter", "Calls rejected by an open circuit breaker",
+                                       lambda: {(("destination", b.destination),): b.rejected for b in self.breakers})
+            metrics.register_collector("a2a_hedged_requests_total", "counter", "Hedged duplicate calls sent to replicas, and how many answered first",
+                                       lambda: {(("outcome", k),): v for k, v in self.hedges.items()})
+
+    def mount(self, **pool_kwargs):
+        """(Re)mount the http:// adapter, e.g. with a larger connection pool; returns it"""
+        self.transport = LocalAdapter.from_env(**pool_kwargs)
+        self.session.mount("http://", self.transport)
+        return self.transport
+
+    @staticmethod
+    def destination_of(url):
+        return urlparse(url).netloc or url
+
+    def request(self, method, url, destination=None, timeout=10, operation=None, streaming=False, **kwargs):
+        """Send a request and record its latency; raises requests.RequestException like requests does
+        (CircuitOpenError, a subclass, when the destination's breaker is open).
+        timeout is an upper bound: once warmed up, the observed p99 for (destination, operation) sets it,
+        scaled up for a body larger than any in the latency window, and the current request's deadline
+        caps it further (DeadlineExceeded when the budget runs out).
+        streaming=True is for bodies that can only be sent once and last as long as the data does:
+        no hedging, and timeout is used as given rather than learned from short calls.
+        envelope=obj sends obj in the destination's negotiated format (decode with wire.decode_response)"""
+        destination = destination or self.destination_of(url)
+        if 'envelope' in kwargs:
+            return self._exchange(method, url, destination, timeout, operation, kwargs)
+        key = (destination, operation)
+        body = kwargs.get('data')
+        size = len(body) if isinstance(body, (bytes, bytearray)) else 0
+        if not streaming:
+            timeout = self.tracker.timeout_for(key, timeout, size)
+        timeout, headers, budget_bound = deadline.outbound(timeout, kwargs.get('headers'))
+        headers = admission.outbound(priority.outbound(headers))
+        if headers is not None:
+            kwargs['headers'] = headers
+        self.hedge_budget.earn()
+        delay = self._hedge_delay(key, size) if destination in self.replicas and not streaming else None
+        try:
+            if delay is None or not self._hedge_slots.acquire(blocking=False):
+                response = self._send(method, url, destination, destination, key, timeout, kwargs, budget_bound, streaming, size)
+            else:
+                try:
+                    response = self._hedged(method, url, destination, key, timeout, delay, kwargs, budget_bound, size)
+                finally:
+                    self._hedge_slots.release()
+        except requests.Timeout as e:
+            if budget_bound and not isinstance(e, deadline.DeadlineExceeded):
+                raise deadline.DeadlineExceeded("response") from e
+            raise
+        if (kwargs.get('headers') or {}).get('Accept') == self.wire.accept:
+            self.wire.observe(destination, response)
+        return response
+
+    def _exchange(self, method, url, destination, timeout, operation, kwargs):
+        """Send kwargs['envelope'] encoded for the destination; a peer that answers 415 to a binary
+        body is sent the same envelope again as JSON"""
+        envelope = kwargs.pop('envelope')
+        for _ in range(2):
+            body, headers = self.wire.encode(destination, envelope)
+            response = self.request(method, url, destination, timeout, operation, data=body,
+                                    headers=dict(kwargs.get('headers') or {}, **headers),
+                                    **{k: v for k, v in kwargs.items() if k != 'headers'})
+            if response.status_code != 415 or headers["Content-Type"] == wire.JSON:
+                return response
+        return response
+
+    def post(self, url, destination=None, timeout=10, **kwargs):
+        return self.request('POST', url, destination, timeout, **kwargs)
+
+    def get(self, url, destination=None, timeout=10, **kwargs):
+        return self.request('GET', url, destination, timeout, **kwargs)
+
+    def _hedge_delay(self, key, size):
+        """The p95 a call must outlive before it is hedged, scaled like its timeout"""
+        p95 = self.tracker.percentile(key, 0.95)
+        scale = self.tracker.scale(key, size)
+        return None if p95 is None or scale is None else p95 * scale
+
+    def _send(self, method, url, destination, breaker_key, key, timeout, kwargs, budget_bound=False, streaming=False, size=0):
+        breaker = self.breakers.get(breaker_key)
+        breaker.before_call()
+        started = time.perf_counter()
+        ok = False
+        counted = True
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            ok = response.status_code < 500
+            if response.status_code == 504 and deadline.HEADER in (kwargs.get('headers') or {}):
+                # The peer gave up because the budget this call forwarded ran out, like a budget-bound timeout
+                counted = False
+            return response
+        except requests.Timeout:
+            # Running out of the caller's own budget says nothing about the destination's health
+            counted = not budget_bound
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if counted:
+                # A stream's duration is the data's, not the peer's latency
+                breaker.record(ok, 0.0 if streaming else elapsed)
+            else:
+                breaker.cancel()
+            if ok and not streaming:
+                self.tracker.record(key, elapsed, size)
+            if self.metrics is not None:
+                self.metrics.observe_outbound(destination, elapsed, ok)
+
+    def _hedged(self, method, url, destination, key, timeout, delay, kwargs, budget_bound=False, size=0):
+        """Send to the primary; if it is still pending after delay, race a duplicate against a replica"""
+        pool = self._pool()
+        primary = pool.submit(self._send, method, url, destination, destination, key, timeout, kwargs, budget_bound, False, size)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.hedge_budget.spend():
+            return primary.result()
+        parsed = urlparse(url)
+        replica_url = next(self._replica_cycle[destination]) + parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        hedge = pool.submit(self._send, method, replica_url, destination, self.destination_of(replica_url), key, timeout, kwargs,
+                            budget_bound, False, size)
+        with self._lock:
+            self.hedges["sent"] += 1
+        pending = {primary, hedge}
+        error = response = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if result.status_code < 500:
+                    # The slower call finishes in the background; its result is discarded
+                    if future is hedge:
+                        with self._lock:
+                            self.hedges["won"] += 1
+                    return result
+                response = result
+        if response is not None:
+            return response
+        raise error
+
+    def _pool(self):
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self._hedge_pool_size, thread_name_prefix=f"{self.agent_id}-hedge")
+        return self._hedge_pool
+
+    def latency_stats(self):
+        return {"peers": self.tracker.stats(), "hedges": dict(self.hedges),
+                "replicas": {d: list(urls) for d, urls in self.replicas.items()}}
@@ -0,0 +1,150 @@
+"""
+Asynchronous structured logging shared by all agents
+Request threads only enqueue a tuple; a background writer formats JSON lines and writes them in batches
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+_correlation_id = ContextVar("correlation_id", default=None)
+
+
+def parse_sample_rates(spec):
+    """Parse "message.success=0.01,calculate.success=0.1" into {event: rate}"""
+    rates = {}
+    for part in (spec or "").split(','):
+        if '=' in part:
+            event, rate = part.split('=', 1)
+            try:
+                rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                continue
+    return rates
+
+
+class StructuredLogger:
+    def __init__(self, agent, level="info", path=None, sample_rates=None,
+                 batch_size=256, flush_interval=0.2, max_queue=100000):
+        self.agent = agent
+        self.level = LEVELS.get(str(level).lower(), LEVELS["info"])
+        self.path = path
+        self.sample_rates = sample_rates or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.written = 0
+        # SimpleQueue.put is a single C call: no Python-level lock on the request thread
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._run, name=f"{agent}-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, agent):
+        return cls(
+            agent,
+            level=os.getenv('AGENT_LOG_LEVEL', 'info'),
+            path=os.getenv('AGENT_LOG_FILE') or None,
+            sample_rates=parse_sample_rates(os.getenv('AGENT_LOG_SAMPLE', '')),
+        )
+
+    def log(self, level, event, **fields):
+        if LEVELS.get(level, 0) < self.level:
+            return
+        rate = self.sample_rates.get(event)
+        if rate is not None and rate < 1.0 and random.random() >= rate:
+            return
+        if self._queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.put((time.time(), level, event, _correlation_id.get(), fields))
+
+    def debug(self, event, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event, **fields):
+        self.log("error", event, **fields)
+
+    def _format(self, record):
+        ts, level, event, correlation_id, fields = record
+        entry = {"ts": round(ts, 6), "level": level, "agent": self.agent, "event": event}
+        if correlation_id is not None:
+            entry["correlation_id"] = correlation_id
+        entry.update(fields)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stream = open(self.path, "a", buffering=1 << 16) if self.path else sys.stdout
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            drained = self._drain(first)
+            batch = [r for r in drained if r is not None]
+            if batch:
+                try:
+                    stream.write("\n".join(self._format(r) for r in batch) + "\n")
+                    stream.flush()
+                    self.written += len(batch)
+                except (OSError, ValueError):
+                    # stdout may already be closed at interpreter exit
+                    self.dropped += len(batch)
+            if len(batch) != len(drained):
+                if self.path:
+                    stream.close()
+                return
+
+    def close(self, timeout=2.0):
+        """Flush queued records and stop the writer"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+def bind_correlation_id(correlation_id):
+    """Attach a correlation ID to every record logged by this request"""
+    if correlation_id:
+        _correlation_id.set(str(correlation_id))
+
+
+def install(app, logger):
+    """Bind X-Correlation-ID per request; AGENT_ACCESS_LOG=0 silences the dev server's per-request access line"""
+    from flask import request
+
+    @app.before_request
+    def _bind_correlation_id():
+        _correlation_id.set(request.headers.get('X-Correlation-ID'))
+
+    if os.getenv('AGENT_ACCESS_LOG', '1') in ('0', 'false', 'no'):
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    return logger
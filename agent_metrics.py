@@ -0,0 +1,288 @@
+"""
+Prometheus-style metrics shared by all agents
+Counters, gauges and histograms recorded in-process under one lock; when AGENT_METRICS_DIR is set,
+each worker process snapshots its values to that directory so /metrics aggregates every worker
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class AgentMetrics:
+    """Metric registry for one agent process"""
+
+    def __init__(self, agent, directory=None, flush_interval=1.0):
+        self.agent = agent
+        self.directory = directory if directory is not None else os.getenv('AGENT_METRICS_DIR')
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._types = {}
+        self._help = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._buckets = {}
+        self._collectors = []
+        self._flusher = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # -- declaration ---------------------------------------------------
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._types[name] = kind
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def register_collector(self, name, kind, help_text, fn):
+        """Sample fn() at scrape/flush time; fn returns a number or a {labels-tuple: number} dict"""
+        self.describe(name, kind, help_text)
+        self._collectors.append((name, fn))
+
+    # -- hot path --------------------------------------------------------
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def gauge_set(self, name, labels=(), value=0):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        buckets = self._buckets.get(name, LATENCY_BUCKETS)
+        index = bisect_left(buckets, value)
+        key = (name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # per-bucket counts (+Inf last), then sum
+                series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def observe_outbound(self, destination, seconds, ok=True):
+        """Record one outbound call to another agent"""
+        labels = (("destination", destination),)
+        self.observe("a2a_outbound_latency_seconds", labels, seconds)
+        if not ok:
+            self.inc("a2a_outbound_errors_total", labels)
+
+    # -- Flask integration -------------------------------------------------
+
+    def instrument(self, app, operations=None):
+        """Record request counts, in-flight requests, latency and payload sizes for every route"""
+        from flask import g, request
+
+        self.describe("a2a_requests_total", "counter", "Requests handled, by route, method and status")
+        self.describe("a2a_requests_in_flight", "gauge", "Requests currently being handled")
+        self.describe("a2a_request_latency_seconds", "histogram", "Request latency by route")
+        self.describe("a2a_operation_latency_seconds", "histogram", "Request latency by operation")
+        self.describe("a2a_request_size_bytes", "histogram", "Request payload size by route", SIZE_BUCKETS)
+        self.describe("a2a_response_size_bytes", "histogram", "Response payload size by route", SIZE_BUCKETS)
+        self.describe("a2a_outbound_latency_seconds", "histogram", "Outbound call latency by destination agent")
+        self.describe("a2a_outbound_errors_total", "counter", "Failed outbound calls by destination agent")
+
+        @app.before_request
+        def _metrics_start():
+            g.metrics_started = time.perf_counter()
+            g.metrics_in_flight = True
+            self.gauge_add("a2a_requests_in_flight", (), 1)
+
+        @app.after_request
+        def _metrics_record(response):
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return response
+            elapsed = time.perf_counter() - started
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            route_labels = (("route", route),)
+            self.inc("a2a_requests_total", (("route", route), ("method", request.method), ("status", str(response.status_code))))
+            self.observe("a2a_request_latency_seconds", route_labels, elapsed)
+            if request.content_length:
+                self.observe("a2a_request_size_bytes", route_labels, request.content_length)
+            if response.content_length is not None:
+                self.observe("a2a_response_size_bytes", route_labels, response.content_length)
+            operation = self._operation_of(request)
+            if operation is not None:
+                if operations is not None and operation not in operations:
+                    operation = "other"
+                self.observe("a2a_operation_latency_seconds", (("operation", operation),), elapsed)
+            return response
+
+        @app.teardown_request
+        def _metrics_done(exc=None):
+            if g.pop('metrics_in_flight', False):
+                self.gauge_add("a2a_requests_in_flight", (), -1)
+
+        if self.directory:
+            self._start_flusher()
+
+    @staticmethod
+    def _operation_of(request):
+        if request.method != 'POST' or not request.is_json:
+            return None
+        # get_json caches the parsed body, so handlers have already paid for this
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return None
+        message = body.get('message')
+        if isinstance(message, dict) and isinstance(message.get('operation'), str):
+            return message['operation']
+        return body.get('operation') if isinstance(body.get('operation'), str) else None
+
+    # -- export ------------------------------------------------------------
+
+    def snapshot(self):
+        """Copy this process's values, including sampled collectors"""
+        with self._lock:
+            snap = {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {k: list(v) for k, v in self._histograms.items()},
+            }
+        for name, fn in self._collectors:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            target = snap["counters"] if self._types.get(name) == "counter" else snap["gauges"]
+            for labels, v in (value.items() if isinstance(value, dict) else [((), value)]):
+                target[(name, labels)] = v
+        return snap
+
+    def render(self):
+        """Prometheus text exposition of this process merged with its sibling workers"""
+        merged = self.snapshot()
+        for snap in self._sibling_snapshots():
+            for kind in ("counters", "gauges"):
+                for key, value in snap[kind].items():
+                    merged[kind][key] = merged[kind].get(key, 0) + value
+            for key, series in snap["histograms"].items():
+                mine = merged["histograms"].get(key)
+                if mine is None or len(mine) != len(series):
+                    merged["histograms"][key] = list(series)
+                else:
+                    merged["histograms"][key] = [a + b for a, b in zip(mine, series)]
+
+        by_name = {}
+        for kind in ("counters", "gauges", "histograms"):
+            for (name, labels), value in merged[kind].items():
+                by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind = self._types.get(name, "untyped")
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if kind == "histogram":
+                    lines.extend(self._render_histogram(name, labels, value))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(self, name, labels, series):
+        buckets = self._buckets.get(name, LATENCY_BUCKETS)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], series[:-1]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {series[-1]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+    # -- multi-process support -----------------------------------------------
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{self.agent}-{pid}.json")
+
+    def flush(self):
+        """Write this process's snapshot atomically for sibling workers to read"""
+        if not self.directory:
+            return
+        snap = self.snapshot()
+        encoded = {kind: [[name, [list(p) for p in labels], value] for (name, labels), value in snap[kind].items()]
+                   for kind in snap}
+        tmp = self._path(os.getpid()) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(encoded, f)
+        os.replace(tmp, self._path(os.getpid()))
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        self._flusher = threading.Thread(target=loop, name="metrics-flusher", daemon=True)
+        self._flusher.start()
+
+    def _sibling_snapshots(self):
+        if not self.directory:
+            return []
+        prefix = f"{self.agent}-"
+        snaps = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith(prefix) and filename.endswith(".json")):
+                continue
+            try:
+                pid = int(filename[len(prefix):-len(".json")])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    encoded = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snap = {kind: {(name, tuple(tuple(p) for p in labels)): value for name, labels, value in encoded.get(kind, [])}
+                    for kind in ("counters", "gauges", "histograms")}
+            if not _pid_alive(pid):
+                # Counters and histograms of exited workers stay; their live gauges do not
+                snap["gauges"] = {}
+            snaps.append(snap)
+        return snaps
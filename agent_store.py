@@ -0,0 +1,236 @@
+"""
+Durable local store for agent state that should survive restarts
+One SQLite file per agent in WAL mode holds namespaced JSON values (config, jobs, cached results).
+Request threads only enqueue writes; a background writer applies them in batched transactions, and
+warm restarts reload the hottest entries
+"""
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL,
+    updated REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+_PUT = ("INSERT INTO entries (namespace, key, value, expires, updated) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires, updated = excluded.updated")
+_HIT = "UPDATE entries SET hits = hits + ? WHERE namespace = ? AND key = ?"
+_DELETE = "DELETE FROM entries WHERE namespace = ? AND key = ?"
+
+
+class AgentStore:
+    """Write-behind SQLite store; a store with no path keeps nothing and loads nothing"""
+
+    def __init__(self, path, batch_size=256, flush_interval=0.05):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(SCHEMA)
+                conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            self._writer = threading.Thread(target=self._run, name="agent-store-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, agent):
+        directory = os.getenv('AGENT_STORE_DIR', 'data')
+        return cls(os.path.join(directory, f"{agent}.sqlite3") if directory else None)
+
+    @property
+    def enabled(self):
+        return self._writer is not None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL + NORMAL: a commit survives a process crash; only an OS crash can lose the last batch
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -- write path (non-blocking) -------------------------------------------
+
+    def put(self, namespace, key, value, ttl=None):
+        if self.enabled:
+            expires = time.time() + ttl if ttl else None
+            self._queue.put(("put", namespace, key, value, expires))
+
+    def hit(self, namespace, key):
+        if self.enabled:
+            self._queue.put(("hit", namespace, key))
+
+    def delete(self, namespace, key):
+        if self.enabled:
+            self._queue.put(("delete", namespace, key))
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(op is None for op in batch)
+            self._apply(conn, [op for op in batch if op is not None and op[0] != "sync"])
+            for op in batch:
+                if op is not None and op[0] == "sync":
+                    op[1].set()
+            if stop:
+                conn.close()
+                return
+
+    def _apply(self, conn, ops):
+        # Later writes to a key win, and repeated hits collapse into one update
+        puts, hits, deletes = OrderedDict(), {}, set()
+        now = time.time()
+        for op in ops:
+            if op[0] == "put":
+                _, namespace, key, value, expires = op
+                deletes.discard((namespace, key))
+                puts[(namespace, key)] = (value, expires)
+            elif op[0] == "hit":
+                hits[op[1:]] = hits.get(op[1:], 0) + 1
+            else:
+                puts.pop(op[1:], None)
+                deletes.add(op[1:])
+        try:
+            with conn:
+                conn.executemany(_PUT, [(ns, key, json.dumps(value, default=str), expires, now)
+                                        for (ns, key), (value, expires) in puts.items()])
+                conn.executemany(_HIT, [(n, ns, key) for (ns, key), n in hits.items()])
+                conn.executemany(_DELETE, list(deletes))
+            self.written += len(ops)
+        except Exception as e:
+            # Drop this batch only; the writer must keep running for the next one
+            self.failed += len(ops)
+            print(f"⚠️ Agent store dropped a batch of {len(ops)} writes: {e!r}")
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is written"""
+        if not self.enabled or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(("sync", done))
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    # -- read path (startup) -------------------------------------------------
+
+    def load(self, namespace, limit=None):
+        """Live entries of a namespace, hottest and most recent first, as [(key, value)]"""
+        if not self.path:
+            return []
+        sql = ("SELECT key, value FROM entries WHERE namespace = ? AND (expires IS NULL OR expires > ?) "
+               "ORDER BY hits DESC, updated DESC")
+        params = [namespace, time.time()]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return []
+        entries = []
+        for key, value in rows:
+            try:
+                entries.append((key, json.loads(value)))
+            except ValueError:
+                continue
+        return entries
+
+    def stats(self):
+        return {"path": self.path, "queued": self._queue.qsize(), "written": self.written, "failed": self.failed}
+
+
+class ResultCache:
+    """In-memory LRU of successful operation results, mirrored to the store and reloaded on start
+    (only operations registered as cacheable use it; their results are pure functions of their input,
+    so entries never go stale)"""
+
+    NAMESPACE = "result"
+
+    def __init__(self, store, capacity=4096, max_key_length=4096):
+        self.store = store
+        self.capacity = capacity
+        self.max_key_length = max_key_length
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        for key, value in reversed(store.load(self.NAMESPACE, capacity)):
+            self._entries[key] = value
+        self.warmed = len(self._entries)
+
+    @classmethod
+    def from_env(cls, store):
+        return cls(store, capacity=int(os.getenv('RESULT_CACHE_SIZE', 4096)),
+                   max_key_length=int(os.getenv('RESULT_CACHE_MAX_KEY', 4096)))
+
+    def cacheable(self, key):
+        return self.capacity > 0 and key is not None and len(key) <= self.max_key_length
+
+    def get(self, key):
+        if not self.cacheable(key):
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self.store.hit(self.NAMESPACE, key)
+        # Callers annotate results, so each gets its own top-level dict
+        return dict(value)
+
+    def put(self, key, value):
+        if not self.cacheable(key):
+            return
+        evicted = []
+        with self._lock:
+            self._entries[key] = dict(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                evicted.append(self._entries.popitem(last=False)[0])
+        self.store.put(self.NAMESPACE, key, value)
+        # Keep the file the size of the cache rather than of everything ever computed
+        for old in evicted:
+            self.store.delete(self.NAMESPACE, old)
+
+    def stats(self):
+        return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "warmed": self.warmed}
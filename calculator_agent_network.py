@@ -7,12 +7,38 @@ Port: 5001
 import math
 import json
 import socket
+import sys
+import time
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_cors import CORS
 import requests
 import os
 from dotenv import load_dotenv
+from single_flight import SingleFlight
+import hop_timing
+import deadline
+import operation_registry
+import wire
+import local_transport
+import shared_array
+import stream_chain
+from stream_chain import StreamHop
+import priority
+import rate_limit
+from rate_limit import RateLimiter
+import admission
+from admission import AdmissionController
+from agent_metrics import AgentMetrics
+from agent_client import AgentClient
+from circuit_breaker import CircuitOpenError
+from jobs import JobManager, JobQueueFull
+from agent_store import AgentStore, ResultCache
+import agent_logging
+from agent_logging import StructuredLogger
+from cost_control import CostGuard
+from operation_registry import OperationRegistry
+from expression_engine import compile_expression, ExpressionError, cache_stats as expression_cache_stats
 
 # Load environment variables
 load_dotenv()
@@ -29,11 +55,29 @@ class NetworkCalculatorAgent:
         stats_port = os.getenv('STATISTICS_PORT', 5003)
         self.unit_converter_url = os.getenv('UNIT_CONVERTER_URL') or f"http://{unit_host}:{unit_port}"
         self.statistics_url = os.getenv('STATISTICS_URL') or f"http://{stats_host}:{stats_port}"
+        self.cost_guard = CostGuard.from_env()
+        self.operations = self._register_operations()
         print(f"🧮 Calculator Agent initialized")
         print(f"📍 My IP: {self.my_ip}:{self.port}")
         print(f"🔗 Unit Converter: {self.unit_converter_url}")
         print(f"📊 Statistics Agent: {self.statistics_url}")
         
+    def _register_operations(self):
+        numbers = (("numbers", "list", []),)
+        ops = OperationRegistry()
+        ops.register("add", self.add, numbers, "linear", self._add_vector, "Sum of numbers")
+        ops.register("subtract", self.subtract, numbers, "linear", self._subtract_vector, "First number minus the rest")
+        ops.register("multiply", self.multiply, numbers, "bigint", self._multiply_vector, "Product of numbers",
+                     cacheable=True)
+        ops.register("divide", self.divide, numbers, "linear", self._divide_vector, "First number divided by the rest")
+        ops.register("power", self.power, (("base", "number", 0), ("exponent", "number", 0)), "bigint",
+                     self._power_vector, "base ** exponent", cacheable=True)
+        ops.register("square_root", self.square_root, (("number", "number", 0),), "constant",
+                     self._square_root_vector, "Square root of number")
+        ops.register("percentage", self.percentage, (("value", "number", 0), ("percentage", "number", 0)), "constant",
+                     self._percentage_vector, "percentage % of value")
+        return ops
+
     def get_local_ip(self):
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
@@ -61,10 +105,11 @@ class NetworkCalculatorAgent:
     
     def multiply(self, numbers):
         try:
-            result = 1
-            for num in numbers:
-                result *= num
-            return {"success": True, "result": result, "operation": "multiplication"}
+            result, mode = self.cost_guard.product(numbers)
+            response = {"success": True, "result": result, "operation": "multiplication"}
+            if mode != "exact":
+                response["evaluation"] = mode
+            return response
         except Exception as e:
             return {"success": False, "error": f"Multiplication failed: {str(e)}"}
     
@@ -81,8 +126,11 @@ class NetworkCalculatorAgent:
     
     def power(self, base, exponent):
         try:
-            result = base ** exponent
-            return {"success": True, "result": result, "operation": f"power ({base}^{exponent})"}
+            result, mode = self.cost_guard.power(base, exponent)
+            response = {"success": True, "result": result, "operation": f"power ({base}^{exponent})"}
+            if mode != "exact":
+                response["evaluation"] = mode
+            return response
         except Exception as e:
             return {"success": False, "error": f"Power calculation failed: {str(e)}"}
     
@@ -102,33 +150,77 @@ class NetworkCalculatorAgent:
         except Exception as e:
             return {"success": False, "error": f"Percentage calculation failed: {str(e)}"}
     
-    def process_request(self, operation, data):
-        if operation == "add":
-            return self.add(data.get("numbers", []))
-        elif operation == "subtract":
-            return self.subtract(data.get("numbers", []))
-        elif operation == "multiply":
-            return self.multiply(data.get("numbers", []))
-        elif operation == "divide":
-            return self.divide(data.get("numbers", []))
-        elif operation == "power":
-            return self.power(data.get("base", 0), data.get("exponent", 0))
-        elif operation == "square_root":
-            return self.square_root(data.get("number", 0))
-        elif operation == "percentage":
-            return self.percentage(data.get("value", 0), data.get("percentage", 0))
-        else:
-            return {"success": False, "error": f"Unknown operation: {operation}"}
+    # Vectorized variants apply the operation to many chain values at once, each value as the first operand
+    def _add_vector(self, values, data):
+        offset = sum(data.get("numbers", []))
+        return [v + offset for v in values]
+
+    def _subtract_vector(self, values, data):
+        offset = sum(data.get("numbers", []))
+        return [v - offset for v in values]
+
+    def _multiply_vector(self, values, data):
+        factor = math.prod(data.get("numbers", []))
+        return [v * factor for v in values]
+
+    def _divide_vector(self, values, data):
+        divisor = math.prod(data.get("numbers", []))
+        if divisor == 0:
+            raise ZeroDivisionError("Division by zero not allowed")
+        return [v / divisor for v in values]
+
+    def _power_vector(self, values, data):
+        exponent = float(data.get("exponent", 0))
+        return [float(v) ** exponent for v in values]
+
+    def _square_root_vector(self, values, data):
+        return [math.sqrt(v) for v in values]
+
+    def _percentage_vector(self, values, data):
+        scale = data.get("percentage", 0) / 100
+        return [v * scale for v in values]
+
+    def process_request(self, operation, data, coalescer=None):
+        return self.operations.dispatch(operation, data, coalescer)
 
 app = Flask(__name__)
 CORS(app)
+wire.install(app)
 calculator = NetworkCalculatorAgent()
+hop_timing.install(app, f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}")
+deadline.install(app)
+metrics = AgentMetrics(calculator.agent_id)
+metrics.instrument(app, calculator.operations)
+operation_registry.install(app, calculator.operations)
+rate_limiter = rate_limit.install(app, RateLimiter.from_env(metrics))
+admission_control = admission.install(app, AdmissionController.from_env(metrics))
+metrics.register_collector("a2a_coalesced_requests_total", "counter", "Requests that shared another request's in-flight result",
+                           lambda: coalescer.stats()["coalesced"])
+metrics.register_collector("a2a_cost_decisions_total", "counter", "Big-number cost guard decisions",
+                           lambda: {(("decision", k),): v for k, v in calculator.cost_guard.stats().items() if k in ("cheap", "heavy", "downgraded", "rejected")})
+client = AgentClient(calculator.agent_id, metrics)
+log = agent_logging.install(app, StructuredLogger.from_env(calculator.agent_id))
+metrics.register_collector("a2a_log_records_total", "counter", "Structured log records by outcome",
+                           lambda: {(("state", k),): v for k, v in log.stats().items() if k != "queued"})
+coalescer = SingleFlight()
+store = AgentStore.from_env(calculator.agent_id)
+calculator.operations.cache = result_cache = ResultCache.from_env(store)
+stream_hop = stream_chain.install(app, StreamHop.from_env(calculator.agent_id, calculator.operations, client))
+metrics.register_collector("a2a_result_cache_total", "counter", "Result cache lookups by outcome",
+                           lambda: {(("outcome", "hit"),): result_cache.hits, (("outcome", "miss"),): result_cache.misses})
+job_manager = JobManager.from_env(calculator.agent_id, client, store)
+metrics.register_collector("a2a_jobs", "gauge", "Asynchronous /message jobs by status",
+                           lambda: {(("status", k),): v for k, v in job_manager.stats()["jobs"].items()})
+
+EXPRESSION_OPERATIONS = {op.name: op.handler for op in calculator.operations}
 
 AGENT_CONFIG = {
     "calculator_url": f"http://{calculator.my_ip}:{calculator.port}",
     "unit_url": calculator.unit_converter_url,
     "statistics_url": calculator.statistics_url,
 }
+# Peer URLs set through PUT /config/agents outlive a restart
+AGENT_CONFIG.update({k: v for k, v in store.load("config") if k in AGENT_CONFIG and isinstance(v, str) and v})
 
 def _inject_result_for_next(operation: str, data: dict, local_result):
     data = dict(data or {})
@@ -140,6 +232,37 @@ def _inject_result_for_next(operation: str, data: dict, local_result):
             data['numbers'] = [local_result] + nums
     return data
 
+def _hop_name():
+    return f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"
+
+def _destination_for(url):
+    """Metric label for an outbound URL: the configured agent name, else host:port"""
+    for key, name in (("unit_url", "unit_converter"), ("statistics_url", "statistics"), ("calculator_url", "calculator")):
+        if url.startswith(AGENT_CONFIG[key]):
+            return name
+    return AgentClient.destination_of(url)
+
+def _post_hop(url, payload, target, operation):
+    """POST one chain hop, timing serialization and downstream wait separately"""
+    timer = hop_timing.current()
+    destination = _destination_for(url)
+    with timer.phase("serialize_ms"):
+        body, headers = client.wire.encode(destination, payload)
+    with timer.call(target, operation) as call:
+        resp = client.post(url, destination=destination, data=body, operation=operation,
+                           headers=headers, timeout=10)
+        if resp.status_code == 504:
+            raise deadline.DeadlineExceeded(target)
+        resp.raise_for_status()
+    with timer.phase("serialize_ms"):
+        result = wire.decode_response(resp)
+    call["timing"] = hop_timing.remote_tree(result)
+    return result, call
+
+def _step_timing(call):
+    return {"wait_ms": call["wait_ms"], "network_ms": hop_timing.network_ms(call),
+            "remote_ms": (call["timing"] or {}).get("total_ms")}
+
 # Orchestrated forwarding to collect per-step outputs
 def _forward_chain(next_hop: dict, incoming: dict, local_result, trace: list, steps: list):
     if not next_hop or not isinstance(next_hop, dict):
@@ -152,28 +275,33 @@ def _forward_chain(next_hop: dict, incoming: dict, local_result, trace: list, st
             "timestamp": datetime.now().isoformat(),
             "steps": steps,
             "final": local_result,
+            "timing": hop_timing.timing_tree(hop_timing.current()),
         }
 
     url = next_hop.get('url')
-    handoff = next_hop.get('handoff', {})
-    next_next = next_hop.get('next')
+    payload, target, operation = _hop_payload(next_hop, incoming, local_result, trace)
+    body, call = _post_hop(url, payload, target, operation)
+    next_result = body.get('response', {}).get('result')
+    if target == 'unknown_agent':
+        call["target"] = body.get('agent', target)
+    steps.append({
+        "agent": body.get('agent', target),
+        "operation": body.get('response', {}).get('operation'),
+        "result": next_result,
+        "timing": _step_timing(call)
+    })
+    return _forward_chain(next_hop.get('next'), incoming, next_result, trace + [_hop_name()], steps)
 
+def _hop_payload(next_hop: dict, incoming: dict, local_result, trace: list):
+    """Request body, target agent and operation for the hop that receives local_result"""
+    url = next_hop.get('url')
+    handoff = next_hop.get('handoff', {})
     if url and url.rstrip('/').endswith('/convert'):
-        payload = {
+        return {
             "value": local_result,
             "from_unit": handoff.get('from_unit') or handoff.get('from') or handoff.get('fromUnit'),
             "to_unit": handoff.get('to_unit') or handoff.get('to') or handoff.get('toUnit')
-        }
-        resp = requests.post(url, json=payload, timeout=10)
-        resp.raise_for_status()
-        body = resp.json()
-        next_result = body.get('response', {}).get('result')
-        steps.append({
-            "agent": body.get('agent', 'unit_converter_agent'),
-            "operation": body.get('response', {}).get('operation'),
-            "result": next_result
-        })
-        return _forward_chain(next_next, incoming, next_result, trace + [f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"], steps)
+        }, 'unit_converter_agent', 'convert'
 
     # Default: call /message without passing nested next; orchestrate locally for step collection
     message = handoff if isinstance(handoff, dict) else {}
@@ -182,20 +310,16 @@ def _forward_chain(next_hop: dict, incoming: dict, local_result, trace: list, st
     data = _inject_result_for_next(op or '', data, local_result)
     envelope = {
         "sender": calculator.agent_id,
+        "origin": incoming.get('origin') or incoming.get('sender'),
         "correlation_id": incoming.get('correlation_id'),
-        "trace": trace + [f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"],
+        "trace": trace + [_hop_name()],
         "message": {"operation": op, "data": data}
     }
-    resp = requests.post(url, json=envelope, timeout=10)
-    resp.raise_for_status()
-    body = resp.json()
-    next_result = body.get('response', {}).get('result')
-    steps.append({
-        "agent": body.get('agent', 'unknown_agent'),
-        "operation": body.get('response', {}).get('operation'),
-        "result": next_result
-    })
-    return _forward_chain(next_next, incoming, next_result, trace + [f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"], steps)
+    if deadline.current() is not None:
+        envelope["deadline_ms"] = deadline.remaining_ms()
+    if priority.current() is not None:
+        envelope["priority"] = priority.current()
+    return envelope, 'unknown_agent', op
 
 @app.route('/', methods=['GET'])
 def index():
@@ -210,6 +334,7 @@ def config_agents():
         for k in ["calculator_url", "unit_url", "statistics_url"]:
             if k in data and isinstance(data[k], str) and data[k]:
                 AGENT_CONFIG[k] = data[k].rstrip('/')
+                store.put("config", k, AGENT_CONFIG[k])
         return jsonify({"ok": True, "config": AGENT_CONFIG})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 400
@@ -219,7 +344,7 @@ def config_test():
     results = {}
     for key, base in AGENT_CONFIG.items():
         try:
-            r = requests.get(f"{base}/health", timeout=5)
+            r = client.get(f"{base}/health", destination=_destination_for(base), timeout=5, operation="health")
             results[key] = {"ok": r.status_code == 200}
         except Exception as e:
             results[key] = {"ok": False, "error": str(e)}
@@ -236,11 +361,24 @@ def route_proxy():
             return jsonify({"error": "invalid target"}), 400
         base = AGENT_CONFIG["calculator_url" if target == "calculator" else ("unit_url" if target == "unit" else "statistics_url")]
         url = f"{base}{endpoint if endpoint.startswith('/') else '/' + endpoint}"
-        resp = requests.post(url, json=payload, timeout=15)
-        return jsonify(resp.json()), resp.status_code
+        operation = (payload.get('message') or {}).get('operation') if isinstance(payload, dict) else None
+        resp = client.post(url, destination="unit_converter" if target == "unit" else target, envelope=payload,
+                           timeout=15, operation=operation or endpoint)
+        return jsonify(wire.decode_response(resp)), resp.status_code
+    except CircuitOpenError as e:
+        return jsonify({"error": f"proxy failed: {str(e)}"}), 503, {"Retry-After": str(max(1, round(e.retry_after)))}
     except requests.RequestException as e:
         return jsonify({"error": f"proxy failed: {str(e)}"}), 502
 
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    """Operations supported by this agent, generated from its registry"""
+    return jsonify({
+        "agent": "calculator_agent",
+        "operations": calculator.operations.capabilities(),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
@@ -252,9 +390,28 @@ def health_check():
         "connected_agents": {
             "unit_converter": calculator.unit_converter_url,
             "statistics": calculator.statistics_url
-        }
+        },
+        "coalescing": coalescer.stats(),
+        "admission": admission_control.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "jobs": job_manager.stats(),
+        "result_cache": result_cache.stats(),
+        "store": store.stats(),
+        "streams": stream_hop.stats(),
+        "wire": client.wire.stats(),
+        "transport": client.transport.stats(),
+        "shared_memory": shared_array.stats(),
+        "cost_control": calculator.cost_guard.stats(),
+        "expression_cache": expression_cache_stats(),
+        "circuit_breakers": client.breakers.stats(),
+        "peer_latency": client.latency_stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition for this agent (all worker processes)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/network-info', methods=['GET'])
 def network_info():
     """Return network information for debugging"""
@@ -281,8 +438,8 @@ def calculate():
         operation = data.get('operation')
         request_data = data.get('data', {})
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        print(f"📨 Calculation request from {client_ip}: {operation}")
-        result = calculator.process_request(operation, request_data)
+        result = calculator.process_request(operation, request_data, coalescer)
+        log.info("calculate.success" if result.get('success') else "calculate.failure", client_ip=client_ip, operation=operation)
         return jsonify({
             "agent": "calculator_agent",
             "server_ip": calculator.my_ip,
@@ -297,35 +454,273 @@ def calculate():
             "timestamp": datetime.now().isoformat()
         }), 400
 
-@app.route('/message', methods=['POST'])
-def receive_message():
+@app.route('/evaluate', methods=['POST'])
+def evaluate_expression():
+    """Evaluate an arithmetic expression against one or many variable bindings"""
     try:
-        incoming = request.get_json()
-        sender = incoming.get('sender', 'unknown')
-        message = incoming.get('message', {})
-        next_hop = incoming.get('next')
+        data = request.get_json()
+        expression = data.get('expression')
+        bindings = data.get('bindings')
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        print(f"🤖 Message from {sender} ({client_ip})")
-        operation = message.get('operation')
-        request_data = message.get('data', {})
-        local = calculator.process_request(operation, request_data)
-        steps = [
-            {"agent": calculator.agent_id, "operation": operation, "result": local.get('result')}
-        ] if local.get('success') else []
-        if next_hop and local.get('success'):
-            aggregated = _forward_chain(next_hop, incoming, local.get('result'), incoming.get('trace', []), steps)
-            return jsonify(aggregated)
+        log.info("evaluate.request", client_ip=client_ip, expression=expression)
+        if bindings is not None and not (isinstance(bindings, list) and all(isinstance(b, dict) for b in bindings)):
+            raise ExpressionError("bindings must be a list of objects")
+        plan = compile_expression(expression)
+        results = []
+        for variables in (bindings if bindings is not None else [data.get('variables') or {}]):
+            try:
+                results.append({"success": True, "result": plan.evaluate(EXPRESSION_OPERATIONS, variables)})
+            except (ExpressionError, ArithmeticError, TypeError) as e:
+                results.append({"success": False, "error": f"Evaluation failed: {str(e)}"})
+        if bindings is None:
+            response = results[0]
+        else:
+            response = {"success": all(r["success"] for r in results), "results": results, "count": len(results)}
         return jsonify({
             "agent": "calculator_agent",
             "server_ip": calculator.my_ip,
-            "sender": sender,
-            "response": local,
-            "correlation_id": incoming.get('correlation_id'),
-            "trace": incoming.get('trace', []) + [f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"],
-            "steps": steps,
-            "final": local.get('result') if local.get('success') else None,
+            "request": data,
+            "response": response,
+            "plan": plan.to_dict(),
             "timestamp": datetime.now().isoformat()
         })
+    except Exception as e:
+        return jsonify({
+            "agent": "calculator_agent",
+            "error": f"Request processing failed: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+def _deadline_response(incoming, steps, timer):
+    return {
+        "agent": "calculator_agent",
+        "error": "Deadline exceeded",
+        "correlation_id": incoming.get('correlation_id'),
+        "steps": steps,
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    }, 504, {}
+
+def _process_envelope(incoming, timer, client_ip):
+    """Run one A2A envelope (local step plus any chain); returns (body, status, headers)"""
+    if isinstance(incoming.get('batch'), list):
+        return _process_batch(incoming, timer, client_ip)
+    sender = incoming.get('sender', 'unknown')
+    message = incoming.get('message', {})
+    next_hop = incoming.get('next')
+    operation = message.get('operation')
+    request_data = message.get('data', {})
+    if deadline.expired():
+        log.info("message.deadline_exceeded", sender=sender, operation=operation)
+        return _deadline_response(incoming, [deadline.aborted_step(calculator.agent_id, operation, "compute")], timer)
+    with timer.phase("compute_ms"):
+        local = calculator.process_request(operation, request_data, coalescer)
+    log.info("message.success" if local.get('success') else "message.failure",
+             sender=sender, client_ip=client_ip, operation=operation, chained=bool(next_hop))
+    steps = [
+        {"agent": calculator.agent_id, "operation": operation, "result": local.get('result'),
+         "timing": {"compute_ms": timer.phases["compute_ms"]}}
+    ] if local.get('success') else []
+    if next_hop and local.get('success'):
+        try:
+            aggregated = _forward_chain(next_hop, incoming, local.get('result'), incoming.get('trace', []), steps)
+        except CircuitOpenError as e:
+            # Fail fast with the steps completed so far instead of waiting on a peer known to be down
+            log.warning("chain.circuit_open", destination=e.destination)
+            return {
+                "agent": "calculator_agent",
+                "error": f"Chain aborted: {str(e)}",
+                "correlation_id": incoming.get('correlation_id'),
+                "steps": steps,
+                "timing": hop_timing.timing_tree(timer),
+                "timestamp": datetime.now().isoformat()
+            }, 503, {"Retry-After": str(max(1, round(e.retry_after)))}
+        except deadline.DeadlineExceeded as e:
+            log.info("chain.deadline_exceeded", stage=e.stage)
+            return _deadline_response(incoming, steps + [deadline.aborted_step(calculator.agent_id, "forward", e.stage)], timer)
+        return aggregated, 200, {}
+    return {
+        "agent": "calculator_agent",
+        "server_ip": calculator.my_ip,
+        "sender": sender,
+        "response": local,
+        "correlation_id": incoming.get('correlation_id'),
+        "trace": incoming.get('trace', []) + [f"{calculator.agent_id}@{calculator.my_ip}:{calculator.port}"],
+        "steps": steps,
+        "final": local.get('result') if local.get('success') else None,
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    }, 200, {}
+
+MESSAGE_BATCH_MAX = int(os.getenv('MESSAGE_BATCH_MAX', 1000))
+
+def _process_batch(incoming, timer, client_ip):
+    """Run independent envelopes together: every first step here, then each later stage as one
+    batched request per destination, so N chains of k hops cost k round-trips instead of N x k"""
+    envelopes = incoming['batch']
+    if len(envelopes) > MESSAGE_BATCH_MAX:
+        return {"agent": "calculator_agent", "error": f"Batch too large: {len(envelopes)} > {MESSAGE_BATCH_MAX}"}, 413, {}
+    if deadline.expired():
+        return _deadline_response(incoming, [deadline.aborted_step(calculator.agent_id, "batch", "compute")], timer)
+    chains = []
+    with timer.phase("compute_ms"):
+        for envelope in envelopes:
+            envelope = envelope if isinstance(envelope, dict) else {}
+            # Items inherit the batch's sender so forwarded hops are attributed to the original client
+            envelope.setdefault('origin', incoming.get('origin') or incoming.get('sender'))
+            message = envelope.get('message') or {}
+            operation = message.get('operation')
+            local = calculator.process_request(operation, message.get('data', {}), coalescer)
+            chain = {"envelope": envelope, "response": local, "result": local.get('result'),
+                     "trace": envelope.get('trace', []) + [_hop_name()], "steps": [], "next": None}
+            if local.get('success'):
+                chain["steps"].append({"agent": calculator.agent_id, "operation": operation, "result": local.get('result')})
+                chain["next"] = envelope.get('next')
+            else:
+                chain["error"] = local.get('error')
+            chains.append(chain)
+    round_trips = 0
+    while True:
+        # One stage: every chain still running has exactly one next hop; group them by destination
+        groups = {}
+        for chain in chains:
+            hop = chain["next"]
+            if isinstance(hop, dict) and hop.get('url'):
+                groups.setdefault(hop['url'], []).append(chain)
+            else:
+                chain["next"] = None
+        if not groups:
+            break
+        for url, members in groups.items():
+            round_trips += _batched_hop(url, members)
+    log.info("message.batch", sender=incoming.get('sender', 'unknown'), client_ip=client_ip,
+             chains=len(chains), failed=sum(1 for c in chains if "error" in c), round_trips=round_trips)
+    return {
+        "agent": "calculator_agent",
+        "server_ip": calculator.my_ip,
+        "sender": incoming.get('sender', 'unknown'),
+        "correlation_id": incoming.get('correlation_id'),
+        "batch": [{
+            "correlation_id": chain["envelope"].get('correlation_id'),
+            "response": chain["response"],
+            "trace": chain["trace"],
+            "steps": chain["steps"],
+            "final": chain["result"] if "error" not in chain else None,
+            **({"error": chain["error"]} if "error" in chain else {}),
+        } for chain in chains],
+        "count": len(chains),
+        "round_trips": round_trips,
+        "timing": hop_timing.timing_tree(timer),
+        "timestamp": datetime.now().isoformat()
+    }, 200, {}
+
+def _batched_hop(url, members):
+    """Advance every chain in members through the hop at url with one request; falls back to one request
+    per chain when the peer does not understand batches. Returns the number of round-trips made"""
+    items, target, operation = [], None, None
+    for chain in members:
+        payload, target, operation = _hop_payload(chain["next"], chain["envelope"], chain["result"], chain["trace"][:-1])
+        items.append(payload)
+    envelope = {"sender": calculator.agent_id, "origin": members[0]["envelope"].get('origin'), "batch": items}
+    if deadline.current() is not None:
+        envelope["deadline_ms"] = deadline.remaining_ms()
+    if priority.current() is not None:
+        envelope["priority"] = priority.current()
+    try:
+        body, call = _post_hop(url, envelope, target, f"batch:{operation}")
+        results = body.get('batch')
+        if not isinstance(results, list) or len(results) != len(items):
+            raise ValueError(f"{url} did not answer with a batch")
+        call["target"] = body.get('agent', target)
+    except (CircuitOpenError, deadline.DeadlineExceeded) as e:
+        for chain in members:
+            _fail_chain(chain, e)
+        return 1
+    except (requests.RequestException, ValueError) as e:
+        log.info("batch.unsupported", destination=_destination_for(url), error=str(e))
+        for chain, item in zip(members, items):
+            try:
+                body, call = _post_hop(url, item, target, operation)
+                _advance_chain(chain, body, call, body.get('agent', target))
+            except Exception as error:
+                _fail_chain(chain, error)
+        return 1 + len(members)
+    for chain, result in zip(members, results):
+        _advance_chain(chain, result if isinstance(result, dict) else {}, call, body.get('agent', target), len(items))
+    return 1
+
+def _advance_chain(chain, body, call, agent, batched=None):
+    response = body.get('response') or {}
+    if response.get('result') is None:
+        _fail_chain(chain, response.get('error') or body.get('error') or "no result")
+        return
+    step = {"agent": agent, "operation": response.get('operation'), "result": response['result'], "timing": _step_timing(call)}
+    if batched:
+        step["batched"] = batched
+    chain["steps"].append(step)
+    chain["result"] = response['result']
+    chain["trace"] = chain["trace"] + [_hop_name()]
+    chain["next"] = chain["next"].get('next')
+
+def _fail_chain(chain, error):
+    chain["error"] = f"Chain aborted at {chain['next'].get('url')}: {error}"
+    chain["next"] = None
+
+def _wants_async(incoming):
+    return bool(incoming.get('async')) or 'respond-async' in request.headers.get('Prefer', '')
+
+def _job_runner(spec):
+    """Build the job body for a persisted spec; the deadline is kept as wall-clock time so it survives a restart"""
+    incoming, client_ip = spec["incoming"], spec.get("client_ip")
+    deadline_at = spec.get("deadline_at")
+
+    def run():
+        if deadline_at is not None:
+            deadline.restore(deadline.Deadline.after_ms(max(deadline_at - time.time(), 0) * 1000))
+        priority.set_current(spec.get("priority"))
+        agent_logging.bind_correlation_id(incoming.get('correlation_id'))
+        body, status, _ = _process_envelope(incoming, hop_timing.start(_hop_name()), client_ip)
+        return body, status
+
+    return run
+
+def _submit_job(incoming, client_ip):
+    """Queue the envelope on the job executor and answer 202 with where to poll"""
+    budget, correlation_id = deadline.current(), incoming.get('correlation_id')
+    spec = {
+        "incoming": incoming,
+        "client_ip": client_ip,
+        "deadline_at": time.time() + budget.remaining() if budget is not None else None,
+        "priority": priority.current(),
+    }
+    try:
+        job = job_manager.submit(_job_runner(spec), incoming.get('callback_url'), correlation_id, spec)
+    except JobQueueFull as e:
+        return jsonify({"agent": "calculator_agent", "error": f"Job queue full: {str(e)}"}), 503, {"Retry-After": "1"}
+    log.info("job.submitted", job_id=job["job_id"], callback=bool(job["callback_url"]))
+    status_url = f"/jobs/{job['job_id']}"
+    return jsonify({
+        "agent": "calculator_agent",
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": status_url,
+        "correlation_id": correlation_id,
+        "timestamp": datetime.now().isoformat()
+    }), 202, {"Location": status_url}
+
+@app.route('/message', methods=['POST'])
+def receive_message():
+    try:
+        timer = hop_timing.current()
+        with timer.phase("serialize_ms"):
+            incoming = request.get_json()
+        client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+        agent_logging.bind_correlation_id(incoming.get('correlation_id'))
+        deadline.bind(incoming)
+        if _wants_async(incoming):
+            return _submit_job(incoming, client_ip)
+        body, status, headers = _process_envelope(incoming, timer, client_ip)
+        return jsonify(body), status, headers
     except Exception as e:
         return jsonify({
             "agent": "calculator_agent",
@@ -333,6 +728,17 @@ def receive_message():
             "timestamp": datetime.now().isoformat()
         }), 400
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and, once finished, the result of an asynchronous /message job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"agent": "calculator_agent", "error": f"Unknown or expired job: {job_id}"}), 404
+    return jsonify(job)
+
+# Jobs unfinished at the last shutdown run again; finished ones stay pollable until their TTL
+log.info("jobs.restored", requeued=job_manager.restore(_job_runner), retained=sum(job_manager.stats()["jobs"].values()))
+
 def test_network_connectivity():
     print("\n🌐 Testing Network Connectivity...")
     agents_to_test = {
@@ -363,8 +769,13 @@ def test_agent():
 
 if __name__ == '__main__':
     print("🧮 Network Calculator Agent Starting...")
+    # CPython refuses to format ints longer than its int_max_str_digits; raise it to the cost budget
+    limit = sys.get_int_max_str_digits() if hasattr(sys, 'get_int_max_str_digits') else 0
+    if limit and limit < calculator.cost_guard.max_result_digits:
+        sys.set_int_max_str_digits(calculator.cost_guard.max_result_digits)
     test_agent()
     test_network_connectivity()
     print(f"\n🚀 Server starting on {calculator.host}:{calculator.port}")
     print(f"📍 Access from other systems: http://{calculator.my_ip}:{calculator.port}")
+    local_transport.serve(app, calculator.port, reloader=True)
     app.run(host=calculator.host, port=calculator.port, debug=True)
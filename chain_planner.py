@@ -0,0 +1,124 @@
+"""
+Push-down vs. client-orchestrated planning for A2A chains
+A chain can be driven by the client (one round-trip from the client to every agent) or pushed down
+to the Calculator, which forwards each hop itself. Which is cheaper depends on where the client sits:
+the planner compares the client's measured RTT to each agent with the Calculator's observed latency
+to its peers, and remembers the decision for a while
+"""
+
+import json
+import os
+import threading
+import time
+
+ORCHESTRATE = "orchestrate"
+PUSH_DOWN = "push-down"
+
+
+class ChainPlanner:
+    NAMESPACE = "plan"
+
+    def __init__(self, client, store=None, ttl=300, samples=3):
+        self.client = client
+        self.store = store
+        self.ttl = ttl
+        self.samples = samples
+        self._plans = dict(store.load(self.NAMESPACE)) if store is not None else {}
+        self._lock = threading.Lock()
+        self._planning = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client, store=None):
+        return cls(client, store, ttl=float(os.getenv('PLAN_TTL_S', 300)), samples=int(os.getenv('PLAN_SAMPLES', 3)))
+
+    def client_rtt(self, base, destination):
+        """Best-of-N round-trip from here to an agent's /health, in ms (None if unreachable)"""
+        best = None
+        for _ in range(self.samples):
+            started = time.perf_counter()
+            try:
+                self.client.get(f"{base.rstrip('/')}/health", destination=destination, timeout=5, operation="health").raise_for_status()
+            except Exception:
+                return None
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def peer_rtts(self, calc_base, peers):
+        """The Calculator's p50 latency to each peer's /health, in ms, for {destination: base_url}.
+        Peers the Calculator has no samples for are measured through its /config/test first"""
+        base = calc_base.rstrip('/')
+        try:
+            config = self.client.get(f"{base}/config/agents", destination="calculator", timeout=5, operation="config").json()
+        except Exception:
+            return {}
+        configured = {v.rstrip('/') for v in config.values() if isinstance(v, str)}
+        # The Calculator only labels (and /config/test only probes) peers at the URLs it is configured with
+        known = [dest for dest, url in peers.items() if url.rstrip('/') in configured]
+        rtts = {}
+        for attempt in range(self.samples + 1):
+            try:
+                stats = self.client.get(f"{base}/health", destination="calculator", timeout=5, operation="health").json()
+            except Exception:
+                return rtts
+            observed = stats.get("peer_latency", {}).get("peers", {})
+            rtts = {dest: observed[f"{dest}:health"]["p50_ms"] for dest in known if f"{dest}:health" in observed}
+            if len(rtts) == len(known) or attempt == self.samples:
+                return rtts
+            try:
+                self.client.post(f"{base}/config/test", destination="calculator", timeout=15, operation="config_test")
+            except Exception:
+                return rtts
+
+    def plan(self, calc_base, peers):
+        """Decide how to run a chain that starts at the Calculator and visits peers ({destination: base_url}, in order)"""
+        key = _key(calc_base, peers)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        # Concurrent chains (bulk mode) wait for one measurement instead of each probing the agents
+        with self._planning:
+            return self._cached(key) or self._measure(key, calc_base, peers)
+
+    def _cached(self, key):
+        with self._lock:
+            cached = self._plans.get(key)
+        if cached is not None and cached.get("expires", 0) > time.time():
+            return dict(cached, cached=True)
+        return None
+
+    def _measure(self, key, calc_base, peers):
+        client_rtt = {"calculator": self.client_rtt(calc_base, "calculator")}
+        client_rtt.update({dest: self.client_rtt(url, dest) for dest, url in peers.items()})
+        peer_rtt = self.peer_rtts(calc_base, peers)
+        plan = {"client_rtt_ms": _rounded(client_rtt), "peer_rtt_ms": _rounded(peer_rtt)}
+        if None in client_rtt.values() or len(peer_rtt) < len(peers):
+            plan.update(mode=ORCHESTRATE, reason="latency to some agents is unknown")
+        else:
+            # Compute happens on the same agents either way; only the network legs differ
+            orchestrated = sum(client_rtt.values())
+            pushed = client_rtt["calculator"] + sum(peer_rtt.values())
+            mode = PUSH_DOWN if pushed < orchestrated else ORCHESTRATE
+            plan.update(mode=mode, estimated_ms={ORCHESTRATE: round(orchestrated, 3), PUSH_DOWN: round(pushed, 3)},
+                        savings_ms=round(abs(orchestrated - pushed), 3))
+        plan["expires"] = time.time() + self.ttl
+        with self._lock:
+            self._plans[key] = plan
+        if self.store is not None:
+            self.store.put(self.NAMESPACE, key, plan, self.ttl)
+        return dict(plan, cached=False)
+
+    def invalidate(self, calc_base, peers):
+        key = _key(calc_base, peers)
+        with self._lock:
+            known = self._plans.pop(key, None)
+        if known is not None and self.store is not None:
+            self.store.delete(self.NAMESPACE, key)
+
+
+def _key(calc_base, peers):
+    return json.dumps([calc_base.rstrip('/')] + [url.rstrip('/') for url in peers.values()])
+
+
+def _rounded(values):
+    return {k: round(v, 3) if v is not None else None for k, v in values.items()}
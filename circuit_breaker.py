@@ -0,0 +1,153 @@
+"""
+Per-destination circuit breakers for agent-to-agent calls
+A breaker opens when too many recent calls failed or were slow, rejects calls without touching the
+network while open, then lets a few probe calls through (half-open) to decide whether to close again
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a destination whose breaker is open"""
+
+    def __init__(self, destination, retry_after):
+        super().__init__(f"Circuit open for {destination}; retry in {retry_after:.1f}s")
+        self.destination = destination
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Count-based sliding window of call outcomes for one destination"""
+
+    def __init__(self, destination, window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_ms=2000, slow_rate=0.8, open_seconds=10.0, half_open_calls=1):
+        self.destination = destination
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.rejected = 0
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.destination, remaining)
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.destination, 0.0)
+                self._probes += 1
+
+    def record(self, ok, seconds):
+        """Record the outcome of an admitted call"""
+        slow = seconds * 1000 >= self.slow_call_ms
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not ok or slow:
+                    self._trip()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state == OPEN:
+                # A call admitted before the breaker opened finished late
+                return
+            self._outcomes.append((not ok, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_rate:
+                self._trip()
+
+    def cancel(self):
+        """Forget an admitted call whose outcome says nothing about the destination"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def to_dict(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+            retry_after = max(self._opened_at + self.open_seconds - time.monotonic(), 0.0) if self.state == OPEN else 0.0
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "slow_rate": round(slow_calls / calls, 3) if calls else 0.0,
+                "retry_after_s": round(retry_after, 3),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class BreakerBoard:
+    """One breaker per destination, created on first use with shared settings"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            window=int(os.getenv('BREAKER_WINDOW', 20)),
+            min_calls=int(os.getenv('BREAKER_MIN_CALLS', 5)),
+            failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', 0.5)),
+            slow_call_ms=float(os.getenv('BREAKER_SLOW_MS', 2000)),
+            slow_rate=float(os.getenv('BREAKER_SLOW_RATE', 0.8)),
+            open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', 10)),
+            half_open_calls=int(os.getenv('BREAKER_HALF_OPEN_CALLS', 1)),
+        )
+
+    def get(self, destination):
+        breaker = self._breakers.get(destination)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(destination, CircuitBreaker(destination, **self.settings))
+        return breaker
+
+    def __iter__(self):
+        return iter(list(self._breakers.values()))
+
+    def stats(self):
+        return {breaker.destination: breaker.to_dict() for breaker in self}
@@ -3,6 +3,8 @@ import sys
 import argparse
 import requests
 
+import wire
+
 
 def parse_number_list(csv: str):
     try:
@@ -98,12 +100,15 @@ def main():
     parser.add_argument("--exponent", type=float, help="Exponent for power")
     parser.add_argument("--value", type=float, help="Value for percentage")
     parser.add_argument("--percentage", type=float, help="Percentage for percentage")
+    parser.add_argument("--wire", default="json", choices=[n for n, t in wire.NAMES.items() if t in wire.CODECS],
+                        help="Request/response encoding (frame and msgpack carry number lists as binary)")
 
     args = parser.parse_args()
 
     if not args.operation:
         # Interactive mode
         args = interactive_prompt()
+        args.wire = "json"
         # Use default base URL in interactive mode
         base_url = os.getenv("CALCULATOR_URL", "http://localhost:5001")
     else:
@@ -116,11 +121,13 @@ def main():
         sys.exit(2)
 
     try:
-        resp = requests.post(f"{base_url}/calculate", json=payload, timeout=10)
+        codec = wire.CODECS[wire.NAMES[args.wire]]
+        headers = {"Content-Type": codec.content_type, "Accept": f"{codec.content_type}, {wire.JSON};q=0.5"}
+        resp = requests.post(f"{base_url}/calculate", data=codec.encode(payload), headers=headers, timeout=10)
         if resp.status_code != 200:
-            print(f"Request failed with status {resp.status_code}: {resp.text}")
+            print(f"Request failed with status {resp.status_code}: {wire.decode_response(resp) if wire.mimetype(resp) in wire.BINARY else resp.text}")
             sys.exit(3)
-        body = resp.json()
+        body = wire.decode_response(resp)
         result = body.get("response", {}).get("result")
         print(f"Result: {result}")
     except requests.RequestException as e:
@@ -0,0 +1,251 @@
+"""
+Cost estimation and bounded evaluation for big-number arithmetic
+Predicts result size and CPU cost from operand magnitudes before evaluating
+"""
+
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+
+# Decimal digits of the largest finite float (~1.8e308)
+FLOAT_MAX_DIGITS = 309
+
+
+class CostLimitError(ValueError):
+    """Raised when a request is over budget and cannot be downgraded"""
+
+
+def _is_int(x):
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+def _mul_ms(digits):
+    # Karatsuba-ish: ~12 ms for two 100k-digit operands on a typical core
+    return 1.5e-7 * digits ** 1.585
+
+
+def _str_ms(digits):
+    # int -> decimal str is quadratic and usually dominates serialising the response
+    return 2e-8 * digits ** 2
+
+
+def estimate_power(base, exponent):
+    """Estimate result digits and CPU milliseconds for base ** exponent"""
+    if _is_int(base) and _is_int(exponent) and exponent >= 0:
+        if abs(base) <= 1 or exponent == 0:
+            digits = 1.0
+        else:
+            try:
+                digits = exponent * math.log10(abs(base)) + 1
+            except OverflowError:
+                digits = math.inf
+        cpu_ms = _mul_ms(digits) * max(1.0, math.log2(max(exponent, 1))) / 4 + _str_ms(digits)
+        return {"exact": True, "digits": digits, "cpu_ms": cpu_ms}
+    return {"exact": False, "digits": 17.0, "cpu_ms": 0.0}
+
+
+def estimate_product(numbers):
+    """Estimate result digits and CPU milliseconds for multiplying a list"""
+    count = len(numbers)
+    if count and all(_is_int(n) for n in numbers):
+        if 0 in numbers:
+            digits = 1.0
+        else:
+            # math.log10 works on ints of any size without formatting them
+            digits = sum(math.log10(abs(n)) for n in numbers) + 1
+        cpu_ms = 1e-4 * count + _mul_ms(digits) * max(1.0, math.log2(count)) + _str_ms(digits)
+        return {"exact": True, "digits": digits, "cpu_ms": cpu_ms}
+    if any(_is_int(n) for n in numbers):
+        # Mixed ints and floats are multiplied as floats (see _eval_product): the ints' magnitude decides
+        # whether the result overflows, while the CPU cost stays linear
+        try:
+            digits = 1.0 if 0 in numbers else sum(math.log10(abs(n)) for n in numbers) + 1
+        except (TypeError, ValueError):
+            digits = 17.0
+        return {"exact": False, "digits": digits, "cpu_ms": 1e-4 * count}
+    return {"exact": False, "digits": 17.0, "cpu_ms": 1e-4 * count}
+
+
+def _eval_power(base, exponent):
+    return base ** exponent
+
+
+def product_tree(numbers):
+    """Multiply ints by balanced pairwise reduction so operands stay similar in size"""
+    values = list(numbers)
+    if not values:
+        return 1
+    while len(values) > 1:
+        paired = [values[i] * values[i + 1] for i in range(0, len(values) - 1, 2)]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0]
+
+
+def _eval_product(numbers):
+    if all(_is_int(n) for n in numbers):
+        return product_tree(numbers)
+    if any(_is_int(n) for n in numbers):
+        # Ints are converted first, so an int prefix is never multiplied out exactly only to overflow
+        # when the first float arrives
+        if 0 in numbers:
+            return 0.0
+        try:
+            numbers = [float(n) for n in numbers]
+        except OverflowError:
+            raise CostLimitError("an integer operand is too large to multiply with floats")
+    # Floats keep the fast path: a C-level left fold
+    return math.prod(numbers)
+
+
+class CostGuard:
+    """Rejects, downgrades or offloads arithmetic according to its estimated cost"""
+
+    def __init__(self, max_result_digits=4300, heavy_cpu_ms=5.0, heavy_workers=2, heavy_queue=4,
+                 heavy_timeout=30.0, downgrade=True, parallel_product_min=4096, heavy_min_digits=1000):
+        self.max_result_digits = max_result_digits
+        self.parallel_product_min = parallel_product_min
+        self.heavy_cpu_ms = heavy_cpu_ms
+        self.heavy_min_digits = heavy_min_digits
+        self.heavy_workers = heavy_workers
+        self.heavy_timeout = heavy_timeout
+        self.downgrade = downgrade
+        self._slots = threading.BoundedSemaphore(heavy_workers + heavy_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self.counters = {"cheap": 0, "heavy": 0, "downgraded": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_result_digits=int(os.getenv('MAX_RESULT_DIGITS', 4300)),
+            heavy_cpu_ms=float(os.getenv('HEAVY_CPU_MS', 5.0)),
+            heavy_workers=int(os.getenv('HEAVY_WORKERS', 2)),
+            heavy_queue=int(os.getenv('HEAVY_QUEUE', 4)),
+            heavy_timeout=float(os.getenv('HEAVY_TIMEOUT', 30.0)),
+            downgrade=os.getenv('COST_DOWNGRADE', '1') not in ('0', 'false', 'no'),
+            parallel_product_min=int(os.getenv('PARALLEL_PRODUCT_MIN', 4096)),
+            heavy_min_digits=float(os.getenv('HEAVY_MIN_DIGITS', 1000)),
+        )
+
+    def classify(self, estimate):
+        """Return 'cheap', 'heavy' or 'over_budget' for an estimate.
+        Only big results are heavy: a long list with a small product costs as much to pickle to the pool
+        as to multiply in place"""
+        if estimate["digits"] > self.max_result_digits:
+            return "over_budget"
+        if estimate["cpu_ms"] > self.heavy_cpu_ms and estimate["digits"] >= self.heavy_min_digits:
+            return "heavy"
+        return "cheap"
+
+    def power(self, base, exponent):
+        """Evaluate base ** exponent within budget; returns (result, mode)"""
+        estimate = estimate_power(base, exponent)
+        return self._evaluate(estimate, _eval_power, (base, exponent),
+                              lambda: float(base) ** float(exponent))
+
+    def product(self, numbers):
+        """Evaluate the product of numbers within budget; returns (result, mode)"""
+        estimate = estimate_product(numbers)
+        if not estimate["exact"] and estimate["digits"] > FLOAT_MAX_DIGITS:
+            self._count("rejected")
+            raise CostLimitError(f"result would have ~{estimate['digits']:.3g} digits and overflows a float")
+        offload = None
+        if estimate["exact"] and len(numbers) >= self.parallel_product_min and self.heavy_workers > 1:
+            offload = self._parallel_product
+        return self._evaluate(estimate, _eval_product, (numbers,),
+                              lambda: math.prod(float(n) for n in numbers), offload)
+
+    def stats(self):
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return dict(counters, max_result_digits=self.max_result_digits, heavy_cpu_ms=self.heavy_cpu_ms,
+                    heavy_min_digits=self.heavy_min_digits)
+
+    def _evaluate(self, estimate, fn, args, as_float, offload=None):
+        kind = self.classify(estimate)
+        if kind == "over_budget":
+            if not (estimate["exact"] and self.downgrade):
+                self._count("rejected")
+                raise CostLimitError(f"result would have ~{estimate['digits']:.3g} digits (limit {self.max_result_digits})")
+            try:
+                result = as_float()
+            except OverflowError:
+                result = math.inf
+            if not math.isfinite(result):
+                self._count("rejected")
+                raise CostLimitError(f"result would have ~{estimate['digits']:.3g} digits and overflows a float")
+            self._count("downgraded")
+            return result, "float"
+        if kind == "heavy":
+            return self._run_heavy(offload or self._submit(fn), *args), "heavy"
+        self._count("cheap")
+        return fn(*args), "exact"
+
+    def _count(self, kind):
+        with self._counter_lock:
+            self.counters[kind] += 1
+
+    def _run_heavy(self, offload, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise CostLimitError("too many expensive calculations in progress, retry later")
+        futures = []
+        try:
+            self._count("heavy")
+            return offload(futures, *args)
+        finally:
+            self._release_when_done(futures)
+
+    def _release_when_done(self, futures):
+        """Give the slot back once every task of the call has finished. A timed-out task cannot be
+        stopped once a worker runs it, so its slot stays taken until it ends"""
+        pending = [f for f in futures if not f.done()]
+        if not pending:
+            self._slots.release()
+            return
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def finished(_future):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._slots.release()
+
+        for future in pending:
+            future.add_done_callback(finished)
+
+    def _start(self, futures, fn, *args):
+        future = self._get_pool().submit(fn, *args)
+        futures.append(future)
+        return future
+
+    def _submit(self, fn):
+        """Run fn in one pool worker and wait for it"""
+        return lambda futures, *args: self._wait(self._start(futures, fn, *args))
+
+    def _parallel_product(self, futures, numbers):
+        """Product tree split into one chunk per worker, partials combined in the pool"""
+        size = -(-len(numbers) // self.heavy_workers)
+        chunks = [numbers[i:i + size] for i in range(0, len(numbers), size)]
+        partials = [self._wait(f) for f in [self._start(futures, product_tree, chunk) for chunk in chunks]]
+        return self._wait(self._start(futures, product_tree, partials))
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.heavy_timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise CostLimitError(f"expensive calculation exceeded {self.heavy_timeout}s")
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.heavy_workers)
+            return self._pool
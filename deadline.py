@@ -0,0 +1,138 @@
+"""
+End-to-end deadlines for A2A requests
+A request's remaining budget travels as a relative `deadline_ms` (envelope field or X-Deadline-Ms
+header), so clocks need not agree between hosts. Each hop re-anchors it on arrival, checks it before
+computing, and sizes outbound timeouts and the budget it forwards to what is left
+"""
+
+import time
+from contextvars import ContextVar
+
+import requests
+
+HEADER = "X-Deadline-Ms"
+
+_current = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The request's time budget ran out; a Timeout so existing timeout handling applies"""
+
+    def __init__(self, stage=None):
+        super().__init__(f"Deadline exceeded{f' before {stage}' if stage else ''}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after_ms(cls, ms, start=None):
+        return cls((start if start is not None else time.monotonic()) + float(ms) / 1000.0)
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def remaining_ms(self):
+        return int(self.remaining() * 1000)
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+
+def _parse_ms(value):
+    try:
+        ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    return ms if ms >= 0 else None
+
+
+def current():
+    """Deadline of the request being handled (or the orchestrator run), if any"""
+    return _current.get()
+
+
+def start(ms, arrived=None):
+    """Set the current deadline to ms from arrival; an earlier existing deadline wins"""
+    ms = _parse_ms(ms)
+    if ms is None:
+        return _current.get()
+    deadline = Deadline.after_ms(ms, arrived)
+    existing = _current.get()
+    if existing is not None and existing.expires_at <= deadline.expires_at:
+        return existing
+    _current.set(deadline)
+    return deadline
+
+
+def restore(deadline):
+    """Carry a request's deadline into work that outlives the request (e.g. a background job)"""
+    _current.set(deadline)
+
+
+def bind(envelope):
+    """Apply an envelope's deadline_ms, measured from when the request arrived"""
+    if isinstance(envelope, dict) and 'deadline_ms' in envelope:
+        from flask import g, has_request_context
+        arrived = g.get('deadline_arrived') if has_request_context() else None
+        return start(envelope.get('deadline_ms'), arrived)
+    return _current.get()
+
+
+def expired():
+    deadline = _current.get()
+    return deadline is not None and deadline.expired()
+
+
+def check(stage=None):
+    """Raise DeadlineExceeded if the current deadline has passed"""
+    deadline = _current.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(stage)
+
+
+def remaining_ms():
+    deadline = _current.get()
+    return deadline.remaining_ms() if deadline is not None else None
+
+
+def outbound(timeout, headers=None):
+    """(timeout, headers, budget_bound) for an outbound call: timeout capped to the budget, budget forwarded
+    as a header, and whether the budget rather than timeout is the binding limit.
+    Raises DeadlineExceeded when nothing is left"""
+    deadline = _current.get()
+    if deadline is None:
+        return timeout, headers, False
+    left = deadline.remaining()
+    if left <= 0:
+        raise DeadlineExceeded("outbound call")
+    headers = dict(headers or {})
+    headers[HEADER] = str(int(left * 1000))
+    return min(timeout, left), headers, left < timeout
+
+
+def aborted_step(agent, operation, stage):
+    """Step recorded in a chain response when a hop gives up on its deadline"""
+    return {"agent": agent, "operation": operation, "error": "deadline exceeded", "stage": stage}
+
+
+def install(app):
+    """Anchor each request's deadline to its arrival time and read X-Deadline-Ms"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_deadline():
+        g.deadline_arrived = time.monotonic()
+        g.deadline_token = _current.set(None)
+        start(request.headers.get(HEADER), g.deadline_arrived)
+
+    @app.teardown_request
+    def _clear_deadline(exc=None):
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(None)
@@ -0,0 +1,166 @@
+"""
+Safe arithmetic expression compiler for the Calculator Agent
+Parses expressions into a whitelisted AST (no eval) and compiles them to reusable stack plans
+"""
+
+import ast
+import io
+import os
+import tokenize
+from functools import lru_cache
+
+# Postfix percent ("x%") is rewritten to "x % __percent__" before parsing
+PERCENT_MARKER = "__percent__"
+
+BINARY_OPERATIONS = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Div: "divide",
+    ast.Pow: "power",
+}
+
+# function name -> (operation, calling convention, fixed arity or None for variadic)
+FUNCTIONS = {
+    "add": ("add", "list", None),
+    "subtract": ("subtract", "list", None),
+    "multiply": ("multiply", "list", None),
+    "divide": ("divide", "list", None),
+    "power": ("power", "args", 2),
+    "pow": ("power", "args", 2),
+    "sqrt": ("square_root", "args", 1),
+    "square_root": ("square_root", "args", 1),
+    "percentage": ("percentage", "args", 2),
+}
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that cannot be parsed, compiled or evaluated"""
+
+
+class ExpressionPlan:
+    """Compiled stack program for one expression"""
+
+    def __init__(self, expression, instructions, variables):
+        self.expression = expression
+        self.instructions = instructions
+        self.variables = variables
+
+    def evaluate(self, operations, bindings=None):
+        """Run the plan against one variable binding using the given operation handlers"""
+        bindings = bindings or {}
+        missing = [name for name in self.variables if name not in bindings]
+        if missing:
+            raise ExpressionError(f"Missing variables: {', '.join(sorted(missing))}")
+
+        stack = []
+        for opcode, arg, argc, convention in self.instructions:
+            if opcode == "const":
+                stack.append(arg)
+            elif opcode == "var":
+                value = bindings[arg]
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ExpressionError(f"Variable {arg} must be a number")
+                stack.append(value)
+            else:
+                args = stack[-argc:]
+                del stack[-argc:]
+                result = operations[arg](args) if convention == "list" else operations[arg](*args)
+                if not result.get("success"):
+                    raise ExpressionError(result.get("error", f"{arg} failed"))
+                stack.append(result["result"])
+        return stack[0]
+
+    def to_dict(self):
+        return {"expression": self.expression, "variables": sorted(self.variables), "steps": len(self.instructions)}
+
+
+def _rewrite_percent(expression):
+    """Turn postfix x% into x % __percent__; binary modulo is not a calculator operation"""
+    try:
+        tokens = [t for t in tokenize.generate_tokens(io.StringIO(expression).readline)
+                  if t.type not in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)]
+    except (tokenize.TokenError, IndentationError) as e:
+        raise ExpressionError(f"Invalid expression: {e}")
+    out = []
+    for i, tok in enumerate(tokens):
+        if tok.type == tokenize.OP and tok.string == "%":
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if following is not None and (following.type in (tokenize.NUMBER, tokenize.NAME) or following.string == "("):
+                raise ExpressionError("Modulo is not supported; use x% for percent")
+            out.append("%")
+            out.append(PERCENT_MARKER)
+        else:
+            out.append(tok.string)
+    return " ".join(out)
+
+
+class _Compiler:
+    def __init__(self):
+        self.instructions = []
+        self.variables = set()
+
+    def emit(self, node):
+        if isinstance(node, ast.Expression):
+            return self.emit(node.body)
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ExpressionError(f"Unsupported constant: {node.value!r}")
+            self.instructions.append(("const", node.value, 0, None))
+        elif isinstance(node, ast.Name):
+            if node.id == PERCENT_MARKER or node.id in FUNCTIONS:
+                raise ExpressionError(f"Invalid use of {node.id}")
+            self.variables.add(node.id)
+            self.instructions.append(("var", node.id, 0, None))
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            if isinstance(node.op, ast.USub):
+                self.instructions.append(("const", 0, 0, None))
+                self.emit(node.operand)
+                self.instructions.append(("call", "subtract", 2, "list"))
+            else:
+                self.emit(node.operand)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mod):
+            if not (isinstance(node.right, ast.Name) and node.right.id == PERCENT_MARKER):
+                raise ExpressionError("Modulo is not supported; use x% for percent")
+            self.emit(node.left)
+            self.instructions.append(("const", 1, 0, None))
+            self.instructions.append(("call", "percentage", 2, "args"))
+        elif isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATIONS:
+            operation = BINARY_OPERATIONS[type(node.op)]
+            self.emit(node.left)
+            self.emit(node.right)
+            self.instructions.append(("call", operation, 2, "args" if operation == "power" else "list"))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            if node.keywords:
+                raise ExpressionError("Keyword arguments are not supported")
+            operation, convention, arity = FUNCTIONS[node.func.id]
+            if arity is not None and len(node.args) != arity:
+                raise ExpressionError(f"{node.func.id}() takes {arity} argument(s)")
+            if not node.args:
+                raise ExpressionError(f"{node.func.id}() needs at least one argument")
+            for arg in node.args:
+                self.emit(arg)
+            self.instructions.append(("call", operation, len(node.args), convention))
+        else:
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+
+@lru_cache(maxsize=int(os.getenv('EXPRESSION_CACHE_SIZE', 256)))
+def compile_expression(expression):
+    """Parse and compile an expression; plans are cached by expression text"""
+    if not isinstance(expression, str) or not expression.strip():
+        raise ExpressionError("Expression must be a non-empty string")
+    if len(expression) > 1000:
+        raise ExpressionError("Expression too long")
+    try:
+        tree = ast.parse(_rewrite_percent(expression), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}")
+    compiler = _Compiler()
+    compiler.emit(tree)
+    return ExpressionPlan(expression, tuple(compiler.instructions), frozenset(compiler.variables))
+
+
+def cache_stats():
+    info = compile_expression.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
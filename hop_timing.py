@@ -0,0 +1,146 @@
+"""
+Per-hop timing for A2A requests
+Each hop records queue, compute, serialization and downstream-wait durations on a monotonic clock
+and returns them as a timing tree with the critical path marked
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PHASES = ("queue_ms", "compute_ms", "serialize_ms", "downstream_ms")
+
+_current = ContextVar("hop_timer", default=None)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class HopTimer:
+    """Timing for one request handled by one agent"""
+
+    def __init__(self, name, started=None):
+        self.name = name
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.calls = []
+        self._queued = False
+
+    @contextmanager
+    def phase(self, name):
+        """Time a local phase; downstream calls made inside it are not counted twice"""
+        begin = time.perf_counter()
+        if not self._queued:
+            # Everything between arrival and the first timed phase is queueing (admission, dispatch)
+            self.phases["queue_ms"] = _ms(begin - self.started)
+            self._queued = True
+        downstream_before = self.phases["downstream_ms"]
+        try:
+            yield
+        finally:
+            elapsed = _ms(time.perf_counter() - begin)
+            nested = self.phases["downstream_ms"] - downstream_before
+            self.phases[name] = round(self.phases[name] + elapsed - nested, 3)
+
+    @contextmanager
+    def call(self, target, operation=None):
+        """Time a downstream call; attach the callee's reported timing to the yielded record"""
+        record = {"target": target, "operation": operation, "wait_ms": 0.0, "timing": None}
+        begin = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wait = _ms(time.perf_counter() - begin)
+            record["wait_ms"] = wait
+            self.phases["downstream_ms"] = round(self.phases["downstream_ms"] + wait, 3)
+            self.calls.append(record)
+
+    def to_dict(self):
+        node = {"name": self.name, "total_ms": _ms(time.perf_counter() - self.started)}
+        node.update(self.phases)
+        node["calls"] = [dict(call, network_ms=network_ms(call)) for call in self.calls]
+        return node
+
+
+def remote_tree(body):
+    """Timing tree reported by a downstream agent's response, if any"""
+    timing = body.get("timing") if isinstance(body, dict) else None
+    tree = timing.get("tree") if isinstance(timing, dict) else None
+    if isinstance(tree, dict):
+        _clear_critical(tree)
+    return tree
+
+
+def _clear_critical(node):
+    # The callee marked its own critical path; the caller re-marks it in context
+    node.pop("critical", None)
+    for call in node.get("calls", []):
+        call.pop("critical", None)
+        if isinstance(call.get("timing"), dict):
+            _clear_critical(call["timing"])
+
+
+def network_ms(call):
+    """Time a call spent outside the callee: network transfer plus the callee's own unmeasured parsing"""
+    remote = call["timing"].get("total_ms", 0.0) if isinstance(call.get("timing"), dict) else 0.0
+    return round(max(call.get("wait_ms", 0.0) - remote, 0.0), 3)
+
+
+def critical_path(node):
+    """Follow the largest contributor from the root down, marking nodes and calls with critical=True"""
+    if not isinstance(node, dict):
+        return []
+    node["critical"] = True
+    path = [node.get("name", "unknown")]
+    segments = [(node.get(phase, 0.0), phase, None) for phase in ("queue_ms", "compute_ms", "serialize_ms")]
+    for call in node.get("calls", []):
+        segments.append((call.get("network_ms", 0.0), "network", call))
+        if isinstance(call.get("timing"), dict):
+            segments.append((call["timing"].get("total_ms", 0.0), "remote", call))
+    ms, kind, call = max(segments, key=lambda s: s[0])
+    if call is None:
+        path.append(kind)
+        return path
+    call["critical"] = True
+    if kind == "network":
+        path.append(f"network -> {call.get('target')}")
+        return path
+    return path + critical_path(call["timing"])
+
+
+def timing_tree(timer):
+    """Timing tree for a finished hop with its critical path"""
+    tree = timer.to_dict()
+    return {"tree": tree, "critical_path": critical_path(tree)}
+
+
+def current():
+    """Timer for the request being handled on this thread (a detached one outside requests)"""
+    timer = _current.get()
+    return timer if timer is not None else HopTimer("detached")
+
+
+def start(name):
+    """Start a timer for work done outside a Flask request (e.g. a background job)"""
+    timer = HopTimer(name)
+    _current.set(timer)
+    return timer
+
+
+def install(app, name):
+    """Start a HopTimer for every request handled by a Flask app"""
+    from flask import g
+
+    @app.before_request
+    def _start_hop_timer():
+        g.hop_timer_token = _current.set(HopTimer(name))
+
+    @app.teardown_request
+    def _stop_hop_timer(exc=None):
+        token = g.pop('hop_timer_token', None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(None)
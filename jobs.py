@@ -0,0 +1,173 @@
+"""
+Asynchronous jobs for long-running A2A chains
+A submitted job runs on a bounded background executor; its outcome can be polled by job id or is
+POSTed to a callback URL, and finished jobs stay retrievable for a TTL. With a store attached, job
+records are persisted so finished jobs stay pollable across restarts and unfinished ones are re-run
+"""
+
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """Every worker is busy and the job queue is full"""
+
+
+class JobManager:
+    NAMESPACE = "job"
+
+    def __init__(self, agent_id, workers=4, queue_size=64, ttl=3600, max_retained=10000, client=None, store=None):
+        self.agent_id = agent_id
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.max_retained = max_retained
+        self.client = client
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{agent_id}-job")
+
+    @classmethod
+    def from_env(cls, agent_id, client=None, store=None):
+        return cls(
+            agent_id,
+            workers=int(os.getenv('JOB_WORKERS', 4)),
+            queue_size=int(os.getenv('JOB_QUEUE', 64)),
+            ttl=float(os.getenv('JOB_TTL_S', 3600)),
+            max_retained=int(os.getenv('JOB_MAX_RETAINED', 10000)),
+            client=client,
+            store=store,
+        )
+
+    def submit(self, fn, callback_url=None, correlation_id=None, spec=None):
+        """Queue fn() -> (body, http_status); returns the job record or raises JobQueueFull.
+        spec is a JSON-able description of the work, persisted so the job can be re-run after a restart"""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "correlation_id": correlation_id,
+            "callback_url": callback_url,
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "http_status": None,
+            "result": None,
+            "error": None,
+            "_spec": spec,
+        }
+        return self._enqueue(job, fn)
+
+    def _enqueue(self, job, fn):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                raise JobQueueFull(f"{self._pending} jobs pending")
+            self._pending += 1
+            self._jobs[job["job_id"]] = job
+            self._purge()
+            submitted = self.public(job)
+        self._persist(job)
+        # A fresh context per job: request-scoped state (deadline, priority, timer) is set by fn itself
+        self._executor.submit(contextvars.Context().run, self._run, job, fn)
+        return submitted
+
+    def _persist(self, job):
+        if self.store is not None and job.get("_spec") is not None:
+            # A snapshot: the writer serialises it later, while the worker keeps updating the live record
+            self.store.put(self.NAMESPACE, job["job_id"], dict(job), self.ttl + 60 if job["status"] in FINISHED else None)
+
+    def restore(self, runner):
+        """Reload persisted jobs: finished ones become pollable again, unfinished ones are re-run
+        with runner(spec) -> fn. Returns the number of jobs re-queued"""
+        if self.store is None:
+            return 0
+        requeued = 0
+        for job_id, job in self.store.load(self.NAMESPACE):
+            if job.get("status") in FINISHED:
+                if job.get("_expires", 0) > time.time():
+                    with self._lock:
+                        self._jobs[job_id] = job
+                continue
+            job["status"] = QUEUED
+            job["restarted"] = job.get("restarted", 0) + 1
+            try:
+                self._enqueue(job, runner(job.get("_spec")))
+                requeued += 1
+            except JobQueueFull:
+                job.update(status=FAILED, error="Job queue full after restart", finished_at=datetime.now().isoformat(),
+                           _expires=time.time() + self.ttl)
+                with self._lock:
+                    self._jobs[job_id] = job
+                self._persist(job)
+        return requeued
+
+    def _run(self, job, fn):
+        job["status"] = RUNNING
+        job["started_at"] = datetime.now().isoformat()
+        try:
+            body, status = fn()
+            job["result"] = body
+            job["http_status"] = status
+            job["status"] = SUCCEEDED if status < 400 else FAILED
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = FAILED
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            job["_expires"] = time.time() + self.ttl
+            with self._lock:
+                self._pending -= 1
+        if job["callback_url"]:
+            self._callback(job)
+        self._persist(job)
+
+    def _callback(self, job):
+        try:
+            response = self.client.post(job["callback_url"], destination="callback", json=self.public(job), timeout=10)
+            job["callback"] = {"status": response.status_code}
+        except Exception as e:
+            job["callback"] = {"error": str(e)}
+
+    def _purge(self):
+        # Called with the lock held: drop expired jobs, then the oldest finished ones beyond max_retained
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items() if job.get("_expires", now + 1) <= now]:
+            del self._jobs[job_id]
+        excess = len(self._jobs) - self.max_retained
+        for job_id in [j for j, job in self._jobs.items() if job["status"] in FINISHED][:max(excess, 0)]:
+            del self._jobs[job_id]
+            if self.store is not None:
+                self.store.delete(self.NAMESPACE, job_id)
+
+    @staticmethod
+    def public(job):
+        return {k: v for k, v in job.items() if not k.startswith('_')}
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.get("_expires", time.time() + 1) <= time.time():
+                del self._jobs[job_id]
+                job = None
+        return self.public(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            counts = dict.fromkeys((QUEUED, RUNNING, SUCCEEDED, FAILED), 0)
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return {"workers": self.workers, "queue_size": self.queue_size, "pending": self._pending,
+                "ttl_s": self.ttl, "jobs": counts}
@@ -0,0 +1,231 @@
+"""
+Unix-domain-socket transport for agents on the same host
+Besides its TCP port, each agent serves its app on <AGENT_SOCKET_DIR>/<port>.sock; nothing listens
+or connects there unless the directory is this user's own (mode 0700, not a symlink). The shared client
+sends calls for a loopback or own-address URL through that socket when one is listening (pooled
+keep-alive HTTP/1.1 over AF_UNIX, so no TCP handshake, loopback routing or Nagle), and over TCP
+otherwise; a socket that refuses a connection is skipped for a while and the call goes over TCP
+"""
+
+import atexit
+import ipaddress
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+
+
+def default_dir():
+    """$XDG_RUNTIME_DIR/a2a-agents, or a per-user directory under the system temp dir"""
+    runtime = os.getenv('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, "a2a-agents")
+    uid = os.getuid() if hasattr(os, "getuid") else os.getenv('USERNAME', "user")
+    return os.path.join(tempfile.gettempdir(), f"a2a-agents-{uid}")
+
+
+def socket_dir():
+    """Directory of agent sockets; empty AGENT_SOCKET_DIR turns the transport off"""
+    return os.getenv('AGENT_SOCKET_DIR', default_dir())
+
+
+def private_dir_error(directory):
+    """Why directory is not safe for agent sockets (a symlink, not ours, or open to others), or None"""
+    if not hasattr(os, "getuid"):
+        return "of unknown ownership on this platform"
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return "missing"
+    if not stat.S_ISDIR(info.st_mode):
+        return "a symlink" if stat.S_ISLNK(info.st_mode) else "not a directory"
+    if info.st_uid != os.getuid():
+        return f"owned by uid {info.st_uid}, not {os.getuid()}"
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        return f"mode {stat.S_IMODE(info.st_mode):o}, not 700"
+    return None
+
+
+def socket_path(port, directory=None):
+    return os.path.join(directory if directory is not None else socket_dir(), f"{int(port)}.sock")
+
+
+def serve(app, port, reloader=False, directory=None):
+    """Serve app on the port's socket from a background thread; call before app.run (reloader=True
+    when app.run uses the debug reloader, so only the serving child listens). Returns the server, or
+    None when the transport is off or the socket cannot be bound (the agent then stays TCP-only)"""
+    from werkzeug.serving import is_running_from_reloader, make_server
+
+    directory = socket_dir() if directory is None else directory
+    if not directory or not hasattr(socket, "AF_UNIX") or (reloader and not is_running_from_reloader()):
+        return None
+    path = socket_path(port, directory)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        unsafe = private_dir_error(directory)
+        if unsafe:
+            raise OSError(f"{directory} is {unsafe}")
+        # werkzeug exits the process when it cannot bind; here that only means no local socket
+        server = make_server(f"unix://{path}", 0, app, threaded=True)
+        os.chmod(path, 0o600)
+    except (OSError, SystemExit) as e:
+        print(f"⚠️ Not listening on {path}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name=f"unix-{port}", daemon=True).start()
+    atexit.register(_close, server, path)
+    print(f"🔌 Co-located agents reach this one through {path}")
+    return server
+
+
+def _close(server, path):
+    server.shutdown()
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def local_hosts():
+    """Names and addresses that mean this machine"""
+    hosts = {"localhost", "127.0.0.1", "::1", "0.0.0.0"}
+    try:
+        name, aliases, addresses = socket.gethostbyname_ex(socket.gethostname())
+        hosts.update([name, *aliases, *addresses])
+    except OSError:
+        pass
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            hosts.add(s.getsockname()[0])
+    except OSError:
+        pass
+    return {h.lower() for h in hosts}
+
+
+def is_local_request(environ):
+    """Whether a WSGI request came through an agent socket or from a loopback address"""
+    sock = environ.get('werkzeug.socket')
+    if hasattr(socket, "AF_UNIX") and getattr(sock, "family", None) == socket.AF_UNIX:
+        return True
+    try:
+        return ipaddress.ip_address(environ.get('REMOTE_ADDR') or "").is_loopback
+    except ValueError:
+        return False
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, *args, socket_path=None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not _DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise NewConnectionError(self, f"Failed to connect to {self.socket_path}: {e}") from e
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+    def __init__(self, host, port, socket_path, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.conn_kw["socket_path"] = socket_path
+
+
+class LocalAdapter(HTTPAdapter):
+    """requests adapter for http:// that prefers a co-located agent's Unix socket"""
+
+    def __init__(self, directory=None, retry_after=5.0, **kwargs):
+        self.directory = directory
+        self.retry_after = retry_after
+        self.calls = {"unix": 0, "tcp": 0, "fallback": 0}
+        self._hosts = None
+        self._unix_pools = {}
+        self._down = {}
+        self._unix_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        return cls(socket_dir(), retry_after=float(os.getenv('AGENT_SOCKET_RETRY_S', 5)), **kwargs)
+
+    def socket_for(self, url):
+        """Socket path to use for url, or None for TCP"""
+        if not self.directory:
+            return None
+        parsed = urlparse(url)
+        if parsed.scheme != "http" or not parsed.port:
+            return None
+        if self._hosts is None:
+            self._hosts = local_hosts()
+        if (parsed.hostname or "").lower() not in self._hosts:
+            return None
+        path = socket_path(parsed.port, self.directory)
+        if self._down.get(path, 0) > time.monotonic() or not os.path.exists(path):
+            return None
+        # Anyone who can write the directory could plant a socket that answers for the peer
+        if private_dir_error(self.directory):
+            return None
+        return path
+
+    def _unix_pool(self, url, path):
+        parsed = urlparse(url)
+        with self._unix_lock:
+            pool = self._unix_pools.get(path)
+            if pool is None:
+                pool = self._unix_pools[path] = UnixHTTPConnectionPool(
+                    parsed.hostname, parsed.port, path, maxsize=self._pool_maxsize, block=self._pool_block)
+        return pool
+
+    def get_connection(self, url, proxies=None):
+        path = self.socket_for(url)
+        return self._unix_pool(url, path) if path else super().get_connection(url, proxies)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        # requests >= 2.32 looks connections up through this instead of get_connection
+        path = self.socket_for(request.url)
+        if path:
+            return self._unix_pool(request.url, path)
+        return super().get_connection_with_tls_context(request, verify, proxies, cert)
+
+    def send(self, request, **kwargs):
+        path = self.socket_for(request.url)
+        if path is None:
+            self.calls["tcp"] += 1
+            return super().send(request, **kwargs)
+        self.calls["unix"] += 1
+        try:
+            return super().send(request, **kwargs)
+        except requests.ConnectionError as e:
+            # Only a refused connect is safe to redo: nothing of the request was sent
+            if not isinstance(getattr(e.args[0] if e.args else None, "reason", None), NewConnectionError):
+                raise
+            self._down[path] = time.monotonic() + self.retry_after
+            self.calls["fallback"] += 1
+            return super().send(request, **kwargs)
+
+    def close(self):
+        super().close()
+        with self._unix_lock:
+            for pool in self._unix_pools.values():
+                pool.close()
+            self._unix_pools.clear()
+
+    def stats(self):
+        return {"socket_dir": self.directory or None, "calls": dict(self.calls)}
@@ -23,7 +23,7 @@ class NetworkConfig:
         self.unit_converter_url = f"http://{self.unit_converter_host}:{self.unit_converter_port}"
         self.statistics_url = f"http://{self.statistics_host}:{self.statistics_port}"
         
-        # Registry for all agents
+        # Registry for all agents; capabilities are offline defaults, refreshed from each agent's /capabilities
         self.agents = {
             'calculator': {
                 'url': self.calculator_url,
@@ -49,6 +49,23 @@ class NetworkConfig:
         """Get URL for specific agent"""
         return self.agents.get(agent_name, {}).get('url', '')
     
+    def discover_capabilities(self, timeout=3):
+        """Replace capability lists with the operations each agent reports from its registry"""
+        import requests
+        discovered = {}
+        for name, config in self.agents.items():
+            try:
+                response = requests.get(f"{config['url']}/capabilities", timeout=timeout)
+                response.raise_for_status()
+                body = response.json()
+                config['capabilities'] = [op['name'] for op in body.get('operations', [])]
+                if 'units' in body:
+                    config['units'] = body['units']
+                discovered[name] = True
+            except Exception:
+                discovered[name] = False
+        return discovered
+    
     def update_agent_host(self, agent_name, host, port=None):
         """Update host/port for specific agent"""
         if agent_name in self.agents:
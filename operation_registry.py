@@ -0,0 +1,138 @@
+"""
+Table-driven operation registry shared by all agents
+Each operation is registered once with its handler, argument schema, cost class, vectorized variant
+(values, data) -> values and, for reductions, a streaming aggregate factory data -> object with
+update(values) and result(). Only operations registered as cacheable (pure functions of their input,
+with no calls to other agents) have their results kept in the result cache
+"""
+
+import hashlib
+import json
+import os
+
+import shared_array
+from single_flight import canonical_key
+
+VERSION_HEADER = "X-Agent-Version"
+
+# Cost classes, cheapest first. "constant" work is cheaper than building a coalescing key.
+COST_CLASSES = ("constant", "linear", "nlogn", "bigint")
+
+# Past this many list items, dumping the request into a key costs far more than a linear operation itself
+KEY_MAX_ITEMS = int(os.getenv('COALESCE_MAX_ITEMS', 4096))
+
+
+class Operation:
+    def __init__(self, name, handler, args, cost_class="linear", vectorized=None, description="", aggregate=None,
+                 cacheable=False):
+        if cost_class not in COST_CLASSES:
+            raise ValueError(f"Unknown cost class: {cost_class}")
+        self.name = name
+        self.handler = handler
+        self.args = tuple(args)
+        self.cost_class = cost_class
+        self.vectorized = vectorized
+        self.aggregate = aggregate
+        self.description = description
+        self.cacheable = cacheable
+
+    def call(self, data):
+        """Call the handler with arguments pulled from the request data"""
+        data = data or {}
+        return self.handler(*[data.get(name, default) for name, _, default in self.args])
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "args": [{"name": name, "type": kind, "default": default} for name, kind, default in self.args],
+            "cost_class": self.cost_class,
+            "vectorized": self.vectorized is not None,
+            "aggregate": self.aggregate is not None,
+            "cacheable": self.cacheable,
+        }
+
+
+class OperationRegistry:
+    """O(1) operation lookup and dispatch"""
+
+    def __init__(self, cache=None):
+        self._operations = {}
+        # Optional result cache (get/put by canonical key), consulted for operations registered as cacheable
+        self.cache = cache
+
+    def register(self, name, handler, args=(), cost_class="linear", vectorized=None, description="", aggregate=None,
+                 cacheable=False):
+        """Register an operation; args is a sequence of (name, type, default). cacheable=True opts a pure
+        operation into the result cache"""
+        if name in self._operations:
+            raise ValueError(f"Operation already registered: {name}")
+        self._operations[name] = Operation(name, handler, args, cost_class, vectorized, description, aggregate, cacheable)
+        return self._operations[name]
+
+    def get(self, name):
+        return self._operations.get(name)
+
+    def __contains__(self, name):
+        return name in self._operations
+
+    def __iter__(self):
+        return iter(self._operations.values())
+
+    def names(self):
+        return list(self._operations)
+
+    def dispatch(self, operation, data, coalescer=None):
+        """Run an operation; identical concurrent non-trivial calls are coalesced when a coalescer is given,
+        and served from the result cache when one is attached"""
+        entry = self._operations.get(operation)
+        if entry is None:
+            return {"success": False, "error": f"Unknown operation: {operation}"}
+        if shared_array.has_segments(data):
+            # Segment names are unique to one request, so there is nothing to coalesce or cache
+            return shared_array.dispatch(entry, data)
+        cache = self.cache if entry.cacheable else None
+        if entry.cost_class == "constant" or (coalescer is None and cache is None) or not _keyable(data):
+            return entry.call(data)
+        key = canonical_key(operation, data)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        if coalescer is not None:
+            result, _ = coalescer.do(key, lambda: entry.call(data))
+        else:
+            result = entry.call(data)
+        if cache is not None and isinstance(result, dict) and result.get("success"):
+            cache.put(key, result)
+        return result
+
+    def capabilities(self):
+        return [entry.to_dict() for entry in self._operations.values()]
+
+    def version(self, routes=()):
+        """Short fingerprint of the operations (and routes) an agent serves; changes when its API does"""
+        payload = json.dumps([self.capabilities(), sorted(routes)], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def _keyable(data):
+    if not isinstance(data, dict):
+        return True
+    return sum(len(v) for v in data.values() if isinstance(v, list)) <= KEY_MAX_ITEMS
+
+
+def install(app, registry):
+    """Advertise the agent's API version on every response, so clients can tell when cached
+    knowledge about its endpoints and payload shapes is stale"""
+    state = {}
+
+    @app.after_request
+    def _agent_version(response):
+        if "version" not in state:
+            state["version"] = registry.version(f"{','.join(sorted(rule.methods - {'HEAD', 'OPTIONS'}))} {rule.rule}"
+                                                for rule in app.url_map.iter_rules())
+        response.headers[VERSION_HEADER] = state["version"]
+        return response
+
+    return registry
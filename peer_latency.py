@@ -0,0 +1,121 @@
+"""
+Observed latency per peer, used to size timeouts and decide when to hedge
+Timeouts follow the recent p99 of each (destination, operation) instead of fixed constants, stretched
+for request bodies larger than any the window has seen; a hedged duplicate goes to a replica once a
+call has outlived the recent p95, within a bounded hedge budget
+"""
+
+import os
+import threading
+from collections import deque
+
+
+def _percentile(ordered, q):
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per (destination, operation)"""
+
+    def __init__(self, window=256, min_samples=20, multiplier=3.0, floor_ms=1000.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.floor = floor_ms / 1000.0
+        self._samples = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            window=int(os.getenv('LATENCY_WINDOW', 256)),
+            min_samples=int(os.getenv('LATENCY_MIN_SAMPLES', 20)),
+            multiplier=float(os.getenv('TIMEOUT_MULTIPLIER', 3)),
+            floor_ms=float(os.getenv('TIMEOUT_FLOOR_MS', 1000)),
+        )
+
+    def record(self, key, seconds, size=0):
+        """One successful call's latency and request body size in bytes"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+                self._sizes[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._sizes[key].append(size)
+
+    def scale(self, key, size):
+        """How much longer than the window's calls a body of size bytes may take (1.0 when no larger
+        than any seen); None when bodies of this size are outside what the window says anything about"""
+        with self._lock:
+            sizes = self._sizes.get(key)
+            largest = max(sizes) if sizes else 0
+        if size <= largest:
+            return 1.0
+        # Transfer and parsing grow with the body, so latency learned on small bodies scales with it
+        return size / largest if largest else None
+
+    def percentile(self, key, q):
+        """Latency at quantile q in seconds, or None until min_samples calls have been seen"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return _percentile(ordered, q)
+
+    def timeout_for(self, key, cap, size=0):
+        """p99 x multiplier x body-size scale, clamped to [floor, cap]; the cap (the old fixed timeout)
+        until warmed up, and for a body when the window only saw bodiless calls"""
+        p99 = self.percentile(key, 0.99)
+        scale = self.scale(key, size)
+        if p99 is None or scale is None:
+            return cap
+        return max(self.floor, min(cap, p99 * self.multiplier * scale))
+
+    def stats(self):
+        with self._lock:
+            snapshot = {key: sorted(samples) for key, samples in self._samples.items()}
+        out = {}
+        for (destination, operation), ordered in snapshot.items():
+            name = f"{destination}:{operation}" if operation else destination
+            out[name] = {
+                "samples": len(ordered),
+                "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+                "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+            }
+        return out
+
+
+class HedgeBudget:
+    """Token bucket that caps hedges to a fraction of primary calls (plus a small burst)"""
+
+    def __init__(self, ratio=0.05, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def replicas_from_env(destinations=("calculator", "unit_converter", "statistics")):
+    """{destination: [base_url, ...]} from CALCULATOR_REPLICAS, UNIT_CONVERTER_REPLICAS, STATISTICS_REPLICAS"""
+    replicas = {}
+    for destination in destinations:
+        urls = [u.strip().rstrip('/') for u in os.getenv(f"{destination.upper()}_REPLICAS", "").split(',') if u.strip()]
+        if urls:
+            replicas[destination] = urls
+    return replicas
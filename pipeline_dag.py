@@ -0,0 +1,156 @@
+"""
+Declarative DAG pipelines for the orchestrator
+A spec names steps (nodes) on the calculator, unit converter and statistics agents; a string
+"$<node>" anywhere in a step's data is replaced by that node's result, which also makes it an edge.
+Steps start as soon as everything they depend on has finished, so independent branches overlap
+"""
+
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+AGENTS = ("calculator", "unit_converter", "statistics")
+
+
+class DagError(ValueError):
+    """The spec is not a valid pipeline DAG"""
+
+
+def load_spec(path):
+    """Read a spec from JSON, or from YAML when the file says so and PyYAML is installed"""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise DagError("YAML specs need PyYAML (pip install pyyaml); JSON works without it")
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def _refs(value):
+    """Names of the nodes a value refers to"""
+    if isinstance(value, str) and value.startswith("$"):
+        return {value[1:]}
+    if isinstance(value, list):
+        return set().union(*map(_refs, value)) if value else set()
+    if isinstance(value, dict):
+        return set().union(*map(_refs, value.values())) if value else set()
+    return set()
+
+
+def resolve(value, results):
+    if isinstance(value, str) and value.startswith("$"):
+        return results[value[1:]]
+    if isinstance(value, list):
+        return [resolve(v, results) for v in value]
+    if isinstance(value, dict):
+        return {k: resolve(v, results) for k, v in value.items()}
+    return value
+
+
+class Dag:
+    def __init__(self, spec):
+        nodes = spec.get("nodes") if isinstance(spec, dict) else None
+        if not isinstance(nodes, dict) or not nodes:
+            raise DagError("spec needs a non-empty \"nodes\" object")
+        self.name = spec.get("name", "pipeline")
+        self.nodes = {}
+        self.deps = {}
+        for name, node in nodes.items():
+            if not isinstance(node, dict) or node.get("agent") not in AGENTS or not node.get("operation"):
+                raise DagError(f"node {name!r} needs an agent ({', '.join(AGENTS)}) and an operation")
+            self.nodes[name] = node
+            self.deps[name] = _refs(node.get("data", {})) | set(node.get("after", []))
+        for name, deps in self.deps.items():
+            unknown = deps - set(self.nodes)
+            if unknown:
+                raise DagError(f"node {name!r} refers to unknown node(s): {', '.join(sorted(unknown))}")
+        self.order = self._topological()
+        self.outputs = spec.get("outputs") or [n for n in self.order if not any(n in d for d in self.deps.values())]
+        if not set(self.outputs) <= set(self.nodes):
+            raise DagError(f"unknown output node(s): {', '.join(sorted(set(self.outputs) - set(self.nodes)))}")
+
+    def _topological(self):
+        """Kahn's algorithm; a cycle leaves nodes with unmet dependencies"""
+        remaining = {name: set(deps) for name, deps in self.deps.items()}
+        order = []
+        ready = [name for name, deps in remaining.items() if not deps]
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for other, deps in remaining.items():
+                if name in deps:
+                    deps.discard(name)
+                    if not deps and other not in order and other not in ready:
+                        ready.append(other)
+        if len(order) != len(self.nodes):
+            raise DagError(f"cycle between nodes: {', '.join(sorted(set(self.nodes) - set(order)))}")
+        return order
+
+    def run(self, call, workers=None):
+        """Run every node with call(name, node, data) -> result; returns (results, timings, totals),
+        where totals compares the wall time with the sum of step times. A failed node's dependents
+        are skipped; the rest of the DAG still runs"""
+        results, timings = {}, {}
+        pending = {name: set(deps) for name, deps in self.deps.items()}
+        ready_at = {}
+        started = time.perf_counter()
+        lock = threading.Lock()
+
+        def execute(name):
+            begin = time.perf_counter()
+            timing = {"start_ms": round((begin - started) * 1000, 3),
+                      "wait_ms": round((begin - ready_at[name]) * 1000, 3)}
+            try:
+                node = self.nodes[name]
+                with lock:
+                    data = resolve(node.get("data", {}), results)
+                result = call(name, node, data)
+                timing["status"] = "ok"
+                return name, result, timing
+            except Exception as e:
+                timing.update(status="failed", error=f"{type(e).__name__}: {e}")
+                return name, None, timing
+            finally:
+                timing["elapsed_ms"] = round((time.perf_counter() - begin) * 1000, 3)
+
+        with ThreadPoolExecutor(max_workers=workers or len(self.nodes), thread_name_prefix="dag") as executor:
+            running = set()
+
+            def submit_ready():
+                for name in [n for n, deps in pending.items() if not deps]:
+                    del pending[name]
+                    ready_at[name] = time.perf_counter()
+                    # Each step sees the run's deadline and priority
+                    running.add(executor.submit(contextvars.copy_context().run, execute, name))
+
+            submit_ready()
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, result, timing = future.result()
+                    timings[name] = timing
+                    if timing["status"] == "ok":
+                        with lock:
+                            results[name] = result
+                        for deps in pending.values():
+                            deps.discard(name)
+                    else:
+                        self._skip_dependents(name, pending, timings)
+                submit_ready()
+        totals = {"elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                  "serial_ms": round(sum(t.get("elapsed_ms", 0) for t in timings.values()), 3)}
+        return results, timings, totals
+
+    def _skip_dependents(self, failed, pending, timings):
+        frontier = [failed]
+        while frontier:
+            upstream = frontier.pop()
+            for name in [n for n, deps in pending.items() if upstream in deps]:
+                del pending[name]
+                timings[name] = {"status": "skipped", "error": f"depends on failed node {upstream!r}"}
+                frontier.append(name)
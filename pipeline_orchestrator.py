@@ -1,10 +1,41 @@
 import os
 import sys
+import json
+import time
 import uuid
 import argparse
-import requests
+import contextvars
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List
 
+import deadline
+import priority
+import shared_array
+import wire
+from agent_client import AgentClient
+from agent_store import AgentStore
+from chain_planner import ORCHESTRATE, PUSH_DOWN, ChainPlanner
+from deadline import DeadlineExceeded
+from operation_registry import VERSION_HEADER
+from pipeline_dag import Dag, DagError, load_spec
+from stream_chain import CONTENT_TYPE as STREAM_CONTENT_TYPE, chunked, request_body, split_lines
+
+client = AgentClient("pipeline_orchestrator")
+store = AgentStore.from_env("pipeline_orchestrator")
+
+STATS_OPS = ["mean", "median", "mode", "standard_deviation", "range"]
+
+
+class PipelineError(Exception):
+    """A pipeline step returned no result; exit_code is what the single-run CLI exits with"""
+
+    def __init__(self, exit_code, message):
+        super().__init__(message)
+        self.exit_code = exit_code
+
 
 def parse_csv_floats(csv: str) -> List[float]:
     if not csv:
@@ -29,61 +60,583 @@ def resolve_url(explicit: str, env_url: str, host_env: str, port_env: str, defau
     return default
 
 
-def post_json(url: str, payload: dict) -> dict:
-    r = requests.post(url, json=payload, timeout=15)
+class DialectCache:
+    """Endpoint and payload shape each agent accepts, learned once per agent URL and API version.
+    Entries live in the orchestrator's local store with an expiry and are dropped as soon as they fail"""
+
+    NAMESPACE = "dialect"
+
+    def __init__(self, store, ttl=86400):
+        self.store = store
+        self.ttl = ttl
+        self._entries = dict(store.load(self.NAMESPACE))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, store):
+        return cls(store, ttl=float(os.getenv("DIALECT_TTL_S", 86400)))
+
+    def get(self, base):
+        with self._lock:
+            entry = self._entries.get(base)
+        return entry["dialect"] if entry is not None and entry["expires"] > time.time() else None
+
+    def remember(self, base, dialect, version):
+        entry = {"dialect": dialect, "version": version, "expires": time.time() + self.ttl}
+        with self._lock:
+            known = self._entries.get(base)
+            # Steady state: same dialect, same agent version, not near expiry -> nothing to write
+            if known is not None and (known["dialect"], known["version"]) == (dialect, version) and known["expires"] - time.time() > self.ttl / 2:
+                return
+            self._entries[base] = entry
+        self.store.put(self.NAMESPACE, base, entry, self.ttl)
+
+    def forget(self, base):
+        with self._lock:
+            known = self._entries.pop(base, None)
+        if known is not None:
+            self.store.delete(self.NAMESPACE, base)
+
+
+dialects = DialectCache.from_env(store)
+planner = ChainPlanner.from_env(client, store)
+EXECUTIONS = ("auto", ORCHESTRATE, PUSH_DOWN)
+HANDOFFS = ("auto", "shm", "inline")
+
+
+def _quiet(*args):
+    pass
+
+
+def post_json(url: str, payload: dict, destination: str = None, meta: dict = None) -> dict:
+    """POST to an agent; meta, when given, receives the agent's advertised API version"""
+    operation = (payload.get("message") or {}).get("operation") if "message" in payload else url.rsplit('/', 1)[-1]
+    if "message" in payload and deadline.current() is not None:
+        payload = dict(payload, deadline_ms=deadline.remaining_ms())
+    if "message" in payload and priority.current() is not None:
+        payload = dict(payload, priority=priority.current())
+    r = client.post(url, destination=destination, envelope=payload, timeout=15, operation=operation)
+    if r.status_code == 504:
+        raise DeadlineExceeded(url)
     r.raise_for_status()
-    return r.json()
+    if meta is not None:
+        meta["version"] = r.headers.get(VERSION_HEADER)
+    return wire.decode_response(r)
 
 
-def try_unit_convert_direct(unit_base_url: str, value: float, from_unit: str, to_unit: str):
-    """Hit the Unit Converter's direct endpoint /convert with expected payload."""
-    url = f"{unit_base_url.rstrip('/')}/convert"
-    resp = post_json(url, {"value": value, "from_unit": from_unit, "to_unit": to_unit})
-    result = resp.get("response", {}).get("result")
-    if result is None:
-        raise RuntimeError(f"Direct /convert returned no result: {resp}")
-    return float(result), resp
+def post_numbers(url: str, payload: dict, destination: str = None, handoff: str = "auto", say=_quiet) -> dict:
+    """post_json for a /message whose data carries a "numbers" list. With handoff "shm", or "auto" for an
+    agent on this host and a list of at least SHM_MIN_ITEMS, the list goes through shared memory; it is
+    sent inline again if the agent cannot map the segment"""
+    message = payload["message"]
+    numbers = message["data"]["numbers"]
+    enabled = handoff == "shm" or (handoff == "auto" and shared_array.co_located(url))
+    with shared_array.handoff(numbers, enabled, 1 if handoff == "shm" else shared_array.MIN_ITEMS) as sent:
+        if sent is numbers:
+            return post_json(url, payload, destination)
+        resp = post_json(url, dict(payload, message=dict(message, data=dict(message["data"], numbers=sent))), destination)
+    if (resp.get("response") or {}).get("shared_memory") != "unavailable":
+        return resp
+    say(f"  {destination or url} cannot map shared memory ({resp['response'].get('error')}); sending the numbers inline")
+    return post_json(url, payload, destination)
 
 
-def try_unit_convert_message(unit_msg_url: str, correlation_id: str, trace: List[str], value: float, from_unit: str, to_unit: str) -> (float, str, dict):
-    """Try multiple /message payload shapes commonly used by unit converter agents."""
-    variants = [
-        ("from_unit/to_unit", {
+def _unit_message_variants(value: float, from_unit: str, to_unit: str) -> dict:
+    """/message payload shapes commonly used by unit converter agents."""
+    return {
+        "from_unit/to_unit": {
             "operation": "convert",
             "data": {"value": value, "from_unit": from_unit, "to_unit": to_unit}
-        }),
-        ("from/to", {
+        },
+        "from/to": {
             "operation": "convert",
             "data": {"value": value, "from": from_unit, "to": to_unit}
-        }),
-        ("fromUnit/toUnit", {
+        },
+        "fromUnit/toUnit": {
             "operation": "convert",
             "data": {"value": value, "fromUnit": from_unit, "toUnit": to_unit}
-        }),
-        ("convert_length from_unit/to_unit", {
+        },
+        "convert_length from_unit/to_unit": {
             "operation": "convert_length",
             "data": {"value": value, "from_unit": from_unit, "to_unit": to_unit}
-        }),
-    ]
+        },
+    }
+
+
+# Direct /convert first, then each /message variant, in the order they are probed
+UNIT_DIALECTS = ("/convert",) + tuple(f"/message (variant: {name})" for name in _unit_message_variants(0, "", ""))
 
-    last_error = None
-    last_raw = None
-    for name, message in variants:
+
+def try_unit_convert(dialect: str, unit_base_url: str, correlation_id: str, trace: List[str], value: float, from_unit: str, to_unit: str, meta: dict = None):
+    """One conversion attempt in one dialect (an entry of UNIT_DIALECTS)."""
+    base = unit_base_url.rstrip('/')
+    if dialect == "/convert":
+        resp = post_json(f"{base}/convert", {"value": value, "from_unit": from_unit, "to_unit": to_unit}, "unit_converter", meta)
+    else:
+        variant = dialect[len("/message (variant: "):-1]
+        resp = post_json(f"{base}/message", {
+            "sender": "pipeline_orchestrator",
+            "correlation_id": correlation_id,
+            "trace": trace + ["pipeline_orchestrator"],
+            "message": _unit_message_variants(value, from_unit, to_unit)[variant]
+        }, "unit_converter", meta)
+    result = resp.get("response", {}).get("result")
+    if result is None:
+        raise RuntimeError(f"{dialect} returned no result: {resp}")
+    return float(result), resp
+
+
+def unit_convert(unit_base_url: str, correlation_id: str, trace: List[str], value: float, from_unit: str, to_unit: str):
+    """Convert with the dialect this agent is known to speak; probe the others only when it is
+    unknown or stops working. Returns (result, dialect, response)"""
+    known = dialects.get(unit_base_url)
+    order = UNIT_DIALECTS if known is None else (known,) + tuple(d for d in UNIT_DIALECTS if d != known)
+    errors = []
+    for dialect in order:
+        meta = {}
+        try:
+            result, resp = try_unit_convert(dialect, unit_base_url, correlation_id, trace, value, from_unit, to_unit, meta)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if dialect == known:
+                dialects.forget(unit_base_url)
+            errors.append(f"{dialect}: {e}")
+            continue
+        dialects.remember(unit_base_url, dialect, meta.get("version"))
+        return result, dialect, resp
+    raise RuntimeError(f"No unit converter dialect worked: {'; '.join(errors)}")
+
+
+def run_pipeline(spec: dict, urls: dict, say=_quiet) -> dict:
+    """Run one Calculator → Unit Converter → Statistics pipeline; say() receives progress lines.
+    Raises PipelineError when a step returns no result and DeadlineExceeded when the budget runs out"""
+    correlation_id = spec.get("correlation_id") or str(uuid.uuid4())
+    execution, plan = choose_execution(spec, urls)
+    if plan is not None:
+        say(describe_plan(plan))
+    if execution == PUSH_DOWN:
         try:
-            resp = post_json(unit_msg_url, {
-                "sender": "pipeline_orchestrator",
-                "correlation_id": correlation_id,
-                "trace": trace + ["pipeline_orchestrator"],
-                "message": message
-            })
-            result = resp.get("response", {}).get("result")
-            if result is not None:
-                return float(result), name, resp
-            last_raw = resp
+            return dict(run_pushed_down(spec, urls, correlation_id, say), execution=PUSH_DOWN)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            last_error = e
-            last_raw = getattr(e, 'response', None)
-    raise RuntimeError(f"All unit converter /message variants failed. last_error={last_error}, last_raw={getattr(last_raw, 'text', last_raw)}")
+            # Re-plan next time; this chain falls back to the client driving every hop
+            planner.invalidate(urls["calc_base"], chain_peers(urls))
+            say(f"  Push-down failed ({e}); orchestrating instead")
+    return dict(run_orchestrated(spec, urls, correlation_id, say), execution=ORCHESTRATE)
+
+
+def chain_peers(urls: dict) -> dict:
+    return {"unit_converter": urls["unit_base"], "statistics": urls["stats_base"]}
+
+
+def choose_execution(spec: dict, urls: dict):
+    """(execution, plan) for a pipeline; plan is None when no measurement was involved"""
+    requested = spec.get("execution", ORCHESTRATE)
+    if requested == ORCHESTRATE:
+        return ORCHESTRATE, None
+    # A chain handoff always prepends the previous result, so an explicit statistics list cannot be pushed down
+    if spec.get("stats_list"):
+        return ORCHESTRATE, {"mode": ORCHESTRATE, "reason": "stats_list is set"}
+    if dialects.get(urls["unit_base"]) not in (None, "/convert"):
+        return ORCHESTRATE, {"mode": ORCHESTRATE, "reason": "the unit converter does not accept /convert"}
+    if requested == PUSH_DOWN:
+        return PUSH_DOWN, None
+    plan = planner.plan(urls["calc_base"], chain_peers(urls))
+    return plan["mode"], plan
+
+
+def describe_plan(plan: dict) -> str:
+    if "estimated_ms" not in plan:
+        return f"Plan: {plan['mode']} ({plan.get('reason')})"
+    other = PUSH_DOWN if plan["mode"] == ORCHESTRATE else ORCHESTRATE
+    return (f"Plan: {plan['mode']} (est. {plan['estimated_ms'][plan['mode']]:.1f}ms of network vs "
+            f"{plan['estimated_ms'][other]:.1f}ms {other}, saves ~{plan['savings_ms']:.1f}ms"
+            f"{', cached' if plan.get('cached') else ''})")
+
+
+def run_pushed_down(spec: dict, urls: dict, correlation_id: str, say=_quiet) -> dict:
+    """One request: the Calculator computes the sum and forwards the rest of the chain itself"""
+    say("Steps 1-3) Calculator → add", spec["numbers"], f"→ convert {spec['from_unit']} → {spec['to_unit']} → {spec['stats_op']} (pushed down)")
+    resp = post_json(urls["calc_msg"], {
+        "sender": "pipeline_orchestrator",
+        "correlation_id": correlation_id,
+        "trace": ["pipeline_orchestrator"],
+        "message": {"operation": "add", "data": {"numbers": spec["numbers"]}},
+        "next": {
+            "url": f"{urls['unit_base'].rstrip('/')}/convert",
+            "handoff": {"from_unit": spec["from_unit"], "to_unit": spec["to_unit"]},
+            "next": {
+                "url": urls["stats_msg"],
+                # The converted value is prepended, giving the same [converted, 12.5, 8.0] as the orchestrated run
+                "handoff": {"operation": spec["stats_op"], "data": {"numbers": [12.5, 8.0]}}
+            }
+        }
+    }, "calculator")
+    steps = resp.get("steps", [])
+    if len(steps) < 3 or resp.get("final") is None:
+        raise RuntimeError(f"chain returned no final result: {resp.get('error') or resp}")
+    say("  Results:", ", ".join(str(step.get("result")) for step in steps))
+    return {"sum": steps[0]["result"], "converted": steps[1]["result"], "unit_endpoint": "/convert (pushed down)",
+            "final": resp["final"], "correlation_id": correlation_id}
+
+
+def run_orchestrated(spec: dict, urls: dict, correlation_id: str, say=_quiet) -> dict:
+    """The client calls each agent in turn"""
+    numbers = spec["numbers"]
+    say("Step 1) Calculator → add", numbers)
+    r1 = post_json(urls["calc_msg"], {
+        "sender": "pipeline_orchestrator",
+        "correlation_id": correlation_id,
+        "trace": ["pipeline_orchestrator"],
+        "message": {"operation": "add", "data": {"numbers": numbers}}
+    }, "calculator")
+    sum_val = r1.get("response", {}).get("result")
+    if sum_val is None:
+        raise PipelineError(2, f"Calculator did not return a result: {r1}")
+    say("  Result:", sum_val)
+
+    say(f"Step 2) Unit Converter → convert {sum_val} {spec['from_unit']} → {spec['to_unit']}")
+    try:
+        converted_val, unit_endpoint, raw = unit_convert(urls["unit_base"], correlation_id, r1.get("trace", []), float(sum_val), spec["from_unit"], spec["to_unit"])
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise PipelineError(3, f"Unit converter failed: {e}")
+    say("  Endpoint used:", unit_endpoint)
+    say("  Result:", converted_val)
+
+    stats_numbers = spec.get("stats_list") or [converted_val, 12.5, 8.0]
+    say(f"Step 3) Statistics → {spec['stats_op']} on", stats_numbers if len(stats_numbers) <= 20 else f"{len(stats_numbers)} numbers")
+    r3 = post_numbers(urls["stats_msg"], {
+        "sender": "pipeline_orchestrator",
+        "correlation_id": correlation_id,
+        "trace": r1.get("trace", []) + ["pipeline_orchestrator"],
+        "message": {
+            "operation": spec["stats_op"],
+            "data": {"numbers": stats_numbers}
+        }
+    }, "statistics", spec.get("handoff", "auto"), say)
+    final_val = r3.get("response", {}).get("result")
+    if final_val is None:
+        raise PipelineError(4, f"Statistics did not return a result: {r3}")
+    return {"sum": sum_val, "converted": converted_val, "unit_endpoint": unit_endpoint,
+            "final": final_val, "correlation_id": correlation_id}
+
+
+def pipeline_spec(raw: dict, args) -> dict:
+    """One NDJSON line as a pipeline spec; fields it leaves out come from the CLI flags"""
+    if not isinstance(raw, dict):
+        raise ValueError("pipeline spec must be a JSON object")
+    numbers = raw.get("numbers", args.numbers)
+    stats_list = raw.get("stats_list", args.stats_list)
+    spec = {
+        "id": raw.get("id"),
+        "numbers": parse_csv_floats(numbers) if isinstance(numbers, str) else [float(n) for n in numbers],
+        "from_unit": raw.get("from_unit", args.from_unit),
+        "to_unit": raw.get("to_unit", args.to_unit),
+        "stats_op": raw.get("stats_op", args.stats_op),
+        "stats_list": (parse_csv_floats(stats_list) if isinstance(stats_list, str) else
+                       stats_list if isinstance(stats_list, array) else [float(n) for n in stats_list]) if stats_list else None,
+        "priority": raw.get("priority", args.priority),
+        "deadline_ms": raw.get("deadline_ms", args.deadline_ms),
+        "correlation_id": raw.get("correlation_id"),
+        "execution": raw.get("execution", args.execution),
+        "handoff": raw.get("handoff", args.handoff),
+    }
+    if spec["stats_op"] not in STATS_OPS:
+        raise ValueError(f"unknown stats_op: {spec['stats_op']}")
+    if spec["execution"] not in EXECUTIONS:
+        raise ValueError(f"unknown execution: {spec['execution']}")
+    if spec["handoff"] not in HANDOFFS:
+        raise ValueError(f"unknown handoff: {spec['handoff']}")
+    return spec
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))]
+
+
+class Checkpoint:
+    """Input lines already written to the output: every line below `next`, plus `done` beyond it.
+    Saved atomically at most once per interval so an interrupted bulk run resumes where it stopped"""
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.next = 1
+        self.done = set()
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.next = int(state.get("next", 1))
+            self.done = set(state.get("done", []))
+
+    @property
+    def started(self):
+        return self.next > 1 or bool(self.done)
+
+    def skip(self, line):
+        return line < self.next or line in self.done
+
+    def mark(self, line):
+        if line < self.next:
+            return
+        self.done.add(line)
+        while self.next in self.done:
+            self.done.discard(self.next)
+            self.next += 1
+
+    def save(self, force=False):
+        if not self.path or (not force and time.monotonic() - self._saved_at < self.interval):
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"next": self.next, "done": sorted(self.done), "updated": datetime.now().isoformat()}, f)
+        os.replace(tmp, self.path)
+        self._saved_at = time.monotonic()
+
+
+class BulkWriter:
+    """Writes results as NDJSON, in input order or as they complete, and releases their in-flight slots"""
+
+    def __init__(self, out, checkpoint, slots, ordered=True):
+        self.out = out
+        self.checkpoint = checkpoint
+        self.slots = slots
+        self.ordered = ordered
+        self.latencies = []
+        self.counts = {"ok": 0, "failed": 0, "skipped": 0}
+        self._pending = {}
+        self._next = checkpoint.next
+        self._lock = threading.Lock()
+
+    def skip(self, line):
+        """A line with nothing to run (blank or already done in an earlier run)"""
+        with self._lock:
+            self.counts["skipped"] += 1
+            self.checkpoint.mark(line)
+            if self.ordered and line >= self._next:
+                self._pending[line] = None
+                self._drain()
+
+    def add(self, line, record):
+        with self._lock:
+            self.counts["ok" if record["ok"] else "failed"] += 1
+            self.latencies.append(record["elapsed_ms"])
+            if not self.ordered:
+                self._write(line, record)
+                self.checkpoint.save()
+                return
+            # Buffered results keep their slot, so out-of-order completions stay within the in-flight limit
+            self._pending[line] = record
+            self._drain()
+
+    def _drain(self):
+        while self._next in self._pending:
+            record = self._pending.pop(self._next)
+            if record is not None:
+                self._write(self._next, record)
+            self._next += 1
+        self.checkpoint.save()
+
+    def _write(self, line, record):
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+        self.checkpoint.mark(line)
+        self.slots.release()
+
+
+def _run_line(line, text, args, urls):
+    started = time.perf_counter()
+    record = {"line": line, "id": None, "ok": False}
+    try:
+        spec = pipeline_spec(json.loads(text), args)
+        record["id"] = spec["id"]
+        if spec["deadline_ms"] is not None:
+            deadline.start(spec["deadline_ms"])
+        priority.set_current(spec["priority"])
+        record.update(run_pipeline(spec, urls), ok=True)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return record
+
+
+def size_connection_pool(workers: int):
+    """One pooled connection per worker and peer instead of requests' default of ten"""
+    client.mount(pool_connections=4, pool_maxsize=max(workers, 10))
+
+
+def run_bulk(args, urls) -> int:
+    """Stream pipeline specs from NDJSON and run them concurrently; returns the exit code"""
+    max_in_flight = args.max_in_flight or args.workers * 4
+    size_connection_pool(args.workers)
+    checkpoint = Checkpoint(args.checkpoint)
+    slots = threading.BoundedSemaphore(max_in_flight)
+    source = sys.stdin if args.bulk == "-" else open(args.bulk)
+    out = sys.stdout if args.output in (None, "-") else open(args.output, "a" if checkpoint.started else "w")
+    writer = BulkWriter(out, checkpoint, slots, ordered=not args.unordered)
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="pipeline")
+    started = time.perf_counter()
+    interrupted = False
+
+    def done(line, future):
+        if not future.cancelled():
+            writer.add(line, future.result())
+
+    try:
+        for line, text in enumerate(source, 1):
+            if not text.strip() or checkpoint.skip(line):
+                writer.skip(line)
+                continue
+            slots.acquire()
+            # A fresh context per pipeline keeps each one's deadline and priority to itself
+            future = executor.submit(contextvars.Context().run, _run_line, line, text, args, urls)
+            future.add_done_callback(lambda f, line=line: done(line, f))
+        executor.shutdown(wait=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        checkpoint.save(force=True)
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    ran = writer.counts["ok"] + writer.counts["failed"]
+    print(f"{'Interrupted' if interrupted else 'Done'}: {writer.counts['ok']} ok, {writer.counts['failed']} failed, "
+          f"{writer.counts['skipped']} skipped in {elapsed:.2f}s ({ran / elapsed if elapsed else 0:.1f} pipelines/s, "
+          f"{args.workers} workers, {max_in_flight} in flight)", file=sys.stderr)
+    if writer.latencies:
+        ordered = sorted(writer.latencies)
+        print("Latency ms: " + ", ".join(f"{name} {percentile(ordered, q):.1f}" for name, q in
+                                         (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0))), file=sys.stderr)
+    if args.checkpoint and interrupted:
+        print(f"Checkpoint saved to {args.checkpoint}; rerun the same command to resume", file=sys.stderr)
+    return 130 if interrupted else (1 if writer.counts["failed"] else 0)
+
+
+def dag_step(urls: dict, correlation_id: str):
+    """call() for Dag.run: one /message request per node (unit conversions use the negotiated dialect)"""
+    message_urls = {"calculator": urls["calc_msg"], "unit_converter": urls["unit_msg"], "statistics": urls["stats_msg"]}
+
+    def call(name, node, data):
+        if node["agent"] == "unit_converter" and node["operation"] == "convert":
+            result, _, _ = unit_convert(urls["unit_base"], correlation_id, ["pipeline_orchestrator"],
+                                        float(data["value"]), data["from_unit"], data["to_unit"])
+            return result
+        resp = post_json(message_urls[node["agent"]], {
+            "sender": "pipeline_orchestrator",
+            "correlation_id": correlation_id,
+            "trace": ["pipeline_orchestrator", name],
+            "message": {"operation": node["operation"], "data": data}
+        }, node["agent"])
+        result = resp.get("response", {}).get("result")
+        if result is None:
+            raise RuntimeError(resp.get("response", {}).get("error") or resp.get("error") or "no result")
+        return result
+
+    return call
+
+
+def run_dag(args, urls) -> int:
+    """Run a DAG spec, print per-node timings and outputs; returns the exit code"""
+    try:
+        dag = Dag(load_spec(args.dag))
+    except (OSError, ValueError) as e:
+        print("Invalid pipeline spec:", e)
+        return 2
+    correlation_id = str(uuid.uuid4())
+    size_connection_pool(args.dag_workers or len(dag.nodes))
+    print(f"Pipeline {dag.name}: {len(dag.nodes)} steps, order {' → '.join(dag.order)}")
+    results, timings, totals = dag.run(dag_step(urls, correlation_id), args.dag_workers)
+
+    print(f"\n{'step':<16}{'call':<32}{'start':>10}{'wait':>9}{'elapsed':>10}  result")
+    for name in dag.order:
+        node, timing = dag.nodes[name], timings[name]
+        call = f"{node['agent']}.{node['operation']}"
+        if timing["status"] == "skipped":
+            print(f"{name:<16}{call:<32}{'':>10}{'':>9}{'':>10}  skipped ({timing['error']})")
+            continue
+        outcome = results[name] if timing["status"] == "ok" else f"failed ({timing['error']})"
+        print(f"{name:<16}{call:<32}{timing['start_ms']:>8.1f}ms{timing['wait_ms']:>7.1f}ms{timing['elapsed_ms']:>8.1f}ms  {outcome}")
+    print(f"\nWall time {totals['elapsed_ms']:.1f}ms for {totals['serial_ms']:.1f}ms of steps "
+          f"({totals['serial_ms'] / totals['elapsed_ms'] if totals['elapsed_ms'] else 0:.2f}x overlap)")
+
+    failed = [name for name in dag.order if timings[name]["status"] != "ok"]
+    for name in dag.outputs:
+        if name in results:
+            print(f"✔ {name}:", results[name])
+    print("correlation_id:", correlation_id)
+    return 1 if failed else 0
+
+
+def read_vector(path: str):
+    """Numbers from PATH ('-' for stdin), one per line, read lazily"""
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line in f:
+            if line.strip():
+                yield float(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_vector(args, urls) -> int:
+    """Stream a vector through add → convert → statistics via each agent's /stream; returns the exit code"""
+    correlation_id = str(uuid.uuid4())
+    header = {
+        "sender": "pipeline_orchestrator",
+        "correlation_id": correlation_id,
+        "operation": "add",
+        "data": {"numbers": parse_csv_floats(args.numbers)},
+        "next": {
+            "url": f"{urls['unit_base'].rstrip('/')}/stream",
+            "handoff": {"operation": "convert", "data": {"from_unit": args.from_unit, "to_unit": args.to_unit}},
+            "next": {
+                "url": f"{urls['stats_base'].rstrip('/')}/stream",
+                "handoff": {"operation": args.stats_op},
+            },
+        },
+    }
+    started = time.perf_counter()
+    try:
+        resp = client.post(f"{urls['calc_base'].rstrip('/')}/stream", destination="calculator", operation="stream",
+                           data=request_body(header, chunked(read_vector(args.vector), args.chunk_size)),
+                           headers={"Content-Type": STREAM_CONTENT_TYPE}, timeout=60, stream=True, streaming=True)
+    except (OSError, ValueError) as e:
+        print("✖ Could not stream the vector:", e)
+        return 2
+    with resp:
+        if resp.status_code != 200:
+            print(f"✖ Calculator rejected the stream (HTTP {resp.status_code}):", resp.text)
+            return 1
+        final = None
+        for line in split_lines(resp.iter_content(1 << 16)):
+            final = json.loads(line)
+    elapsed = time.perf_counter() - started
+    if not final or not final.get("done"):
+        print("✖ Stream ended without a result")
+        return 1
+
+    print(f"{'hop':<24}{'operation':<20}{'chunks':>8}{'items':>10}{'compute':>12}{'elapsed':>12}")
+    for step in final.get("steps", []):
+        print(f"{step['agent']:<24}{step['operation']:<20}{step['chunks']:>8}{step['items']:>10}"
+              f"{step['compute_ms']:>10.1f}ms{step['elapsed_ms']:>10.1f}ms" + (f"  {step['error']}" if step.get("error") else ""))
+    items = final["steps"][0]["items"] if final.get("steps") else 0
+    print(f"\n{items} values in {elapsed * 1000:.1f}ms ({items / elapsed if elapsed else 0:,.0f} values/s)")
+    print("correlation_id:", correlation_id)
+    if not final.get("success"):
+        print(f"✖ Stream failed at {final.get('failed_at')}:", final.get("error"))
+        return 1
+    print(f"\n✔ {args.stats_op}:", final.get("result"))
+    return 0
 
 
 def main():
@@ -95,10 +648,37 @@ def main():
     parser.add_argument("--numbers", default="10,20,30", help="CSV numbers for calculator add step")
     parser.add_argument("--from-unit", default="meter", help="Unit converter: from_unit")
     parser.add_argument("--to-unit", default="feet", help="Unit converter: to_unit")
-    parser.add_argument("--stats-op", default="mean", choices=["mean", "median", "mode", "standard_deviation", "range"], help="Statistics operation")
+    parser.add_argument("--stats-op", default="mean", choices=STATS_OPS, help="Statistics operation")
     parser.add_argument("--stats-list", default=None, help="CSV numbers for statistics step; if omitted, uses [converted_value, 12.5, 8.0]")
+    parser.add_argument("--stats-file", metavar="PATH", default=None, help="Numbers for the statistics step from PATH ('-' for stdin, one per line) instead of --stats-list")
+    parser.add_argument("--handoff", default="auto", choices=HANDOFFS,
+                        help="Pass the statistics list through shared memory (shm), in the request body (inline), or through shared memory when the agent is on this host and the list is large (auto)")
+    parser.add_argument("--priority", default=priority.BATCH, choices=priority.CLASSES, help="Priority class the agents schedule this run under")
+    parser.add_argument("--deadline-ms", type=float, default=None, help="Time budget for the whole pipeline; every agent stops work once it is spent")
+    parser.add_argument("--execution", default=ORCHESTRATE, choices=EXECUTIONS,
+                        help="Drive every hop from here (orchestrate, the default), hand the chain to the Calculator (push-down), or pick from measured latencies (auto)")
+
+    bulk = parser.add_argument_group("bulk mode")
+    bulk.add_argument("--bulk", metavar="PATH", default=None, help="Run one pipeline per NDJSON line of PATH ('-' for stdin); missing fields default to the flags above")
+    bulk.add_argument("--workers", type=int, default=8, help="Pipelines run concurrently")
+    bulk.add_argument("--max-in-flight", type=int, default=None, help="Pipelines started but not yet written out (default 4 x workers)")
+    bulk.add_argument("--unordered", action="store_true", help="Write results as they complete instead of in input order")
+    bulk.add_argument("--output", metavar="PATH", default=None, help="NDJSON results file (default stdout)")
+    bulk.add_argument("--checkpoint", metavar="PATH", default=None, help="Progress file; an existing one resumes the run where it stopped")
+
+    dag = parser.add_argument_group("DAG mode")
+    dag.add_argument("--dag", metavar="PATH", default=None, help="Run the pipeline DAG described in PATH (JSON, or YAML with PyYAML installed)")
+    dag.add_argument("--dag-workers", type=int, default=None, help="Steps run concurrently (default: all that are ready)")
+
+    vector = parser.add_argument_group("vector mode")
+    vector.add_argument("--vector", metavar="PATH", default=None,
+                        help="Stream the numbers in PATH ('-' for stdin, one per line) through add --numbers → convert → --stats-op, chunk by chunk")
+    vector.add_argument("--chunk-size", type=int, default=10000, help="Values per streamed chunk")
 
     args = parser.parse_args()
+    if args.stats_file:
+        # Kept packed: the list is only ever copied into a shared segment or an encoded body
+        args.stats_list = array('d', read_vector(args.stats_file))
 
     calc_base = resolve_url(
         args.calc_url,
@@ -122,60 +702,48 @@ def main():
         "http://localhost:5003",
     )
 
-    calc_msg = f"{calc_base.rstrip('/')}/message"
-    unit_msg = f"{unit_base.rstrip('/')}/message"
-    stats_msg = f"{stats_base.rstrip('/')}/message"
+    urls = {
+        "calc_base": calc_base,
+        "calc_msg": f"{calc_base.rstrip('/')}/message",
+        "unit_base": unit_base,
+        "unit_msg": f"{unit_base.rstrip('/')}/message",
+        "stats_base": stats_base,
+        "stats_msg": f"{stats_base.rstrip('/')}/message",
+    }
 
-    numbers = parse_csv_floats(args.numbers)
-    correlation_id = str(uuid.uuid4())
+    if args.bulk:
+        sys.exit(run_bulk(args, urls))
 
-    print("Step 1) Calculator → add", numbers)
-    r1 = post_json(calc_msg, {
-        "sender": "pipeline_orchestrator",
-        "correlation_id": correlation_id,
-        "trace": ["pipeline_orchestrator"],
-        "message": {"operation": "add", "data": {"numbers": numbers}}
-    })
-    sum_val = r1.get("response", {}).get("result")
-    if sum_val is None:
-        print("Calculator did not return a result:", r1)
-        sys.exit(2)
-    print("  Result:", sum_val)
+    if args.vector:
+        if args.deadline_ms is not None:
+            deadline.start(args.deadline_ms)
+        priority.set_current(args.priority)
+        sys.exit(run_vector(args, urls))
 
-    print(f"Step 2) Unit Converter → convert {sum_val} {args.from_unit} → {args.to_unit}")
-    # Try direct endpoint first, then fall back to /message variants
-    try:
-        converted_val, raw = try_unit_convert_direct(unit_base, float(sum_val), args.from_unit, args.to_unit)
-        print("  Endpoint used: /convert")
-        print("  Result:", converted_val)
-    except Exception:
-        try:
-            converted_val, variant, raw = try_unit_convert_message(unit_msg, correlation_id, r1.get("trace", []), float(sum_val), args.from_unit, args.to_unit)
-            print(f"  Endpoint used: /message (variant: {variant})")
-            print("  Result:", converted_val)
-        except Exception as e:
-            print("Unit converter failed:", e)
-            sys.exit(3)
+    if args.dag:
+        if args.deadline_ms is not None:
+            deadline.start(args.deadline_ms)
+        priority.set_current(args.priority)
+        sys.exit(run_dag(args, urls))
 
-    stats_numbers = parse_csv_floats(args.stats_list) if args.stats_list else [converted_val, 12.5, 8.0]
-    print(f"Step 3) Statistics → {args.stats_op} on", stats_numbers)
-    r3 = post_json(stats_msg, {
-        "sender": "pipeline_orchestrator",
-        "correlation_id": correlation_id,
-        "trace": r1.get("trace", []) + ["pipeline_orchestrator"],
-        "message": {
-            "operation": args.stats_op,
-            "data": {"numbers": stats_numbers}
-        }
-    })
-    final_val = r3.get("response", {}).get("result")
-    if final_val is None:
-        print("Statistics did not return a result:", r3)
-        sys.exit(4)
+    spec = pipeline_spec({}, args)
+    if args.deadline_ms is not None:
+        deadline.start(args.deadline_ms)
+    priority.set_current(args.priority)
 
-    print("\n✔ Final output:", final_val)
-    print("correlation_id:", correlation_id)
+    try:
+        result = run_pipeline(spec, urls, say=print)
+    except PipelineError as e:
+        print(e)
+        sys.exit(e.exit_code)
+
+    print("\n✔ Final output:", result["final"])
+    print("correlation_id:", result["correlation_id"])
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except DeadlineExceeded as e:
+        print("✖ Pipeline aborted:", e)
+        sys.exit(5)
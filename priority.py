@@ -0,0 +1,76 @@
+"""
+Priority classes for A2A requests
+A request's class comes from the X-Priority header or the envelope's `priority` field, is remembered
+for the duration of the request and is forwarded on every outbound call it makes
+"""
+
+import os
+from contextvars import ContextVar
+
+HEADER = "X-Priority"
+INTERACTIVE = "interactive"
+DEFAULT = "default"
+BATCH = "batch"
+CLASSES = (INTERACTIVE, DEFAULT, BATCH)
+
+_current = ContextVar("priority", default=None)
+
+
+def normalize(value):
+    value = str(value or "").strip().lower()
+    return value if value in CLASSES else None
+
+
+def parse_weights(spec):
+    """Parse "interactive=8,default=4,batch=1" into {class: weight}"""
+    weights = {INTERACTIVE: 8, DEFAULT: 4, BATCH: 1}
+    for part in (spec or "").split(','):
+        if '=' in part:
+            name, weight = part.split('=', 1)
+            name = normalize(name)
+            try:
+                if name:
+                    weights[name] = max(1, int(weight))
+            except ValueError:
+                continue
+    return weights
+
+
+def weights_from_env():
+    return parse_weights(os.getenv('PRIORITY_WEIGHTS', ''))
+
+
+def of_request(request, parse_limit=1 << 20):
+    """Class of a Flask request: header first, then the JSON envelope's priority field"""
+    value = normalize(request.headers.get(HEADER))
+    if value is None and request.is_json and (request.content_length or 0) <= parse_limit:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            value = normalize(body.get('priority'))
+    return value or DEFAULT
+
+
+def current():
+    return _current.get()
+
+
+def set_current(value):
+    """Set the class for the rest of this request (or the orchestrator run)"""
+    return _current.set(normalize(value))
+
+
+def reset(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)
+
+
+def outbound(headers=None):
+    """Headers for an outbound call carrying the current class, if any"""
+    value = _current.get()
+    if value is None:
+        return headers
+    headers = dict(headers or {})
+    headers.setdefault(HEADER, value)
+    return headers
@@ -0,0 +1,189 @@
+"""
+Per-sender and per-client-IP token-bucket rate limiting
+Buckets live in a bounded LRU; a bucket idle long enough to have refilled is indistinguishable from a
+new one, so idle keys are evicted first and the memory used stays fixed however many senders appear.
+The IP key is the connection's address, or the right-most X-Forwarded-For hop that is not a trusted
+proxy. The sender key comes from the request body and is advisory: it shares out load fairly between
+well-behaved callers, while the IP limit is the one a client cannot talk its way around
+"""
+
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_ROUTES = ("/message", "/calculate", "/convert", "/stats", "/stream")
+
+
+def parse_bucket(spec, default):
+    """Parse "rate:burst" (tokens per second : bucket size); a rate of 0 disables the limit"""
+    try:
+        rate, _, burst = (spec or default).partition(':')
+        rate = float(rate)
+        return rate, float(burst) if burst else max(rate, 1.0)
+    except ValueError:
+        return parse_bucket(default, default)
+
+
+def parse_networks(spec):
+    """Parse "10.0.0.1,192.168.0.0/24" into a list of networks, skipping invalid entries"""
+    networks = []
+    for part in (spec or "").split(','):
+        try:
+            networks.append(ipaddress.ip_network(part.strip(), strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+class TokenBuckets:
+    """Token buckets keyed by an arbitrary string, bounded to max_keys"""
+
+    def __init__(self, rate, burst, max_keys=10000, idle_seconds=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # After burst / rate seconds a bucket is full again, which is exactly a fresh bucket
+        self.idle_seconds = idle_seconds if idle_seconds is not None else (burst / rate if rate > 0 else 0)
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+        self._buckets = OrderedDict()  # key -> [tokens, last_seen, throttled]
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def take(self, key, now=None):
+        """Spend one token; returns 0 when allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._evict(now)
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0.0
+            bucket[2] += 1
+            self.throttled += 1
+            return (1 - bucket[0]) / self.rate
+
+    def _evict(self, now):
+        # Oldest first: drop refilled (idle) buckets, then the least recently used if still full
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.idle_seconds and len(self._buckets) < self.max_keys:
+                break
+            del self._buckets[key]
+            self.evicted += 1
+
+    def top_throttled(self, n=10):
+        with self._lock:
+            counts = [(key, bucket[2]) for key, bucket in self._buckets.items() if bucket[2]]
+        return dict(sorted(counts, key=lambda item: -item[1])[:n])
+
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "keys": len(self._buckets), "allowed": self.allowed,
+                "throttled": self.throttled, "evicted": self.evicted, "top_throttled": self.top_throttled()}
+
+
+class RateLimiter:
+    def __init__(self, sender=(0, 0), ip=(0, 0), routes=DEFAULT_ROUTES, max_keys=10000, parse_limit=1 << 20, metrics=None,
+                 trusted_proxies=()):
+        self.sender = TokenBuckets(*sender, max_keys=max_keys)
+        self.ip = TokenBuckets(*ip, max_keys=max_keys)
+        self.routes = set(routes)
+        self.trusted_proxies = list(trusted_proxies)
+        self.parse_limit = parse_limit
+        if metrics is not None:
+            metrics.register_collector("a2a_rate_limited_total", "counter", "Requests throttled by token-bucket rate limits, by key kind",
+                                       lambda: {(("kind", "sender"),): self.sender.throttled, (("kind", "ip"),): self.ip.throttled})
+            metrics.register_collector("a2a_rate_limit_keys", "gauge", "Senders and client IPs currently tracked by the rate limiter",
+                                       lambda: {(("kind", "sender"),): len(self.sender._buckets), (("kind", "ip"),): len(self.ip._buckets)})
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        routes = [r.strip() for r in os.getenv('RATE_LIMIT_ROUTES', ','.join(DEFAULT_ROUTES)).split(',') if r.strip()]
+        return cls(
+            sender=parse_bucket(os.getenv('RATE_LIMIT_SENDER'), "0"),
+            ip=parse_bucket(os.getenv('RATE_LIMIT_IP'), "0"),
+            routes=routes,
+            max_keys=int(os.getenv('RATE_LIMIT_MAX_KEYS', 10000)),
+            metrics=metrics,
+            trusted_proxies=parse_networks(os.getenv('RATE_LIMIT_TRUSTED_PROXIES')),
+        )
+
+    def _trusted(self, addr):
+        try:
+            ip = ipaddress.ip_address(addr)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client_ip(self, remote_addr, forwarded_for=None):
+        """The address to limit: remote_addr, unless it is a trusted proxy, in which case the right-most
+        X-Forwarded-For hop that is not one (every hop left of it could have been written by the client)"""
+        if not forwarded_for or not self._trusted(remote_addr):
+            return remote_addr
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        for hop in reversed(hops):
+            if not self._trusted(hop):
+                return hop
+        return hops[0] if hops else remote_addr
+
+    def check(self, client_ip, sender=None):
+        """Seconds to wait before retrying (0 when allowed) and which limit applied. The sender limit
+        only ever adds to the IP limit: a client that names another sender still spends its IP's tokens"""
+        if self.ip.enabled:
+            wait = self.ip.take(client_ip)
+            if wait:
+                return wait, "ip"
+        if self.sender.enabled and sender:
+            wait = self.sender.take(str(sender))
+            if wait:
+                return wait, "sender"
+        return 0.0, None
+
+    def stats(self):
+        return {"routes": sorted(self.routes), "trusted_proxies": [str(n) for n in self.trusted_proxies],
+                "sender": self.sender.stats(), "ip": self.ip.stats()}
+
+
+def install(app, limiter):
+    """Throttle the limiter's routes; register before admission so throttled requests never queue"""
+    from flask import jsonify, request
+
+    @app.before_request
+    def _rate_limit():
+        if request.method != 'POST' or request.url_rule is None or request.url_rule.rule not in limiter.routes:
+            return None
+        if not (limiter.ip.enabled or limiter.sender.enabled):
+            return None
+        client_ip = limiter.client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'))
+        sender = None
+        if limiter.sender.enabled and (request.content_length or 0) <= limiter.parse_limit:
+            # Parsed once here; Flask caches it for the handler
+            body = request.get_json(silent=True)
+            if isinstance(body, dict):
+                # Forwarded chain hops carry the originating sender, so a relaying agent is not throttled as one
+                # client. Both fields are whatever the caller wrote, so this key is only advisory
+                sender = body.get('origin') or body.get('sender')
+        wait, kind = limiter.check(client_ip, sender)
+        if not wait:
+            return None
+        retry_after = max(1, math.ceil(wait))
+        response = jsonify({"error": f"Rate limit exceeded for {kind}", "retry_after": retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    return limiter
@@ -0,0 +1,289 @@
+"""
+Shared-memory handoff of large number arrays between agents on one host
+Instead of the list itself, a sender puts the array in a multiprocessing.shared_memory segment and
+sends {"$shm": {"name", "dtype", "length", "token"}} in its place. The receiving agent maps the
+segment and computes on it in place: an operation with a streaming aggregate runs over slices of the
+mapping without copying, any other operation gets one list built straight from it (no encoding or parsing).
+
+A descriptor is honoured only from a caller on this host (an agent socket or loopback), and only if
+its token matches the random one the sender wrote at the start of the segment, so knowing a
+segment's name is not enough to have an agent read it.
+
+Lifecycle: a segment belongs to its sender, which creates it, leaves it unchanged until the response
+has come back and then unlinks it (handoff() does so on every exit path). Receivers only attach:
+they never write or unlink, and close their mapping before answering. A segment unlinked while
+mapped stays readable until it is closed. If the sender dies first, its multiprocessing resource
+tracker unlinks what it created; sweep() removes anything still left by senders that are gone. A
+sender holds an flock on <SHM_DIR>/a2a_<owner>.lock while it runs, so "gone" means that lock is free,
+which holds across PID namespaces sharing /dev/shm where a pid would not
+"""
+
+import hmac
+import os
+import secrets
+import sys
+import uuid
+from array import array
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # no flock: sweep() cannot tell that a sender is gone and leaves its segments
+    fcntl = None
+
+import wire
+
+KEY = "$shm"  # reserved as a single-key object, like wire's "$array"
+PREFIX = "a2a"
+DTYPES = ("d", "q")
+SHM_DIR = "/dev/shm"
+
+TOKEN_BYTES = 16  # the segment starts with the token; the values follow, still 8-byte aligned
+
+MIN_ITEMS = int(os.getenv('SHM_MIN_ITEMS', 65536))
+CHUNK_ITEMS = 1 << 16
+
+# Names this process's segments and lock file; random rather than the pid, which other PID namespaces reuse
+OWNER = uuid.uuid4().hex[:12]
+
+counters = {"sent": 0, "sent_bytes": 0, "received": 0, "refused": 0}
+_swept = []
+_hosts = []
+_owner_lock = []
+
+
+class SharedArrayError(ValueError):
+    """A descriptor names a segment this agent cannot map"""
+
+
+def _name():
+    # owner first, so sweep() can find the sender's lock; short enough for macOS (31 chars)
+    return f"{PREFIX}_{OWNER}_{uuid.uuid4().hex[:12]}"
+
+
+def _lock_path(owner, directory=SHM_DIR):
+    return os.path.join(directory, f"{PREFIX}_{owner}.lock")
+
+
+def _hold_owner_lock():
+    """Take this process's owner lock, held until it exits; without it sweep() never reclaims our segments"""
+    if _owner_lock or fcntl is None or not os.path.isdir(SHM_DIR):
+        return
+    fd = os.open(_lock_path(OWNER), os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        raise
+    _owner_lock.append(fd)
+
+
+def share(values):
+    """A new segment holding values as int64/float64; returns (segment, descriptor). The caller unlinks it.
+    Raises SharedArrayError when values are not all numbers or the segment would not fit"""
+    packed = values if isinstance(values, array) and values.typecode in DTYPES else wire.as_array(values, 1)
+    if packed is None:
+        raise SharedArrayError("only lists of int64 or float64 numbers can be shared")
+    nbytes = len(packed) * packed.itemsize
+    if os.path.isdir(SHM_DIR):
+        # Writing past a full tmpfs kills the process with SIGBUS instead of raising
+        free = os.statvfs(SHM_DIR)
+        if free.f_bavail * free.f_frsize < nbytes:
+            raise SharedArrayError(f"{SHM_DIR} has no room for {nbytes} bytes")
+    _hold_owner_lock()
+    token = secrets.token_bytes(TOKEN_BYTES)
+    segment = shared_memory.SharedMemory(name=_name(), create=True, size=TOKEN_BYTES + nbytes)
+    try:
+        segment.buf[:TOKEN_BYTES] = token
+        segment.buf[TOKEN_BYTES:TOKEN_BYTES + nbytes] = memoryview(packed).cast('B')
+    except BaseException:
+        release(segment)
+        raise
+    counters["sent"] += 1
+    counters["sent_bytes"] += nbytes
+    return segment, {KEY: {"name": segment.name, "dtype": packed.typecode, "length": len(packed), "token": token.hex()}}
+
+
+def release(segment):
+    """Sender side: close and unlink a segment"""
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def handoff(values, enabled=True, min_items=MIN_ITEMS):
+    """Yields what to send in place of values: a descriptor of a shared copy when enabled and values has
+    at least min_items numbers, else values itself. The segment is unlinked when the block exits"""
+    shared = None
+    if enabled and len(values) >= min_items:
+        if not _swept:
+            _swept.append(sweep())
+        try:
+            shared = share(values)
+        except (SharedArrayError, OSError):
+            shared = None
+    if shared is None:
+        yield values
+        return
+    segment, descriptor = shared
+    try:
+        yield descriptor
+    finally:
+        release(segment)
+
+
+def co_located(url):
+    """Whether url names an agent on this machine, i.e. one that can map this host's shared memory"""
+    if not _hosts:
+        from local_transport import local_hosts
+        _hosts.append(local_hosts())
+    return (urlparse(url).hostname or "").lower() in _hosts[0]
+
+
+def descriptor(value):
+    """The descriptor in a request value, or None when it is an ordinary value"""
+    if isinstance(value, dict) and len(value) == 1 and KEY in value:
+        return value[KEY]
+    return None
+
+
+def has_segments(data):
+    return isinstance(data, dict) and any(descriptor(v) is not None for v in data.values())
+
+
+def _open(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    segment = shared_memory.SharedMemory(name=name)
+    # Attaching registers the segment with this process's resource tracker, which would unlink the
+    # sender's segment (and warn about a leak) when this agent exits; its own segments stay registered
+    if not name.startswith(f"{PREFIX}_{OWNER}_"):
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def attach(desc):
+    """Receiver side: (segment, typed memoryview) for a descriptor. Release the view, then close the segment"""
+    if not isinstance(desc, dict):
+        raise SharedArrayError("shared-memory descriptor must be an object")
+    name, dtype, length, token = desc.get("name"), desc.get("dtype"), desc.get("length"), desc.get("token")
+    # Only agent segments: a descriptor must not be a way to read other processes' shared memory
+    if not isinstance(name, str) or not name.startswith(PREFIX + "_") or "/" in name:
+        raise SharedArrayError(f"not an agent segment: {name!r}")
+    if dtype not in DTYPES or type(length) is not int or length < 0:
+        raise SharedArrayError("descriptor needs a dtype of 'd' or 'q' and a length")
+    try:
+        expected = bytes.fromhex(token) if isinstance(token, str) else b""
+    except ValueError:
+        expected = b""
+    if len(expected) != TOKEN_BYTES:
+        raise SharedArrayError("descriptor needs the segment's token")
+    try:
+        segment = _open(name)
+    except OSError as e:
+        raise SharedArrayError(f"cannot map shared memory {name}: {e}")
+    if segment.size < TOKEN_BYTES or not hmac.compare_digest(bytes(segment.buf[:TOKEN_BYTES]), expected):
+        segment.close()
+        raise SharedArrayError(f"token does not match segment {name}")
+    if TOKEN_BYTES + length * 8 > segment.size:
+        segment.close()
+        raise SharedArrayError(f"segment {name} holds fewer than {length} items")
+    return segment, segment.buf[TOKEN_BYTES:TOKEN_BYTES + length * 8].cast(dtype)
+
+
+def _from_this_host():
+    """Whether the current request may name segments: an in-process call, or one over an agent socket or loopback"""
+    from flask import has_request_context, request
+    from local_transport import is_local_request
+    return not has_request_context() or is_local_request(request.environ)
+
+
+def dispatch(entry, data):
+    """Run a registry entry on request data holding descriptors. A reduction over the single list
+    argument uses the entry's aggregate on slices of the mapping; anything else gets lists"""
+    mapped = {}
+    try:
+        if not _from_this_host():
+            raise SharedArrayError("shared memory is only accepted from this host")
+        for key, value in data.items():
+            desc = descriptor(value)
+            if desc is not None:
+                mapped[key] = attach(desc)
+        counters["received"] += 1
+        views = {key: view for key, (_, view) in mapped.items()}
+        lists = [name for name, kind, _ in entry.args if kind == "list"]
+        if entry.aggregate is not None and len(lists) == 1 and list(views) == lists:
+            name, view = next(iter(views.items()))
+            aggregate = entry.aggregate({k: v for k, v in data.items() if k != name})
+            for start in range(0, len(view), CHUNK_ITEMS):
+                with view[start:start + CHUNK_ITEMS] as chunk:
+                    aggregate.update(chunk)
+            return aggregate.result()
+        return entry.call(dict(data, **{key: view.tolist() for key, view in views.items()}))
+    except SharedArrayError as e:
+        counters["refused"] += 1
+        return {"success": False, "error": str(e), "shared_memory": "unavailable"}
+    finally:
+        # The mapping closes only once no view of it is left
+        for segment, view in mapped.values():
+            view.release()
+            segment.close()
+
+
+def _owner_gone(directory, owner):
+    """Whether the owner's lock file exists and nobody holds its lock, i.e. the sender has exited"""
+    if fcntl is None:
+        return False
+    try:
+        fd = os.open(_lock_path(owner, directory), os.O_RDWR | os.O_NOFOLLOW)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def sweep(directory=SHM_DIR):
+    """Unlink agent segments, and the lock file, of senders whose owner lock is free; segments whose
+    owner cannot be confirmed gone are left alone. Returns how many segments were removed"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    owners = {}
+    for name in names:
+        parts = name.split("_")
+        if parts[0] != PREFIX:
+            continue
+        if len(parts) == 3:
+            owners.setdefault(parts[1], []).append(name)
+        elif len(parts) == 2 and parts[1].endswith(".lock"):
+            owners.setdefault(parts[1][:-len(".lock")], [])
+    removed = 0
+    for owner, segments in owners.items():
+        if owner == OWNER or not _owner_gone(directory, owner):
+            continue
+        for name in segments:
+            try:
+                os.unlink(os.path.join(directory, name))
+                removed += 1
+            except OSError:
+                pass
+        try:
+            os.unlink(_lock_path(owner, directory))
+        except OSError:
+            pass
+    return removed
+
+
+def stats():
+    return {"min_items": MIN_ITEMS, **counters}
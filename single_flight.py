@@ -0,0 +1,86 @@
+"""
+Single-flight request coalescing shared by all agents
+Concurrent identical requests wait on one in-flight computation and share its result
+"""
+
+import json
+import threading
+
+
+def canonical_key(operation, data):
+    """Build a stable key for an (operation, data) pair"""
+    try:
+        return json.dumps([operation, data], sort_keys=True, separators=(',', ':'), default=str)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls with the same key (no caching once a call finishes)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() once per key among concurrent callers; returns (result, shared)"""
+        if key is None:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._copy(call.result), True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def process(self, operation, data, fn):
+        """Coalesce fn() on the canonical (operation, data) key"""
+        result, _ = self.do(canonical_key(operation, data), fn)
+        return result
+
+    def stats(self):
+        """Return coalescing counters"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
+
+    @staticmethod
+    def _copy(result):
+        # Followers get their own top-level dict so callers can annotate it safely
+        return dict(result) if isinstance(result, dict) else result
@@ -76,7 +76,7 @@ async function testURLs() {
   btn.disabled = true;
   
   try {
-    const r = await fetch('/config/test', { method: 'POST' });
+    const r = await fetch('/config/test', { method: 'POST', headers: { 'X-Priority': 'interactive' } });
     const b = await r.json();
     
     const allOk = Object.values(b).every(result => result.ok);
@@ -174,7 +174,7 @@ async function runPipeline() {
       }
     };
 
-    const r = await fetch('/route', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ target: 'calculator', endpoint: '/message', payload: chain }) });
+    const r = await fetch('/route', { method: 'POST', headers: { 'Content-Type': 'application/json', 'X-Priority': 'interactive' }, body: JSON.stringify({ target: 'calculator', endpoint: '/message', payload: chain }) });
     const b = await r.json();
     
     if (r.ok) {
@@ -0,0 +1,291 @@
+"""
+Streaming vector chains between agents
+A vector is sent to POST /stream as newline-delimited JSON: a header line ({"operation", "data",
+"next"}) followed by {"values": [...]} chunk lines. Each hop applies its operation's vectorized form
+to chunks as they arrive and forwards them to the next hop through a bounded buffer while later
+chunks are still being read, so hops work concurrently and a slow hop throttles the ones before it.
+The last hop reduces the stream (the operation's aggregate) or returns the transformed chunks; its
+final line carries the result and every hop's step
+"""
+
+import contextvars
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import deadline
+
+CONTENT_TYPE = "application/x-ndjson"
+READ_BLOCK = 1 << 16
+
+_END = object()
+
+
+class StreamError(ValueError):
+    """A stream could not be processed; agent names the hop that failed"""
+
+    def __init__(self, message, agent=None):
+        super().__init__(message)
+        self.agent = agent
+
+    def line(self):
+        return {"error": str(self), "agent": self.agent}
+
+
+def encode(obj):
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+def split_lines(blocks):
+    """Non-empty lines from an iterable of byte blocks"""
+    pending = b""
+    for block in blocks:
+        pending += block
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def read_lines(stream, block=READ_BLOCK):
+    """Lines of a binary stream, read in blocks (chunked request bodies have no cheap readline)"""
+    return split_lines(iter(lambda: stream.read(block), b""))
+
+
+def request_body(header, chunks):
+    """Encoded request lines for a header and an iterable of value lists"""
+    yield encode(header)
+    for values in chunks:
+        yield encode({"values": values})
+
+
+def chunked(values, size):
+    """Lists of up to size items from an iterable"""
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamHop:
+    """Runs this agent's step of a streamed chain; client is needed only to forward to a next hop"""
+
+    def __init__(self, agent, registry, client=None, buffer_chunks=16, timeout=60, spool_bytes=8 << 20):
+        self.agent = agent
+        self.registry = registry
+        self.client = client
+        self.buffer_chunks = buffer_chunks
+        self.timeout = timeout
+        self.spool_bytes = spool_bytes
+        self.streams = {"ok": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls, agent, registry, client=None):
+        return cls(agent, registry, client,
+                   buffer_chunks=int(os.getenv('STREAM_BUFFER_CHUNKS', 16)),
+                   timeout=float(os.getenv('STREAM_TIMEOUT_S', 60)),
+                   spool_bytes=int(os.getenv('STREAM_SPOOL_MB', 8)) << 20)
+
+    def open(self, lines):
+        """Read and validate the header line; returns (header, operation entry) or raises StreamError"""
+        try:
+            header = json.loads(next(lines))
+        except (StopIteration, ValueError):
+            raise StreamError("stream must start with a JSON header line")
+        if not isinstance(header, dict):
+            raise StreamError("stream header must be an object")
+        entry = self.registry.get(header.get("operation"))
+        if entry is None:
+            raise StreamError(f"Unknown operation: {header.get('operation')}")
+        if entry.vectorized is None and entry.aggregate is None:
+            raise StreamError(f"Operation {entry.name} cannot be streamed")
+        nxt = header.get("next")
+        if nxt:
+            if entry.vectorized is None:
+                raise StreamError(f"Operation {entry.name} reduces the stream, so it must be the last hop")
+            if self.client is None:
+                raise StreamError(f"{self.agent} does not forward streams")
+            if not isinstance(nxt, dict) or not nxt.get("url"):
+                raise StreamError("next hop needs a url")
+        return header, entry
+
+    def run(self, header, entry, lines):
+        """Response lines for a stream whose header has been read"""
+        step = {"agent": self.agent, "operation": entry.name, "chunks": 0, "items": 0, "compute_ms": 0.0}
+        started = time.perf_counter()
+        if header.get("next"):
+            outcome = self._forward(header, entry, lines, step)
+        else:
+            outcome = self._finish(header, entry, lines, step)
+        final = None
+        for line in outcome:
+            if isinstance(line, dict):
+                final = line
+            else:
+                yield line
+        step["compute_ms"] = round(step["compute_ms"], 3)
+        step["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        final["steps"] = [step] + final.get("steps", [])
+        self.streams["ok" if final.get("success") else "failed"] += 1
+        yield encode(final)
+
+    def _chunks(self, lines):
+        """Value lists from chunk lines; an upstream error line or the deadline ends the stream"""
+        for raw in lines:
+            if deadline.expired():
+                raise StreamError("deadline exceeded", self.agent)
+            try:
+                chunk = json.loads(raw)
+            except ValueError:
+                raise StreamError("malformed chunk line", self.agent)
+            if isinstance(chunk, dict) and "error" in chunk:
+                raise StreamError(chunk["error"], chunk.get("agent"))
+            values = chunk.get("values") if isinstance(chunk, dict) else None
+            if not isinstance(values, list):
+                raise StreamError("chunk lines need a \"values\" list", self.agent)
+            yield values
+
+    def _apply(self, fn, values, step, *args):
+        began = time.perf_counter()
+        try:
+            result = fn(values, *args)
+        except (ValueError, TypeError, ArithmeticError) as e:
+            raise StreamError(f"{step['operation']} failed: {e}", self.agent)
+        step["compute_ms"] += (time.perf_counter() - began) * 1000
+        step["chunks"] += 1
+        step["items"] += len(values)
+        return result
+
+    def _failed(self, error, step):
+        if error.agent in (self.agent, None):
+            step["error"] = str(error)
+        return {"done": True, "success": False, "error": str(error), "failed_at": error.agent}
+
+    def _finish(self, header, entry, lines, step):
+        data = header.get("data") or {}
+        spool = None
+        try:
+            if entry.aggregate is not None:
+                aggregate = entry.aggregate(data)
+                for values in self._chunks(lines):
+                    self._apply(aggregate.update, values, step)
+                result = aggregate.result()
+            else:
+                # Output goes back only after the input ends: the caller is still sending until then
+                spool = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+                for values in self._chunks(lines):
+                    spool.write(encode({"values": self._apply(entry.vectorized, values, step, data)}))
+                result = {"success": True, "operation": entry.name, "items": step["items"]}
+        except StreamError as e:
+            if spool is not None:
+                spool.close()
+            yield self._failed(e, step)
+            return
+        if spool is not None:
+            spool.seek(0)
+            with spool:
+                yield from spool
+        yield {"done": True, "success": bool(result.get("success")), "result": result.get("result"),
+               "response": result}
+
+    def _forward(self, header, entry, lines, step):
+        nxt = header["next"]
+        data = header.get("data") or {}
+        handoff = nxt.get("handoff") or {}
+        buffer = queue.Queue(self.buffer_chunks)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for values in self._chunks(lines):
+                    if not put(encode({"values": self._apply(entry.vectorized, values, step, data)})):
+                        return
+            except StreamError as e:
+                step["error"] = str(e)
+                put(encode(e.line()))
+            except Exception as e:
+                step["error"] = str(e)
+                put(encode({"error": f"{entry.name} failed: {e}", "agent": self.agent}))
+            finally:
+                put(_END)
+
+        def body():
+            yield encode({"operation": handoff.get("operation"), "data": handoff.get("data") or {},
+                          "next": nxt.get("next"), "sender": self.agent,
+                          "origin": header.get("origin") or header.get("sender"),
+                          "correlation_id": header.get("correlation_id")})
+            while True:
+                item = buffer.get()
+                if item is _END:
+                    return
+                yield item
+
+        # Reading and computing run here while the request thread sends to the next hop
+        producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                                    name=f"{self.agent}-stream", daemon=True)
+        producer.start()
+        try:
+            response = self.client.post(nxt["url"], data=body(), operation="stream", timeout=self.timeout,
+                                        headers={"Content-Type": CONTENT_TYPE}, stream=True, streaming=True)
+        except Exception as e:
+            yield self._failed(StreamError(f"next hop unreachable: {e}", self.agent), step)
+            return
+        finally:
+            stop.set()
+            producer.join(1.0)
+        with response:
+            if response.status_code != 200:
+                try:
+                    error = response.json().get("error")
+                except ValueError:
+                    error = None
+                yield self._failed(StreamError(error or f"next hop returned HTTP {response.status_code}",
+                                               nxt["url"]), step)
+                return
+            final = None
+            for raw in split_lines(response.iter_content(READ_BLOCK)):
+                if raw.startswith(b'{"values"'):
+                    yield raw + b"\n"
+                    continue
+                final = json.loads(raw)
+            if not isinstance(final, dict) or not final.get("done"):
+                final = self._failed(StreamError("next hop ended the stream early", nxt["url"]), step)
+            yield final
+
+    def stats(self):
+        return {"buffer_chunks": self.buffer_chunks, "streams": dict(self.streams)}
+
+
+def install(app, hop):
+    """POST /stream: this agent's hop of a streamed vector chain; admission holds its slot for the whole stream"""
+    from flask import Response, jsonify, request, stream_with_context
+
+    @app.route('/stream', methods=['POST'])
+    def stream():
+        lines = read_lines(request.stream)
+        try:
+            header, entry = hop.open(lines)
+        except StreamError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        deadline.bind(header)
+        return Response(stream_with_context(hop.run(header, entry, lines)), mimetype=CONTENT_TYPE)
+
+    return hop
@@ -116,6 +116,31 @@ def test_statistics_agent():
         except Exception as e:
             print(f"❌ {test['operation']}: {str(e)}")
 
+def test_expression_evaluation():
+    """Test the calculator's /evaluate endpoint"""
+    print("\n🧮 Testing Expression Evaluation...")
+    
+    tests = [
+        {"expression": "sqrt(a*b + c)%", "variables": {"a": 4, "b": 4, "c": 9}},
+        {"expression": "power(x, 2) + 1", "bindings": [{"x": 1}, {"x": 2}, {"x": 3}]}
+    ]
+    
+    for test in tests:
+        try:
+            response = requests.post(
+                "http://localhost:5001/evaluate",
+                json=test,
+                timeout=5
+            )
+            if response.status_code == 200:
+                data = response.json()['response']
+                result = data.get('result', [r.get('result') for r in data.get('results', [])])
+                print(f"✅ {test['expression']}: {result}")
+            else:
+                print(f"❌ {test['expression']}: HTTP {response.status_code}")
+        except Exception as e:
+            print(f"❌ {test['expression']}: {str(e)}")
+
 def test_a2a_communication():
     """Test A2A communication between agents"""
     print("\n🤖 Testing A2A Communication...")
@@ -202,6 +227,1082 @@ def test_pipeline_orchestrator():
     except Exception as e:
         print(f"❌ Pipeline Orchestrator: {str(e)}")
 
+# The tests below run in-process and need no agents running
+
+def _agent_module(name, folder=""):
+    """Import an agent's module without persisting state or opening sockets"""
+    import importlib
+    import os
+    os.environ.setdefault("AGENT_STORE_DIR", "")
+    os.environ.setdefault("AGENT_SOCKET_DIR", "")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(name)
+
+def _fake_response(status, body=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {}).encode()
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+def test_single_flight_coalescing():
+    """Identical concurrent requests must run once, and each caller must get its own copy"""
+    print("\n🛫 Testing Single-Flight Coalescing...")
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from single_flight import SingleFlight
+
+    flight, release, runs = SingleFlight(), threading.Event(), []
+
+    def compute():
+        runs.append(1)
+        release.wait(2)
+        return {"success": True, "result": 42}
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.process, "add", {"b": 2, "a": 1}, compute)]
+        while not flight.stats()["in_flight"]:
+            time.sleep(0.001)
+        futures += [pool.submit(flight.process, "add", {"a": 1, "b": 2}, compute) for _ in range(3)]
+        while flight.stats()["coalesced"] < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [f.result() for f in futures]
+    assert len(runs) == 1 and all(r["result"] == 42 for r in results), results
+    assert len({id(r) for r in results}) == 4, "followers must not share the leader's dict"
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 3}, flight.stats()
+
+    flight.process("add", {"a": 1, "b": 2}, compute)
+    assert len(runs) == 2, "finished calls must not be cached"
+    print(f"✅ 4 concurrent requests ran once: {flight.stats()}")
+
+def test_cost_guard_mixed_product():
+    """A float among huge ints must not slip past the cost estimate"""
+    print("\n💸 Testing Cost Guard on Mixed Products...")
+    from cost_control import CostGuard, CostLimitError
+
+    guard = CostGuard()
+    huge = [int('9' * 4000)] * 300
+    for numbers in (huge, huge + [1.5], [1.5] + huge):
+        started = time.perf_counter()
+        try:
+            guard.product(numbers)
+            raise AssertionError("over-budget product was admitted")
+        except CostLimitError as e:
+            elapsed = time.perf_counter() - started
+            assert elapsed < 0.1, f"rejection took {elapsed:.2f}s"
+            print(f"✅ Rejected in {elapsed * 1000:.1f}ms: {e}")
+    assert guard.product([2 ** 60, 3, 1.5]) == (float(2 ** 60) * 3 * 1.5, "exact")
+    assert guard.product([0, 10 ** 5000, 1.5]) == (0.0, "exact")
+    assert guard.product([6, 7]) == (42, "exact")
+    print("✅ Mixed products within range still evaluate")
+
+def test_product_tree():
+    """The balanced product tree must agree with a left fold on ints of every size and count"""
+    print("\n🌳 Testing Product Tree...")
+    import math
+    import random
+    from cost_control import CostGuard, product_tree
+
+    rng = random.Random(7)
+    for count in (0, 1, 2, 3, 7, 64, 513):
+        numbers = [rng.randrange(-10 ** 30, 10 ** 30) for _ in range(count)]
+        assert product_tree(numbers) == math.prod(numbers), count
+    big = [3 ** 50 + i for i in range(2000)]
+    result, mode = CostGuard(max_result_digits=200000, parallel_product_min=1024).product(big)
+    assert mode == "heavy" and result == math.prod(big), mode
+    print(f"✅ parallel product of {len(big)} ints matches: {result.bit_length()} bits")
+
+def test_cost_guard_heavy_slots():
+    """Small results stay in process, and a timed-out pool task keeps its slot until it really ends"""
+    print("\n🏋️ Testing Cost Guard Heavy Slots...")
+    from cost_control import CostGuard, CostLimitError, estimate_product
+
+    guard = CostGuard()
+    ones = [1] * 10 ** 6
+    assert guard.classify(estimate_product(ones)) == "cheap"
+    assert guard.product(ones) == (1, "exact") and guard.stats()["heavy"] == 0, guard.stats()
+    print("✅ a million ones multiply in place")
+
+    guard = CostGuard(heavy_workers=1, heavy_queue=0, heavy_timeout=0.05)
+    try:
+        try:
+            guard._run_heavy(guard._submit(time.sleep), 0.5)
+            raise AssertionError("slow task did not time out")
+        except CostLimitError as e:
+            assert "exceeded" in str(e), e
+        try:
+            guard._run_heavy(guard._submit(time.sleep), 0)
+            raise AssertionError("slot was freed while the timed-out task still ran")
+        except CostLimitError as e:
+            assert "retry later" in str(e), e
+        deadline_at = time.monotonic() + 5
+        while time.monotonic() < deadline_at:
+            try:
+                guard._run_heavy(guard._submit(time.sleep), 0)
+                break
+            except CostLimitError:
+                time.sleep(0.05)
+        else:
+            raise AssertionError("slot never came back")
+    finally:
+        guard._get_pool().shutdown(wait=True)
+    print(f"✅ slot held until the timed-out task ended: {guard.stats()}")
+
+def test_evaluate_compiled_expressions():
+    """/evaluate must compile an expression once and reuse the plan across bindings and requests"""
+    print("\n🧮 Testing Compiled Expressions In-Process...")
+    from expression_engine import ExpressionError, cache_stats, compile_expression
+    calculator = _agent_module("calculator_agent_network")
+    client = calculator.app.test_client()
+
+    expression = "power(x, 2) + y * 50%"
+    before = cache_stats()["misses"]
+    first = client.post('/evaluate', json={"expression": expression, "bindings": [{"x": 1, "y": 4}, {"x": 3, "y": 2}]})
+    again = client.post('/evaluate', json={"expression": expression, "variables": {"x": 2, "y": 0}})
+    assert first.status_code == 200 and again.status_code == 200, first.get_data(as_text=True)
+    assert [r["result"] for r in first.get_json()["response"]["results"]] == [3.0, 10.0], first.get_json()
+    assert again.get_json()["response"]["result"] == 4, again.get_json()
+    assert cache_stats()["misses"] == before + 1, cache_stats()
+    print(f"✅ {expression} compiled once: {cache_stats()}")
+
+    for bad in ("__import__('os')", "x.y", "x % 3", ""):
+        try:
+            compile_expression(bad)
+            raise AssertionError(f"{bad!r} compiled")
+        except ExpressionError:
+            pass
+    missing = client.post('/evaluate', json={"expression": "a + b", "variables": {"a": 1}})
+    assert not missing.get_json()["response"]["success"], missing.get_json()
+    print("✅ Unsafe or incomplete expressions are refused")
+
+def test_operation_registry():
+    """Registry dispatch must find handlers by name, coalesce only non-constant work and describe every operation"""
+    print("\n📇 Testing Operation Registry...")
+    from operation_registry import OperationRegistry
+    from single_flight import SingleFlight
+
+    registry, flight = OperationRegistry(), SingleFlight()
+    registry.register("add", lambda numbers: {"success": True, "result": sum(numbers)}, [("numbers", "list", [])])
+    registry.register("echo", lambda x: {"success": True, "result": x}, [("x", "number", 0)], cost_class="constant")
+
+    assert registry.dispatch("add", {"numbers": [1, 2, 3]}, flight)["result"] == 6
+    assert registry.dispatch("add", {}, flight)["result"] == 0, "missing arguments take their defaults"
+    assert registry.dispatch("echo", {"x": 5}, flight)["result"] == 5
+    assert flight.stats()["leaders"] == 2, "constant operations must skip the coalescer"
+    assert not registry.dispatch("nope", {})["success"]
+    try:
+        registry.register("add", lambda numbers: None)
+        raise AssertionError("duplicate registration accepted")
+    except ValueError:
+        pass
+    assert registry.names() == ["add", "echo"]
+    print(f"✅ {len(registry.names())} operations dispatched: {flight.stats()}")
+
+    calculator = _agent_module("calculator_agent_network")
+    listed = calculator.app.test_client().get('/capabilities').get_json()["operations"]
+    assert [op["name"] for op in listed] == calculator.calculator.operations.names(), listed
+    print(f"✅ calculator lists {len(listed)} operations from its registry")
+
+def test_hop_timing_critical_path():
+    """The critical path must follow the slowest segment into the callee's own timing tree"""
+    print("\n⏱️ Testing Hop Timing...")
+    import hop_timing
+
+    timer = hop_timing.HopTimer("calculator_agent")
+    with timer.phase("compute_ms"):
+        time.sleep(0.005)
+        with timer.call("unit_converter_agent", "convert") as record:
+            time.sleep(0.03)
+            record["timing"] = hop_timing.remote_tree({"timing": {"tree": {
+                "name": "unit_converter_agent", "total_ms": 28.0, "queue_ms": 1.0, "compute_ms": 25.0,
+                "serialize_ms": 0.5, "downstream_ms": 0.0, "calls": [], "critical": True}}})
+    timing = hop_timing.timing_tree(timer)
+    tree = timing["tree"]
+    assert tree["downstream_ms"] >= 30 and tree["compute_ms"] < tree["downstream_ms"], tree
+    assert tree["calls"][0]["network_ms"] == round(tree["calls"][0]["wait_ms"] - 28.0, 3), tree
+    assert timing["critical_path"] == ["calculator_agent", "unit_converter_agent", "compute_ms"], timing
+    assert tree["calls"][0]["critical"] and tree["calls"][0]["timing"]["critical"]
+    print(f"✅ critical path: {' > '.join(timing['critical_path'])}")
+
+def test_metrics_exposition():
+    """/metrics must count requests by route and status, and merge snapshots left by other workers"""
+    print("\n📈 Testing Metrics Exposition...")
+    import os
+    import subprocess
+    import tempfile
+    from flask import Flask, jsonify
+    from agent_metrics import AgentMetrics
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask("metrics")
+        metrics = AgentMetrics("test_agent", directory=directory, flush_interval=3600)
+        metrics.instrument(app, operations={"add"})
+
+        @app.route('/message', methods=['POST'])
+        def message():
+            return jsonify({"ok": True})
+
+        client = app.test_client()
+        for operation in ("add", "add", "unlisted"):
+            client.post('/message', json={"message": {"operation": operation}})
+        client.get('/missing')
+
+        # A worker that has exited: its counters stay in the total, its in-flight gauge does not
+        metrics.gauge_add("a2a_requests_in_flight", (), 3)
+        metrics.flush()
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                capture_output=True, text=True).stdout.strip()
+        os.replace(os.path.join(directory, f"test_agent-{os.getpid()}.json"),
+                   os.path.join(directory, f"test_agent-{exited}.json"))
+        metrics.gauge_add("a2a_requests_in_flight", (), 2)
+
+        text = metrics.render()
+    lines = set(text.splitlines())
+    assert 'a2a_requests_total{route="/message",method="POST",status="200"} 6' in lines, text
+    assert 'a2a_requests_total{route="unmatched",method="GET",status="404"} 2' in lines, text
+    assert 'a2a_operation_latency_seconds_count{operation="add"} 4' in lines, text
+    assert 'a2a_operation_latency_seconds_count{operation="other"} 2' in lines, text
+    assert 'a2a_requests_in_flight 5' in lines, text
+    assert 'a2a_request_latency_seconds_bucket{route="/message",le="+Inf"} 6' in lines, text
+    print(f"✅ {len(lines)} exposition lines, two workers merged")
+
+def test_structured_logging():
+    """Records must come out as JSON lines with the correlation ID, filtered by level and sample rate"""
+    print("\n📝 Testing Structured Logging...")
+    import contextvars
+    import os
+    import tempfile
+    from agent_logging import StructuredLogger, bind_correlation_id, parse_sample_rates
+
+    assert parse_sample_rates("a=0.5, b=2,c=x,d") == {"a": 0.5, "b": 1.0}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "agent.log")
+        logger = StructuredLogger("test_agent", level="info", path=path, sample_rates={"noisy": 0.0})
+
+        def handle_request():
+            bind_correlation_id("req-1")
+            logger.info("message.received", operation="add", numbers=[1, 2])
+            logger.debug("hidden")
+            for _ in range(100):
+                logger.info("noisy")
+            logger.error("message.failed", error=ValueError("bad"))
+
+        contextvars.copy_context().run(handle_request)
+        logger.close()
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+    assert [r["event"] for r in records] == ["message.received", "message.failed"], records
+    assert all(r["agent"] == "test_agent" and r["correlation_id"] == "req-1" for r in records), records
+    assert records[0]["numbers"] == [1, 2] and records[1]["error"] == "bad", records
+    assert logger.stats() == {"queued": 0, "written": 2, "dropped": 0}, logger.stats()
+    print(f"✅ {len(records)} JSON lines written: {[r['event'] for r in records]}")
+
+def test_circuit_breaker_fails_fast():
+    """After enough failures a destination is refused without a network call, then probed back to closed"""
+    print("\n🔌 Testing Circuit Breaker...")
+    from agent_client import AgentClient
+    from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerBoard, CircuitOpenError
+
+    client = AgentClient("test", breakers=BreakerBoard(window=4, min_calls=2, failure_rate=0.5, open_seconds=0.05))
+    statuses, sent = [503, 503, 500], []
+
+    def fake_request(method, url, **kwargs):
+        sent.append(url)
+        return _fake_response(statuses[len(sent) - 1])
+
+    client.session.request = fake_request
+    url = "http://peer.invalid:5002/convert"
+    breaker = client.breakers.get("peer.invalid:5002")
+    for _ in range(2):
+        assert client.post(url, json={}).status_code == 503
+    assert breaker.state == OPEN
+    try:
+        client.post(url, json={})
+        raise AssertionError("open breaker let a call through")
+    except CircuitOpenError as e:
+        assert len(sent) == 2 and e.retry_after > 0, (sent, e)
+    print(f"✅ open after 2 failures, rejected: {breaker.to_dict()['rejected']}")
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    try:
+        breaker.before_call()
+        raise AssertionError("half-open breaker admitted a second probe")
+    except CircuitOpenError:
+        pass
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED, breaker.to_dict()
+    assert client.post(url, json={}).status_code == 500 and breaker.state == CLOSED, "closing must start a fresh window"
+    print(f"✅ probe closed the breaker: {client.breakers.stats()}")
+
+def test_adaptive_timeout_scales_with_body():
+    """A large request after a run of small ones gets a proportionally longer learned timeout"""
+    print("\n⏱️  Testing Adaptive Timeouts for Large Bodies...")
+    from agent_client import AgentClient
+    from circuit_breaker import BreakerBoard
+    from peer_latency import LatencyTracker
+
+    tracker = LatencyTracker(min_samples=5, multiplier=3, floor_ms=100)
+    key = ("calculator", "add")
+    for _ in range(10):
+        tracker.record(key, 0.1, 1000)
+    assert abs(tracker.timeout_for(key, 10, 1000) - 0.3) < 1e-9
+    assert abs(tracker.timeout_for(key, 10, 5000) - 1.5) < 1e-9
+    assert tracker.timeout_for(key, 10, 10 ** 6) == 10
+    tracker.record(("calculator", "health"), 0.1)
+    assert tracker.timeout_for(("calculator", "health"), 10, 1000) == 10
+
+    client = AgentClient("test", tracker=tracker, breakers=BreakerBoard(), replicas={})
+    sent = []
+    client.session.request = lambda method, url, timeout=None, **kwargs: sent.append(timeout) or _fake_response(200)
+    client.post("http://calculator.invalid/message", destination="calculator", operation="add", data=b"x" * 1000)
+    client.post("http://calculator.invalid/message", destination="calculator", operation="add", data=b"x" * 20000)
+    assert abs(sent[0] - 0.3) < 0.05 and sent[1] > 5, sent
+    print(f"✅ Learned timeout {sent[0]:.2f}s for 1 KB, {sent[1]:.2f}s for 20 KB")
+
+def test_deadline_propagation():
+    """A spent budget must stop a hop before it computes, and outbound calls must carry what is left"""
+    print("\n⏳ Testing Deadline Propagation...")
+    import contextvars
+    import deadline
+    calculator = _agent_module("calculator_agent_network")
+    client = calculator.app.test_client()
+
+    envelope = {"sender": "test", "message": {"operation": "add", "data": {"numbers": [1, 2]}}}
+    response = client.post('/message', json=dict(envelope, deadline_ms=0))
+    assert response.status_code == 504, response.get_data(as_text=True)
+    assert response.get_json()["steps"][0]["stage"] == "compute", response.get_json()
+    response = client.post('/message', json=envelope, headers={deadline.HEADER: "0"})
+    assert response.status_code == 504, response.get_data(as_text=True)
+    assert client.post('/message', json=dict(envelope, deadline_ms=5000)).status_code == 200
+    print("✅ expired envelope and header deadlines answered 504 before computing")
+
+    def outbound():
+        deadline.start(300)
+        assert deadline.start(10000).remaining_ms() <= 300, "a later deadline must not extend an earlier one"
+        timeout, headers, bound = deadline.outbound(10, {"Accept": "application/json"})
+        assert bound and timeout <= 0.3 and 0 < int(headers[deadline.HEADER]) <= 300, (timeout, headers)
+        assert headers["Accept"] == "application/json"
+        deadline.start(0)
+        try:
+            deadline.outbound(10)
+            raise AssertionError("outbound call allowed with no budget left")
+        except deadline.DeadlineExceeded as e:
+            assert e.stage == "outbound call"
+        return timeout
+
+    timeout = contextvars.copy_context().run(outbound)
+    assert deadline.current() is None
+    print(f"✅ outbound timeout capped to {timeout:.3f}s of a 10s limit")
+
+    from circuit_breaker import HALF_OPEN, CircuitBreaker
+    breaker = CircuitBreaker("peer", min_calls=1, open_seconds=0)
+    breaker.record(False, 0.01)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.cancel()  # a probe cut short by the caller's budget is not counted, so its slot is free again
+    breaker.before_call()
+    print("✅ budget-bound timeout frees the half-open probe slot")
+
+def test_breaker_ignores_budget_504():
+    """A 504 for a call whose forwarded deadline ran out downstream must not count against the peer"""
+    print("\n⌛ Testing Breaker on Deadline 504s...")
+    import contextvars
+    import deadline
+    from agent_client import AgentClient
+    from circuit_breaker import CLOSED, OPEN, BreakerBoard
+
+    client = AgentClient("test", breakers=BreakerBoard(window=4, min_calls=2, failure_rate=0.5))
+    client.session.request = lambda method, url, **kwargs: _fake_response(504, {"error": "Deadline exceeded"})
+    url = "http://peer.invalid:5002/convert"
+    breaker = client.breakers.get("peer.invalid:5002")
+
+    def with_budget():
+        deadline.start(5000)
+        for _ in range(3):
+            assert client.post(url, json={}).status_code == 504
+
+    contextvars.copy_context().run(with_budget)
+    assert breaker.state == CLOSED and breaker.to_dict()["window_calls"] == 0, breaker.to_dict()
+    for _ in range(2):
+        client.post(url, json={})
+    assert breaker.state == OPEN, "a 504 to a call without a deadline is still a peer failure"
+    print("✅ budget 504s left the breaker closed; plain 504s opened it")
+
+# The tests below run in-process and need no agents running
+
+def test_admission_nested_hops():
+    """A hop that calls back into an agent it came through must not wait for its own parent's slot"""
+    print("\n🚦 Testing Admission of Nested Hops...")
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import Flask, jsonify, request
+    import admission
+
+    app = Flask("nested_hops")
+    controller = admission.install(app, admission.AdmissionController(concurrency=1, queue_size=4, max_wait_ms=200))
+    client = app.test_client()
+
+    @app.route('/message', methods=['POST'])
+    def message():
+        if request.get_json().get('callback'):
+            # Like the unit converter calling back into the calculator mid-chain (from another thread, so
+            # the inner request gets its own app context as it would in another agent)
+            with ThreadPoolExecutor(1) as pool:
+                inner = pool.submit(client.post, '/message', json={}, headers=admission.outbound()).result()
+            return jsonify({"inner": inner.status_code})
+        return jsonify({"ok": True})
+
+    response = client.post('/message', json={"callback": True})
+    assert response.status_code == 200 and response.get_json()["inner"] == 200, response.get_json()
+    gate = controller.stats()["routes"]["/message"]
+    assert gate["nested"] == 1 and gate["rejected"] == 0 and gate["active"] == 0, gate
+    # Outside an admitted request, calls are not marked nested
+    assert admission.outbound() is None
+    print("✅ Nested hop admitted while its parent holds the only slot")
+
+def test_admission_reserved_slots_with_nested_hops():
+    """Nested interactive hops must not compete with their parents for the reserved interactive slots"""
+    print("\n🚦 Testing Reserved Interactive Slots with Nested Hops...")
+    import admission
+    import priority
+
+    controller = admission.AdmissionController(concurrency=3, queue_size=4, max_wait_ms=50, reserved=1)
+    controller.admit('/message', 0, cls=priority.BATCH)
+    controller.admit('/message', 0, cls=priority.BATCH)
+    controller.admit('/message', 0, cls=priority.INTERACTIVE)  # the parent takes the reserved slot
+    started = time.perf_counter()
+    assert controller.admit('/message', 0, cls=priority.INTERACTIVE, nested=True) == 0.0
+    assert time.perf_counter() - started < 0.01
+    controller.done('/message', 0, 0.0, nested=True)
+    try:
+        controller.admit('/message', 0, cls=priority.INTERACTIVE)
+        raise AssertionError("a fourth top-level request got a slot")
+    except admission.Rejected as e:
+        assert e.reason == "wait_timeout", e.reason
+    gate = controller.stats()["routes"]["/message"]
+    assert gate["active"] == 3 and gate["nested"] == 1, gate
+    print("✅ Nested hop admitted at once while batch work fills the pool and its parent holds the reserved slot")
+
+def test_admission_nested_trust():
+    """X-A2A-Nested from an untrusted address must not skip the slots, and nested hops are capped per route"""
+    print("\n🚦 Testing Trust of Nested Hops...")
+    from flask import Flask, jsonify
+    import admission
+
+    app = Flask("nested_trust")
+    controller = admission.install(app, admission.AdmissionController(
+        concurrency=1, queue_size=4, max_wait_ms=20, nested_limit=1, trusted_peers=["198.51.100.7"]))
+    app.add_url_rule('/message', 'message', lambda: jsonify(ok=True), methods=['POST'])
+    client = app.test_client()
+    controller.admit('/message', 0)  # a parent holds the only slot
+
+    def post(addr, value):
+        return client.post('/message', json={}, headers={admission.NESTED_HEADER: value},
+                           environ_base={'REMOTE_ADDR': addr}).status_code
+
+    assert post("203.0.113.9", "1") == 429, "a spoofed nested header skipped the slots"
+    assert post("203.0.113.9", f"abc,{admission.PROCESS_TOKEN}") == 200, "own token forwarded by the chain"
+    assert post("198.51.100.7", "1") == 200 and post("127.0.0.1", "1") == 200
+    print("✅ nested claims believed only from loopback, trusted peers or with this process's token")
+
+    controller.admit('/message', 0, nested=True)
+    response = client.post('/message', json={}, headers={admission.NESTED_HEADER: "1"})
+    assert response.status_code == 429 and "nested_full" in response.get_json()["error"], response.get_json()
+    gate = controller.stats()["routes"]["/message"]
+    assert gate["nested_active"] == 1 and gate["nested_limit"] == 1, gate
+    assert admission.parse_route_limits("/message=4:16:2,/stats=2")["/message"] == (4, 16, 2)
+    print(f"✅ nested hops capped at {gate['nested_limit']} per route")
+
+def test_unit_converter_sheds_to_local_math():
+    """A busy calculator (429/503) makes the unit converter compute locally instead of failing"""
+    print("\n🔄 Testing Unit Converter Fallback on Load Shedding...")
+    unit = _agent_module("unit_converter_network", "Y_Agent")
+    original = unit.client.post
+    try:
+        for status in unit.SHED_STATUSES:
+            unit.client.post = lambda *args, **kwargs: _fake_response(status, {"error": "Too many requests"})
+            result = unit.converter.call_calculator("multiply", {"numbers": [2, 3]})
+            assert result == {"success": True, "result": 6, "operation": "local_multiply"}, result
+            converted = unit.converter.convert_units(10, "meter", "centimeter")
+            assert converted["success"] and abs(converted["result"] - 1000) < 1e-9, converted
+            print(f"✅ HTTP {status}: computed locally")
+        unit.client.post = lambda *args, **kwargs: _fake_response(500)
+        assert not unit.converter.call_calculator("multiply", {"numbers": [2, 3]})["success"]
+    finally:
+        unit.client.post = original
+
+def test_rate_limit_buckets():
+    """Token buckets must throttle each sender separately, refill over time and stay bounded"""
+    print("\n🪣 Testing Rate Limiting...")
+    from flask import Flask, jsonify
+    from rate_limit import RateLimiter, TokenBuckets, install, parse_bucket
+
+    assert parse_bucket("5:20", "0") == (5.0, 20.0) and parse_bucket("bad", "2") == (2.0, 2.0)
+    buckets = TokenBuckets(rate=2, burst=2, max_keys=3)
+    assert [buckets.take("a", now=0) for _ in range(3)] == [0.0, 0.0, 0.5]
+    assert buckets.take("a", now=0.5) == 0.0, "half a second refills one token at 2/s"
+    for i, key in enumerate("bcde"):
+        buckets.take(key, now=1 + i)
+    assert buckets.stats()["keys"] <= 3 and buckets.evicted >= 2, buckets.stats()
+    print(f"✅ buckets refill and evict: {buckets.stats()}")
+
+    app = Flask("rate_limit")
+    install(app, RateLimiter(sender=(0.001, 2)))
+
+    @app.route('/message', methods=['POST'])
+    def message():
+        return jsonify({"ok": True})
+
+    client = app.test_client()
+    codes = [client.post('/message', json={"sender": "noisy"}).status_code for _ in range(3)]
+    relayed = client.post('/message', json={"sender": "calculator_agent", "origin": "quiet"})
+    assert codes == [200, 200, 429] and relayed.status_code == 200, (codes, relayed.status_code)
+    throttled = client.post('/message', json={"sender": "noisy"})
+    assert int(throttled.headers["Retry-After"]) >= 1, throttled.headers
+    print(f"✅ per-sender limit: {codes}, relayed origin still served")
+
+def test_rate_limit_client_ip():
+    """X-Forwarded-For must only be read behind a trusted proxy, and then only its right-most untrusted hop"""
+    print("\n🪣 Testing Rate Limit Client Address...")
+    from flask import Flask, jsonify
+    from rate_limit import RateLimiter, install, parse_networks
+
+    limiter = RateLimiter(ip=(0.001, 1), trusted_proxies=parse_networks("10.0.0.0/8,bad,192.0.2.1"))
+    assert limiter.client_ip("203.0.113.5", "1.2.3.4") == "203.0.113.5", "untrusted peers cannot pick their key"
+    assert limiter.client_ip("10.0.0.2", "6.6.6.6, 198.51.100.9, 192.0.2.1") == "198.51.100.9"
+    assert limiter.client_ip("10.0.0.2", "10.1.1.1") == "10.1.1.1" and limiter.client_ip("10.0.0.2") == "10.0.0.2"
+
+    app = Flask("rate_limit_ip")
+    install(app, limiter)
+    app.add_url_rule('/message', 'message', lambda: jsonify(ok=True), methods=['POST'])
+    client = app.test_client()
+    codes = [client.post('/message', json={"sender": f"s{i}"}, headers={"X-Forwarded-For": f"9.9.9.{i}"},
+                         environ_base={'REMOTE_ADDR': "203.0.113.5"}).status_code for i in range(2)]
+    assert codes == [200, 429], "rotating X-Forwarded-For or sender must not dodge the IP limit"
+    print(f"✅ forwarded hops ignored from untrusted peers: {codes}")
+
+def test_async_jobs():
+    """An async /message must answer 202 at once and leave its result pollable; a full queue refuses work"""
+    print("\n📬 Testing Asynchronous Jobs...")
+    import threading
+    from jobs import FAILED, SUCCEEDED, JobManager, JobQueueFull
+    calculator = _agent_module("calculator_agent_network")
+    client = calculator.app.test_client()
+
+    envelope = {"sender": "test", "async": True, "message": {"operation": "multiply", "data": {"numbers": [6, 7]}}}
+    accepted = client.post('/message', json=envelope)
+    assert accepted.status_code == 202, accepted.get_data(as_text=True)
+    location = accepted.headers["Location"]
+    for _ in range(200):
+        job = client.get(location).get_json()
+        if job["status"] in (SUCCEEDED, FAILED):
+            break
+        time.sleep(0.01)
+    assert job["status"] == SUCCEEDED and job["http_status"] == 200, job
+    assert job["result"]["steps"][0]["result"] == 42, job["result"]
+    assert client.get('/jobs/unknown').status_code == 404
+    print(f"✅ job {job['job_id'][:8]} polled to {job['status']}")
+
+    manager, release = JobManager("test", workers=1, queue_size=1), threading.Event()
+    blocked = manager.submit(lambda: (release.wait(2), 200))
+    manager.submit(lambda: ({"ok": True}, 200))
+    try:
+        manager.submit(lambda: ({}, 200))
+        raise AssertionError("job accepted past workers + queue_size")
+    except JobQueueFull:
+        pass
+    release.set()
+    manager._executor.shutdown(wait=True)
+    assert manager.stats()["jobs"] == {"queued": 0, "running": 0, "succeeded": 2, "failed": 0}, manager.stats()
+    assert manager.get(blocked["job_id"])["status"] == SUCCEEDED
+    print(f"✅ third job refused while two were pending: {manager.stats()['jobs']}")
+
+def test_agent_store_warm_restart():
+    """Cached results and finished jobs written by one process must be there for the next"""
+    print("\n💾 Testing Agent Store Warm Restart...")
+    import os
+    import tempfile
+    from agent_store import AgentStore, ResultCache
+    from jobs import SUCCEEDED, JobManager
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "agent.sqlite3")
+        store = AgentStore(path)
+        cache = ResultCache(store, capacity=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, {"success": True, "result": key})
+        cache.get("c")
+        store.put("config", "ttl", 1, ttl=0.01)
+        store.put("config", "kept", {"x": [1, 2]})
+        jobs = JobManager("test", workers=1, store=store)
+        job = jobs.submit(lambda: ({"result": 42}, 200), spec={"operation": "add"})
+        jobs._executor.shutdown(wait=True)
+        store.close()
+        assert store.stats()["failed"] == 0, store.stats()
+
+        time.sleep(0.02)
+        restarted = AgentStore(path)
+        warm = ResultCache(restarted, capacity=2)
+        assert warm.warmed == 2 and warm.get("a") is None and warm.get("c")["result"] == "c", warm.stats()
+        assert restarted.load(ResultCache.NAMESPACE)[0][0] == "c", "the most used entry must load first"
+        assert restarted.load("config") == [("kept", {"x": [1, 2]})], restarted.load("config")
+        resumed = JobManager("test", store=restarted)
+        assert resumed.restore(lambda spec: None) == 0
+        assert resumed.get(job["job_id"])["status"] == SUCCEEDED, resumed.stats()
+        restarted.close()
+    print(f"✅ warm restart: {warm.stats()}")
+
+    from operation_registry import OperationRegistry
+
+    class DictCache(dict):
+        def put(self, key, value):
+            self[key] = value
+
+    calls = []
+
+    def add(numbers):
+        calls.append(numbers)
+        return {"success": True, "result": sum(numbers)}
+
+    registry = OperationRegistry(cache=DictCache())
+    registry.register("add", add, [("numbers", "list", [])], cacheable=True)
+    registry.register("sum", add, [("numbers", "list", [])])
+    registry.register("echo", lambda x: {"success": True, "result": x}, [("x", "number", 0)], cost_class="constant",
+                      cacheable=True)
+    assert registry.dispatch("add", {"numbers": [1, 2, 3]})["result"] == 6
+    assert registry.dispatch("add", {"numbers": [1, 2, 3]})["result"] == 6
+    assert len(calls) == 1 and len(registry.cache) == 1, "repeat must be served from the cache"
+    assert registry.dispatch("echo", {})["result"] == 0 and len(registry.cache) == 1
+    registry.dispatch("sum", {"numbers": [1, 2, 3]})
+    registry.dispatch("sum", {"numbers": [1, 2, 3]})
+    assert len(calls) == 3 and len(registry.cache) == 1, "operations must opt in to the result cache"
+    unit = _agent_module("unit_converter_network", "Y_Agent")
+    assert unit.converter.operations.cache is None and not unit.converter.operations.get("convert").cacheable
+    print("✅ registry caches only opted-in operations; conversions, which call the calculator, never")
+
+    class Unprintable:
+        def __str__(self):
+            raise RuntimeError("no")
+
+    class Recorder:
+        def __init__(self):
+            self.puts = []
+
+        def put(self, namespace, key, value, ttl=None):
+            self.puts.append(value)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = AgentStore(os.path.join(directory, "agent.sqlite3"))
+        store.put("config", "bad", Unprintable())
+        store.flush()
+        store.put("config", "good", 1)
+        store.flush()
+        assert store._writer.is_alive() and store.stats()["failed"] == 1, store.stats()
+        assert store.load("config") == [("good", 1)]
+        store.close()
+    recorder = Recorder()
+    jobs = JobManager("test", workers=1, store=recorder)
+    job = jobs.submit(lambda: ({"result": 1}, 200), spec={"operation": "add"})
+    jobs._executor.shutdown(wait=True)
+    assert recorder.puts[0] is not job and recorder.puts[0]["status"] != recorder.puts[-1]["status"], recorder.puts
+    print("✅ a failing batch is dropped without stopping the writer, and jobs are queued as snapshots")
+
+def _orchestrator_args(**overrides):
+    import argparse
+    defaults = dict(numbers="10,20,30", from_unit="meter", to_unit="feet", stats_op="mean", stats_list=None,
+                    handoff="auto", priority="batch", deadline_ms=None, execution="orchestrate", bulk=None,
+                    workers=4, max_in_flight=None, unordered=False, output=None, checkpoint=None,
+                    dag=None, dag_workers=None, vector=None, chunk_size=10000)
+    return argparse.Namespace(**dict(defaults, **overrides))
+
+def test_bulk_mode_order_and_resume():
+    """Bulk results must come out in input order, record failures per line and resume from a checkpoint"""
+    print("\n📦 Testing Bulk Pipeline Mode...")
+    import os
+    import tempfile
+    orchestrator = _agent_module("pipeline_orchestrator")
+    ran = []
+
+    def fake_pipeline(spec, urls, say=None):
+        ran.append(spec["id"])
+        time.sleep(0.02 * (5 - spec["id"]))  # later lines finish first
+        return {"final": sum(spec["numbers"]), "correlation_id": spec["correlation_id"]}
+
+    lines = [json.dumps({"id": i, "numbers": [i, i]}) for i in range(1, 5)]
+    lines.insert(2, json.dumps({"id": 9, "stats_op": "nope"}))
+    real_pipeline, orchestrator.run_pipeline = orchestrator.run_pipeline, fake_pipeline
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            source, output = os.path.join(directory, "in.ndjson"), os.path.join(directory, "out.ndjson")
+            checkpoint = os.path.join(directory, "progress.json")
+            with open(source, "w") as f:
+                f.write("\n".join(lines[:3]) + "\n\n")
+            args = _orchestrator_args(bulk=source, output=output, checkpoint=checkpoint)
+            assert orchestrator.run_bulk(args, {}) == 1, "a failed line must make the run exit 1"
+            with open(source, "a") as f:
+                f.write("\n".join(lines[3:]) + "\n")
+            ran.clear()
+            assert orchestrator.run_bulk(args, {}) == 0
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+    finally:
+        orchestrator.run_pipeline = real_pipeline
+    assert [r["line"] for r in records] == [1, 2, 3, 5, 6], records
+    assert [r.get("final") for r in records] == [2.0, 4.0, None, 6.0, 8.0], records
+    assert "unknown stats_op" in records[2]["error"] and sorted(ran) == [3, 4], ran
+    print(f"✅ {len(records)} records in input order; the resumed run only ran lines {sorted(ran)}")
+
+def test_dialect_cache():
+    """The unit converter's dialect must be probed once, reused, kept across restarts and re-probed when it breaks"""
+    print("\n🗣️ Testing Unit Converter Dialect Cache...")
+    import os
+    import tempfile
+    from agent_store import AgentStore
+    orchestrator = _agent_module("pipeline_orchestrator")
+    accepted, calls = {"from/to"}, []
+
+    def fake_post_json(url, payload, destination=None, meta=None):
+        data = (payload.get("message") or {}).get("data", payload)
+        shape = "from/to" if "from" in data else "fromUnit/toUnit" if "fromUnit" in data else "other"
+        calls.append(shape)
+        if shape not in accepted:
+            raise RuntimeError("422")
+        if meta is not None:
+            meta["version"] = "v1"
+        return {"response": {"result": data["value"] * 2}}
+
+    real = orchestrator.post_json, orchestrator.dialects
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store = AgentStore(os.path.join(directory, "orchestrator.sqlite3"))
+            orchestrator.post_json, orchestrator.dialects = fake_post_json, orchestrator.DialectCache(store)
+            convert = lambda: orchestrator.unit_convert("http://unit:5002", "cid", [], 1.5, "meter", "feet")
+            assert convert()[:2] == (3.0, "/message (variant: from/to)") and len(calls) == 3, calls
+            calls.clear()
+            assert convert()[0] == 3.0 and calls == ["from/to"], calls
+            store.close()
+            restarted = AgentStore(store.path)
+            assert orchestrator.DialectCache(restarted).get("http://unit:5002") == "/message (variant: from/to)"
+
+            accepted, calls[:] = {"fromUnit/toUnit"}, []
+            assert convert()[1] == "/message (variant: fromUnit/toUnit)", calls
+            assert calls == ["from/to", "other", "other", "fromUnit/toUnit"], "the stale dialect must not be tried twice"
+            restarted.close()
+    finally:
+        orchestrator.post_json, orchestrator.dialects = real
+    print(f"✅ dialect learned once, reused, and re-probed after a change: {calls}")
+
+    from operation_registry import OperationRegistry
+    registry = OperationRegistry()
+    registry.register("add", lambda numbers: {"success": True, "result": sum(numbers)}, [("numbers", "list", [])])
+    version = registry.version()
+    registry.register("negate", lambda x: {"success": True, "result": -x}, [("x", "number", 0)])
+    assert registry.version() != version, "a new operation must change the API version"
+    calculator = _agent_module("calculator_agent_network")
+    client = calculator.app.test_client()
+    versions = {client.get(path).headers.get("X-Agent-Version") for path in ('/health', '/health', '/nope')}
+    assert len(versions) == 1 and len(next(iter(versions))) == 12, versions
+    print(f"✅ calculator advertises version {versions.pop()} on every response")
+
+def test_dag_pipeline():
+    """DAG steps must run as soon as their inputs exist, in parallel where independent, and skip what a failure feeds"""
+    print("\n🕸️ Testing DAG Pipelines...")
+    import os
+    from pipeline_dag import Dag, DagError, load_spec
+
+    spec = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_dag.json"))
+    dag = Dag(spec)
+    assert dag.order.index("total") < dag.order.index("feet") < dag.order.index("mean") and dag.outputs == ["spread", "mean"]
+
+    def call(name, node, data):
+        time.sleep(0.05)
+        if node["agent"] == "calculator":
+            numbers = data["numbers"]
+            return sum(numbers) if node["operation"] == "add" else numbers[0] * numbers[1]
+        if node["agent"] == "unit_converter":
+            return data["value"] * (3.28084 if data["to_unit"] == "feet" else 39.3701)
+        return max(data["numbers"]) - min(data["numbers"]) if node["operation"] == "range" else sum(data["numbers"]) / 3
+
+    results, timings, totals = dag.run(call)
+    assert results["feet"] == 60 * 3.28084 and results["spread"] == 60 * 39.3701 - 7.0, results
+    assert totals["elapsed_ms"] < totals["serial_ms"] * 0.7, totals
+    print(f"✅ {len(results)} steps in {totals['elapsed_ms']:.0f}ms (serial {totals['serial_ms']:.0f}ms)")
+
+    def failing(name, node, data):
+        if name == "inches":
+            raise RuntimeError("agent down")
+        return call(name, node, data)
+
+    results, timings, _ = dag.run(failing)
+    assert timings["inches"]["status"] == "failed" and "feet" in results, timings
+    assert timings["mean"]["status"] == timings["spread"]["status"] == "skipped", timings
+    for bad in ({"nodes": {"a": {"agent": "calculator", "operation": "add", "data": {"numbers": ["$b"]}},
+                           "b": {"agent": "calculator", "operation": "add", "data": {"numbers": ["$a"]}}}},
+                {"nodes": {"a": {"agent": "calculator", "operation": "add", "data": {"numbers": ["$missing"]}}}},
+                {"nodes": {"a": {"agent": "printer", "operation": "print"}}}):
+        try:
+            Dag(bad)
+            raise AssertionError(f"invalid DAG accepted: {bad}")
+        except DagError:
+            pass
+    print("✅ failed step skipped its dependents; cycles and unknown nodes are refused")
+
+def test_chain_planner():
+    """The planner must push a chain down when the Calculator is closer to its peers than the client is"""
+    print("\n🧭 Testing Chain Planner...")
+    from chain_planner import ORCHESTRATE, PUSH_DOWN, ChainPlanner
+
+    peers = {"unit_converter": "http://unit:5002", "statistics": "http://stats:5003"}
+
+    class FakeClient:
+        def __init__(self, client_ms, peer_ms):
+            self.client_ms, self.peer_ms, self.calls = client_ms, peer_ms, 0
+
+        def get(self, url, destination=None, **kwargs):
+            self.calls += 1
+            if url.endswith("/config/agents"):
+                return _fake_response(200, {"unit_converter": "http://unit:5002/", "statistics": "http://stats:5003"})
+            if destination == "calculator":
+                time.sleep(0.002)
+                return _fake_response(200, {"peer_latency": {"peers": {
+                    f"{dest}:health": {"p50_ms": self.peer_ms} for dest in peers}}})
+            time.sleep(self.client_ms / 1000)
+            return _fake_response(200)
+
+        def post(self, url, **kwargs):
+            return _fake_response(200)
+
+    far = FakeClient(client_ms=20, peer_ms=0.5)
+    planner = ChainPlanner(far, samples=1)
+    plan = planner.plan("http://calc:5001", peers)
+    assert plan["mode"] == PUSH_DOWN and not plan["cached"], plan
+    calls = far.calls
+    assert planner.plan("http://calc:5001/", peers)["cached"] and far.calls == calls, "the plan must be reused"
+    planner.invalidate("http://calc:5001", peers)
+    assert not planner.plan("http://calc:5001", peers)["cached"]
+    print(f"✅ remote client: {plan['mode']}, est. {plan['estimated_ms']}")
+
+    near = ChainPlanner(FakeClient(client_ms=0, peer_ms=50), samples=1).plan("http://calc:5001", peers)
+    assert near["mode"] == ORCHESTRATE, near
+    unknown = ChainPlanner(FakeClient(client_ms=0, peer_ms=1), samples=1).plan(
+        "http://calc:5001", dict(peers, statistics="http://elsewhere:5003"))
+    assert unknown["mode"] == ORCHESTRATE and "unknown" in unknown["reason"], unknown
+    print(f"✅ nearby client: {near['mode']}; unmeasured peer: {unknown['reason']}")
+
+    import pipeline_orchestrator
+    urls = {"calc_base": "http://calc:5001", "unit_base": "http://unit:5002", "stats_base": "http://stats:5003"}
+    assert pipeline_orchestrator.choose_execution({}, urls) == (ORCHESTRATE, None)
+    assert pipeline_orchestrator.pipeline_spec({"numbers": [1, 2]}, _orchestrator_args())["execution"] == ORCHESTRATE
+    assert pipeline_orchestrator.pipeline_spec({"numbers": [1, 2], "execution": "auto"}, _orchestrator_args())["execution"] == "auto"
+    print("✅ pipelines orchestrate unless auto or push-down is asked for")
+
+def _route_to(client, app, sent):
+    """Point an AgentClient at a Flask app's test client instead of the network"""
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import urlparse
+    test_client = app.test_client()
+
+    def request(method, url, timeout=None, **kwargs):
+        sent.append(urlparse(url).path)
+        # From another thread, so the peer's request gets its own app context as it would in its own process
+        with ThreadPoolExecutor(1) as pool:
+            answer = pool.submit(test_client.open, urlparse(url).path, method=method, data=kwargs.get('data'),
+                                 json=kwargs.get('json'), headers=kwargs.get('headers')).result()
+        response = requests.Response()
+        response.status_code, response._content = answer.status_code, answer.get_data()
+        response.headers.update(answer.headers)
+        return response
+
+    client.session.request = request
+
+def test_batched_chains():
+    """N chains sent as one batch must reach the next agent in one request and keep their own results"""
+    print("\n📚 Testing Batched Chains...")
+    calculator = _agent_module("calculator_agent_network")
+    stats = _agent_module("web_server", "P_Agent")
+    sent = []
+    real_request = calculator.client.session.request
+    _route_to(calculator.client, stats.app, sent)
+    try:
+        chains = [{"correlation_id": f"c{i}", "message": {"operation": "add", "data": {"numbers": [i, i]}},
+                   "next": {"url": "http://statistics.invalid:5003/message",
+                            "handoff": {"operation": "mean", "data": {"numbers": [0, 3]}}}} for i in range(1, 6)]
+        chains.append({"correlation_id": "bad", "message": {"operation": "nope"}})
+        response = calculator.app.test_client().post('/message', json={"sender": "test", "batch": chains})
+    finally:
+        calculator.client.session.request = real_request
+    body = response.get_json()
+    assert response.status_code == 200 and body["round_trips"] == 1 and sent == ["/message"], (body, sent)
+    finals = [item["final"] for item in body["batch"]]
+    assert finals == [(2 * i + 3) / 3 for i in range(1, 6)] + [None], finals
+    assert body["batch"][0]["steps"][1]["batched"] == 5 and "error" in body["batch"][-1], body["batch"]
+    print(f"✅ {body['count']} chains, {body['round_trips']} downstream request: {finals}")
+
+def test_stream_sized_body():
+    """/stream must work for an ordinary POST with Content-Length, not only chunked uploads"""
+    print("\n🌊 Testing /stream with a Sized Body...")
+    from stream_chain import CONTENT_TYPE, request_body
+    stats = _agent_module("web_server", "P_Agent")
+
+    body = b"".join(request_body({"operation": "mean"}, [[1, 2, 3], [4, 5], [6]]))
+    response = stats.app.test_client().post('/stream', data=body, content_type=CONTENT_TYPE)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    final = json.loads(response.get_data(as_text=True).strip().splitlines()[-1])
+    assert final["success"] and final["result"] == 3.5, final
+    assert final["steps"][0]["items"] == 6, final
+    print(f"✅ mean of a {len(body)}-byte stream: {final['result']}")
+
+def test_stream_statistics_match_list():
+    """A streamed statistics operation must answer with the fields and errors of its list handler"""
+    print("\n🧮 Testing Streamed vs List Statistics...")
+    from stream_chain import CONTENT_TYPE, request_body
+    stats = _agent_module("web_server", "P_Agent")
+    numbers = [10, 15, 20, 25, 30, 25, 15]
+
+    def streamed(operation, chunks):
+        body = b"".join(request_body({"operation": operation}, chunks))
+        response = stats.app.test_client().post('/stream', data=body, content_type=CONTENT_TYPE)
+        return json.loads(response.get_data(as_text=True).strip().splitlines()[-1])["response"]
+
+    for operation in ("mean", "median", "mode", "standard_deviation", "range", "summary"):
+        expected = json.loads(json.dumps(stats.stats_agent.process_request(operation, {"numbers": numbers})))
+        got = streamed(operation, [numbers[:3], numbers[3:5], numbers[5:]])
+        assert got == expected, (operation, got, expected)
+    print(f"✅ 6 operations over 3 chunks match the list handlers")
+
+    for operation, chunks in (("standard_deviation", [[4]]), ("median", [])):
+        expected = stats.stats_agent.process_request(operation, {"numbers": sum(chunks, [])})
+        got = streamed(operation, chunks)
+        assert not got["success"] and got["error"] == expected["error"], (operation, got, expected)
+    print(f"✅ errors match too: {got['error']}")
+
+def test_wire_frame_round_trip_types():
+    """Binary frames must give back every element with the type JSON would, ints included"""
+    print("\n📦 Testing Wire Frame Round Trips...")
+    from wire import decode_frame, encode_frame
+    mixed = [1, 2.5] + list(range(3, 40))
+    envelope = {"ints": list(range(40)), "floats": [i / 2 for i in range(40)], "mixed": mixed,
+                "huge": [2 ** 70] * 20, "short": [1, 2.0]}
+    decoded = decode_frame(encode_frame(envelope))
+    assert decoded == json.loads(json.dumps(envelope)), decoded
+    for key, values in envelope.items():
+        assert [type(v) for v in decoded[key]] == [type(v) for v in values], key
+    print(f"✅ {len(envelope)} lists kept their element types, e.g. mixed: {decoded['mixed'][:3]}")
+
+def test_local_transport():
+    """Calls to a co-located agent must go over its Unix socket, and over TCP when that socket is dead"""
+    print("\n🔌 Testing Unix Socket Transport...")
+    import os
+    import socket
+    import tempfile
+    import threading
+    from flask import Flask, jsonify
+    from werkzeug.serving import make_server
+    from local_transport import LocalAdapter, _close, private_dir_error, serve, socket_path
+
+    app = Flask("local_transport")
+
+    @app.route('/whoami')
+    def whoami():
+        return jsonify({"agent": "local_transport"})
+
+    with tempfile.TemporaryDirectory(dir="/tmp") as directory:
+        session, adapter = requests.Session(), LocalAdapter(directory, retry_after=60)
+        session.mount("http://", adapter)
+        server = serve(app, 59871, directory=directory)
+        try:
+            # Nothing listens on TCP port 59871: only the socket can answer
+            assert session.get("http://localhost:59871/whoami", timeout=5).status_code == 200
+            assert adapter.calls == {"unix": 1, "tcp": 0, "fallback": 0}, adapter.calls
+        finally:
+            _close(server, socket_path(59871, directory))
+
+        tcp = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=tcp.serve_forever, daemon=True).start()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path(tcp.port, directory))  # left behind by an agent that died: refuses connections
+        stale.close()
+        try:
+            for _ in range(2):
+                assert session.get(f"http://127.0.0.1:{tcp.port}/whoami", timeout=5).status_code == 200
+        finally:
+            tcp.shutdown()
+        assert adapter.calls == {"unix": 2, "tcp": 1, "fallback": 1}, adapter.calls
+        assert adapter.socket_for("http://example.com:5001/") is None
+        session.close()
+    print(f"✅ socket used when listening, TCP after a refused connect: {adapter.stats()['calls']}")
+
+    with tempfile.TemporaryDirectory(dir="/tmp") as parent:
+        shared, private = os.path.join(parent, "shared"), os.path.join(parent, "private")
+        os.mkdir(shared, 0o700)
+        os.chmod(shared, 0o777)
+        os.mkdir(private, 0o700)
+        link = os.path.join(parent, "link")
+        os.symlink(private, link)
+        for directory in (shared, link):
+            assert serve(app, 59872, directory=directory) is None, directory
+        planted = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        planted.bind(socket_path(59873, shared))
+        planted.listen(1)
+        try:
+            assert LocalAdapter(shared).socket_for("http://localhost:59873/") is None
+        finally:
+            planted.close()
+        assert private_dir_error(private) is None and "symlink" in private_dir_error(link)
+        print(f"✅ no socket served or used in a directory others can write or a symlink: {private_dir_error(shared)}")
+
+def test_shared_memory_handoff():
+    """A list handed over in shared memory must give the same answers as inline, and leave no segment behind"""
+    print("\n🧠 Testing Shared-Memory Handoff...")
+    import math
+    import os
+    import tempfile
+    import shared_array
+    stats = _agent_module("web_server", "P_Agent")
+    client = stats.app.test_client()
+
+    def ask(operation, numbers):
+        envelope = {"sender": "test", "message": {"operation": operation, "data": {"numbers": numbers}}}
+        return client.post('/message', json=envelope).get_json()["response"]
+
+    values = [float(i % 97) for i in range(5000)]
+    for operation in ("mean", "median", "standard_deviation"):
+        with shared_array.handoff(values, min_items=1) as sent:
+            name = shared_array.descriptor(sent)["name"]
+            shared = ask(operation, sent)
+        # Reductions run as streaming aggregates over the mapping, so the last bit may differ
+        assert math.isclose(shared["result"], ask(operation, values)["result"], rel_tol=1e-12), (operation, shared)
+        assert not os.path.exists(os.path.join(shared_array.SHM_DIR, name)), f"{name} was not unlinked"
+    print(f"✅ mean/median/stdev over {len(values)} shared values match the inline answers")
+
+    refused = ask("mean", {shared_array.KEY: {"name": "../../etc/passwd", "dtype": "d", "length": 1}})
+    assert refused["shared_memory"] == "unavailable" and not refused["success"], refused
+    with shared_array.handoff([1, 2.5] * 10, min_items=1) as sent:
+        assert sent == [1, 2.5] * 10, "mixed int/float lists must be sent inline"
+    with shared_array.handoff(values, min_items=1) as sent:
+        guessed = {shared_array.KEY: dict(sent[shared_array.KEY], token="00" * shared_array.TOKEN_BYTES)}
+        assert "token" in ask("mean", guessed)["error"]
+        remote = client.post('/message', json={"sender": "test", "message": {"operation": "mean", "data": {"numbers": sent}}},
+                             environ_base={"REMOTE_ADDR": "203.0.113.7"}).get_json()["response"]
+        assert remote["shared_memory"] == "unavailable" and "this host" in remote["error"], remote
+
+    import fcntl
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("a2a_dead_seg1", "a2a_dead.lock", "a2a_live_seg1", "a2a_live.lock", "a2a_unknown_seg1",
+                     f"a2a_{shared_array.OWNER}_seg1", "other_segment"):
+            open(os.path.join(directory, name), "w").close()
+        with open(os.path.join(directory, "a2a_live.lock")) as held:
+            # The owner of "live" still runs (here: holds its lock); "unknown" has no lock to prove it is gone
+            fcntl.flock(held, fcntl.LOCK_EX)
+            assert shared_array.sweep(directory) == 1
+        assert sorted(os.listdir(directory)) == sorted(["a2a_live_seg1", "a2a_live.lock", "a2a_unknown_seg1",
+                                                        f"a2a_{shared_array.OWNER}_seg1", "other_segment"])
+    print("✅ foreign, guessed and remote descriptors refused; only segments of exited owners swept")
+
 def main():
     """Run all tests"""
     print("🚀 Multi-Agent System Test Suite")
@@ -217,6 +1318,7 @@ def main():
     test_calculator_agent()
     test_unit_converter_agent()
     test_statistics_agent()
+    test_expression_evaluation()
     
     # Test 3: A2A communication
     test_a2a_communication()
@@ -0,0 +1,268 @@
+"""
+Compact binary encodings for A2A envelopes
+JSON stays the default. FRAME is a small JSON header followed by every numeric list of at least
+WIRE_MIN_ARRAY items as a raw little-endian int64/float64 buffer, so number arrays never go through
+decimal text; MessagePack is offered as well when the msgpack package is installed. Agents answer in
+the best format a request's Accept header allows, and clients switch a peer to a binary format once
+it has answered in one
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack is only offered when installed
+    msgpack = None
+
+JSON = "application/json"
+FRAME = "application/x-a2a-frame"
+MSGPACK = "application/msgpack"
+NAMES = {"json": JSON, "frame": FRAME, "msgpack": MSGPACK}
+
+MAGIC = b"A2F1"
+_PREFIX = struct.Struct("<4sI")  # magic, header length
+_ARRAY = struct.Struct("<c7xQ")  # typecode, item count
+_REF = "$array"  # header placeholder for a packed list; reserved as a single-key object
+_INT64 = (-(1 << 63), (1 << 63) - 1)
+
+MIN_ARRAY = int(os.getenv('WIRE_MIN_ARRAY', 16))
+
+
+class WireError(ValueError):
+    """A body is not valid in the format its Content-Type names"""
+
+
+def _plain(value):
+    """JSON/MessagePack fallback for array buffers"""
+    if isinstance(value, (array, memoryview)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def as_array(values, min_items=None):
+    """An int64 or float64 array holding exactly the values of a list of numbers (of at least
+    min_items, default MIN_ARRAY), else None. Lists mixing ints and floats are not packed: float64
+    would turn their ints into floats, which JSON keeps apart"""
+    if len(values) < (MIN_ARRAY if min_items is None else min_items):
+        return None
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        if min(values) >= _INT64[0] and max(values) <= _INT64[1]:
+            return array('q', values)
+        return None
+    if kinds == {float}:
+        return array('d', values)
+    return None
+
+
+def _pack(value, buffers):
+    if isinstance(value, dict):
+        return {k: _pack(v, buffers) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        packed = as_array(value)
+        if packed is None:
+            return [_pack(v, buffers) for v in value]
+        value = packed
+    elif isinstance(value, memoryview) and value.format in ('d', 'q'):
+        value = array(value.format, value)
+    elif not isinstance(value, array) or value.typecode not in ('d', 'q'):
+        return value
+    buffers.append(value)
+    return {_REF: len(buffers) - 1}
+
+
+def encode_frame(obj):
+    buffers = []
+    header = json.dumps(_pack(obj, buffers), separators=(",", ":"), default=_plain).encode()
+    parts = [_PREFIX.pack(MAGIC, len(header)), header, b"\0" * (-len(header) % 8)]
+    for values in buffers:
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        parts.append(_ARRAY.pack(values.typecode.encode(), len(values)))
+        parts.append(values.tobytes())
+    return b"".join(parts)
+
+
+def _unpack(value, lists):
+    if isinstance(value, dict):
+        if len(value) == 1 and _REF in value:
+            return lists[value[_REF]]
+        return {k: _unpack(v, lists) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(v, lists) for v in value]
+    return value
+
+
+def decode_frame(body):
+    """Envelope from a FRAME body. Arrays are read in place (memoryview.cast) and become lists in one C pass"""
+    view = memoryview(body)
+    try:
+        magic, length = _PREFIX.unpack_from(view)
+        if magic != MAGIC:
+            raise WireError("not an A2A frame")
+        header = json.loads(bytes(view[_PREFIX.size:_PREFIX.size + length]))
+        offset = _PREFIX.size + length + (-length % 8)
+        lists = []
+        while offset < len(view):
+            code, count = _ARRAY.unpack_from(view, offset)
+            offset += _ARRAY.size
+            end = offset + count * 8
+            if code not in (b'd', b'q') or end > len(view):
+                raise WireError("truncated or unknown array in frame")
+            if sys.byteorder == "big":
+                values = array(code.decode(), view[offset:end].tobytes())
+                values.byteswap()
+                lists.append(values.tolist())
+            else:
+                lists.append(view[offset:end].cast(code.decode()).tolist())
+            offset = end
+        return _unpack(header, lists)
+    except (struct.error, ValueError, IndexError, KeyError, TypeError) as e:
+        raise e if isinstance(e, WireError) else WireError(f"malformed frame: {e}")
+
+
+def element_count(body, content_type):
+    """Array elements in a body, for memory estimates, without decoding it"""
+    if content_type == FRAME:
+        try:
+            _, length = _PREFIX.unpack_from(body)
+            offset, count = _PREFIX.size + length + (-length % 8), body.count(b',', 0, _PREFIX.size + length) + 1
+            while offset + _ARRAY.size <= len(body):
+                items = _ARRAY.unpack_from(body, offset)[1]
+                count += items
+                offset += _ARRAY.size + items * 8
+            return count
+        except struct.error:
+            return len(body) // 8
+    if content_type == MSGPACK:
+        return len(body) // 9
+    return body.count(b',') + 1
+
+
+class Codec:
+    def __init__(self, content_type, encode, decode):
+        self.content_type = content_type
+        self.encode = encode
+        self.decode = decode
+
+
+CODECS = {
+    JSON: Codec(JSON, lambda obj: json.dumps(obj, separators=(",", ":"), default=_plain).encode(), json.loads),
+    FRAME: Codec(FRAME, encode_frame, decode_frame),
+}
+if msgpack is not None:
+    CODECS[MSGPACK] = Codec(MSGPACK, lambda obj: msgpack.packb(obj, default=_plain),
+                            lambda body: msgpack.unpackb(body, strict_map_key=False))
+BINARY = {t: c for t, c in CODECS.items() if t != JSON}
+
+
+def mimetype(response):
+    return (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+
+
+def decode_response(response):
+    """Body of an agent's response, whatever format it came back in"""
+    codec = BINARY.get(mimetype(response))
+    if codec is None:
+        return response.json()
+    try:
+        return codec.decode(response.content)
+    except (WireError, ValueError) as e:
+        raise ValueError(f"undecodable {codec.content_type} response: {e}")
+
+
+def formats_from_env():
+    names = [n.strip().lower() for n in os.getenv('WIRE_FORMATS', 'frame,msgpack,json').split(',') if n.strip()]
+    return [NAMES[n] for n in names if n in NAMES]
+
+
+class Negotiator:
+    """Client side: per peer, the format it last answered in. A new peer gets JSON with an Accept
+    header listing the formats this client prefers; a binary answer switches that peer over"""
+
+    def __init__(self, formats=(FRAME, MSGPACK, JSON)):
+        self.formats = [f for f in formats if f in CODECS and f != JSON] + [JSON]
+        self.accept = ", ".join(f"{f};q={1 - i / 10:.1f}" for i, f in enumerate(self.formats))
+        self._peers = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(formats_from_env())
+
+    def codec_for(self, destination):
+        return CODECS[self._peers.get(destination, JSON)]
+
+    def encode(self, destination, payload):
+        """(body, headers) for an envelope sent to destination"""
+        codec = self.codec_for(destination)
+        return codec.encode(payload), {"Content-Type": codec.content_type, "Accept": self.accept}
+
+    def observe(self, destination, response):
+        if response.status_code == 415:
+            # The peer no longer reads what we sent it
+            self._peers.pop(destination, None)
+            return
+        kind = mimetype(response)
+        if kind in self.formats:
+            self._peers[destination] = kind
+
+    def stats(self):
+        return {"formats": self.formats, "peers": dict(self._peers)}
+
+
+def install(app):
+    """Let an agent read binary request bodies through request.get_json() and answer jsonify() in the
+    format the request's Accept header prefers (JSON unless a binary format ranks higher)"""
+    from flask import Request, has_request_context, request
+    from flask.json.provider import DefaultJSONProvider
+    from werkzeug.exceptions import BadRequest
+
+    offered = [JSON] + list(BINARY)
+
+    class WireRequest(Request):
+        _wire_body = None
+
+        @property
+        def is_json(self):
+            return super().is_json or self.mimetype in BINARY
+
+        def get_json(self, force=False, silent=False, cache=True):
+            codec = BINARY.get(self.mimetype)
+            if codec is None:
+                return super().get_json(force=force, silent=silent, cache=cache)
+            if self._wire_body is not None:
+                return self._wire_body
+            try:
+                body = codec.decode(self.get_data(cache=cache))
+            except (WireError, ValueError) as e:
+                if silent:
+                    return None
+                raise BadRequest(f"Undecodable {self.mimetype} body: {e}")
+            if cache:
+                self._wire_body = body
+            return body
+
+    class WireJSONProvider(DefaultJSONProvider):
+        @staticmethod
+        def default(o):
+            if isinstance(o, (array, memoryview)):
+                return o.tolist()
+            return DefaultJSONProvider.default(o)
+
+        def response(self, *args, **kwargs):
+            kind = request.accept_mimetypes.best_match(offered, JSON) if has_request_context() else JSON
+            if kind == JSON:
+                return super().response(*args, **kwargs)
+            response = self._app.response_class(BINARY[kind].encode(self._prepare_response_obj(args, kwargs)),
+                                                mimetype=kind)
+            response.vary.add("Accept")
+            return response
+
+    app.request_class = WireRequest
+    app.json = WireJSONProvider(app)
+    return app